@@ -1,5 +1,10 @@
 from django.apps import AppConfig
 import logging
+import os
+import sys
+
+# Commands that load the app but must not connect to the broker as the hive
+_NO_SERVER_COMMANDS = ('run_jobs', 'export_transcripts', 'benchmark', 'bench_vendors')
 
 class HiveConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
@@ -10,6 +15,8 @@ class HiveConfig(AppConfig):
         from .mqtt.moxie_server import create_service_instance, get_instance
 
         log = logging.getLogger("hive")
+        if os.getenv('HIVE_NO_SERVER') or sys.argv[1:2] and sys.argv[1] in _NO_SERVER_COMMANDS:
+            return
         try:
             if get_instance() is None:
                 ep = settings.MQTT_ENDPOINT
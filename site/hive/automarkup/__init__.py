@@ -1,3 +1,4 @@
+import threading
 from typing import Tuple
 from typing import Dict
 
@@ -11,8 +12,20 @@ def main():
     return main_cli.main()
 
 
+_rules = None
+_rules_lock = threading.Lock()
+
+
 def initialize_rules():
-    return mlrules_utils.load_rules()
+    """
+    Rules with their voice tables compiled, loaded once per process from the on-disk cache and shared
+    read-only by every caller (forked workers share the parent's copy).
+    """
+    global _rules
+    with _rules_lock:
+        if _rules is None:
+            _rules = mlrules_utils.load_rules_cached()
+        return _rules
 
 
 def process(input_string, rules, mood_and_intensity: Tuple[str, float] = None, settings: Dict = None):
@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 """Takes the input string and marks it up with voice and gestural tags."""
 
-import logging
 import os
 import re
 import sys
@@ -10,8 +9,11 @@ import xml.etree.ElementTree as ET
 from unidecode import unidecode
 
 from .utils import bcolors
+from .utils import trace
 from .markup_core import markup_xmlassembly
 from .markup_core.tagspan import TagSpan
+from .markup_core.span_conflicts import resolve_span_conflicts
+from .markup_core.text_replacement import TextReplacements, load_text_replacements
 from .markup_types import markup_behavior
 from .markup_types import markup_mood
 from .markup_types import markup_voice
@@ -250,17 +252,8 @@ def get_internal_text_replacements() -> Dict[str, str]:
     if not os.path.exists(mlparams.TXT_REPLACE_FILE_PATH):
         data_path = mlparams.TXT_REPLACE_FILE_EXE_PATH
 
-    replacements: Dict[str, str] = {}
-    if not os.path.exists(data_path):
-        logging.error(f"Text replacement file cannot be found, empty replacement dictionary will be returned: "
-                      f"'{data_path}'")
-    else:
-        logging.info(f"Loading text replacement json: file://{data_path}")
-        with open(data_path, "r") as f:
-            replacements = json.loads(f.read())
-            logging.info(f"    Got {len(replacements.keys())} replacement keys")
-
-    return replacements
+    # Loaded and compiled once, and again only when the file changes
+    return load_text_replacements(data_path, PAD_CHARS)
 
 
 def markup_sentence(s: str,
@@ -276,42 +269,6 @@ def markup_sentence(s: str,
                     lastSentence : bool = False,
                     debug: bool = False):
     
-    def replace_string_with_pad(string: str, replace_key: str, replace_value: str) -> str:
-        """
-        Replace words with preceding and ensuing spaces to ensure the whole word is cleanly replaced.
-        """
-        if replace_key in string:
-            j = 0
-            string_len = len(string)  # This is expected to change during replacement, so we make it a variable
-            while j < string_len and (j + len(replace_key)) <= string_len:
-                text_end = j + len(replace_key)
-                line_substring = string[j: text_end]
-
-                pad_front = False
-                pad_after = False
-                if j == 0 and text_end < string_len:  # Beginning of text
-                    pad_after = True
-                elif j == (string_len - len(replace_key)):  # EOL
-                    pad_front = True
-                else:  # Middle of text
-                    pad_front = True
-                    pad_after = True
-
-                if line_substring == replace_key:
-                    do_it = True
-                    if pad_front and string[j - 1] not in PAD_CHARS:
-                        do_it = False
-                    if pad_after and string[text_end] not in PAD_CHARS:
-                        do_it = False
-
-                    if do_it:
-                        string = string[:j] + replace_value + string[text_end:]
-                        string_len = len(string)
-                        j += (len(replace_value) - len(replace_key))
-
-                j += 1
-        return string
-    
     def can_remove_this_tag(span):
         # do nothing if the flag is not set
         if not REMOVE_SINGLE_WORD_USEL_TAGS: return False
@@ -325,11 +282,10 @@ def markup_sentence(s: str,
     # Do text replacement
     # External replacement file
     if text_replacements is not None:
-        logging.info(f"Replacing text based on passed in dictionary ({len(text_replacements.keys())} keys): {s}")
-        for key in text_replacements.keys():
-            s = replace_string_with_pad(string=s, replace_key=key, replace_value=text_replacements[key])
-
-        logging.info(f"    Replacement result: {s}")
+        if not isinstance(text_replacements, TextReplacements):
+            text_replacements = TextReplacements(text_replacements, PAD_CHARS)
+        s = text_replacements.apply(s)
+        trace.record("markup.text_replacement", keys=len(text_replacements), text=s)
 
     colorizeXmlOutputForEasyDebug = True
     origS = re.sub(r'  ', ' ', s)
@@ -342,12 +298,14 @@ def markup_sentence(s: str,
     # Generate a nested list of rules-per-word
     rulesPerWordDict = {}
     if markVoice:
-        rulesPerWordDict = markup_voice.markup(words, origWords, rules, markVoiceSpecialMarkGenre=markVoiceSpecialMarkGenre, synthRate=synthRate, debug=debug)
+        with trace.stage("markup.voice", words=len(words)):
+            rulesPerWordDict = markup_voice.markup(words, origWords, rules, markVoiceSpecialMarkGenre=markVoiceSpecialMarkGenre, synthRate=synthRate, debug=debug)
 
     # Add behavior markups
     if markBehaviors:
         if debug: print("Adding behaviors markup")
-        behaviorRules = markup_behavior.markup(words, origWords)
+        with trace.stage("markup.behavior", words=len(words)):
+            behaviorRules = markup_behavior.markup(words, origWords)
         rulesPerWordDict[markup_behavior.TAG] = behaviorRules
 
     # Add playback-mood markups
@@ -356,7 +314,8 @@ def markup_sentence(s: str,
             if debug: print("{}Cannot add mood markup, invalid data – expecting json string or list with 2 values, got this instead: {}{}".format(bcolors.WARNING, markMoodAndIntensity, bcolors.ENDC))
         else:
             if debug: print("Adding mood markup")
-            moodRules = markup_mood.markup(words, mood=markMoodAndIntensity[0], intensity=markMoodAndIntensity[1])
+            with trace.stage("markup.mood", mood=markMoodAndIntensity[0], intensity=markMoodAndIntensity[1]):
+                moodRules = markup_mood.markup(words, mood=markMoodAndIntensity[0], intensity=markMoodAndIntensity[1])
             rulesPerWordDict[markup_mood.TAG] = moodRules
 
     if not lastSentence:
@@ -380,8 +339,7 @@ def markup_sentence(s: str,
             while i < len(words):
                 rule = rulesPerWordDict[tag][i]
                 if rule is not None:
-                    markupE = mlrules_utils.deserialize_element(rule)
-                    updatedWord = ET.tostring(markupE).decode("UTF-8") + markedWords[i]
+                    updatedWord = markup_xmlassembly.element_string(rule) + markedWords[i]
                     if debug: print("    word[{}] = {}".format(i, updatedWord))
                     markedWords[i] = updatedWord
                 i += 1
@@ -458,12 +416,12 @@ def markup_sentence(s: str,
     ###################################################################################
 
     # Check conflicting SCOPEs and remove those spans until none are left
-    spansPerTagCheck, conflictSomewhere, (worst_offender_conflict_count, worst_offender_tag, worst_offender_span_index) = check_span_conflicts(spansPerTag)
-    while worst_offender_tag != None:
-        if debug:
-            print("[{}] Removing worst offending tag: '{}': {}".format(worst_offender_conflict_count, worst_offender_tag, worst_offender_span_index))
-        spansPerTag = remove_worst_offending_span(spansPerTag, (worst_offender_conflict_count, worst_offender_tag, worst_offender_span_index))
-        spansPerTagCheck, conflictSomewhere, (worst_offender_conflict_count, worst_offender_tag, worst_offender_span_index) = check_span_conflicts(spansPerTag)
+    with trace.stage("markup.span_conflicts") as fields:
+        if fields is not None:
+            fields["spans"] = { tag: len(spans) for tag, spans in spansPerTag.items() }
+        spansPerTag = resolve_span_conflicts(spansPerTag)
+        if fields is not None:
+            fields["kept"] = { tag: len(spans) for tag, spans in spansPerTag.items() }
 
     # Sort and queue by scope range and start index
     tagsForInsertStagingList = [ ]
@@ -481,7 +439,8 @@ def markup_sentence(s: str,
     #####################
     # Assemble XML-tree #
     #####################
-    result = markup_xmlassembly.spans_to_xml(tagsForInsertStagingList, markedWords, debug_colors=colorizeXmlOutputForEasyDebug)
+    with trace.stage("markup.xml_assembly", words=len(markedWords), spans=len(tagsForInsertStagingList)):
+        result = markup_xmlassembly.spans_to_xml(tagsForInsertStagingList, markedWords, debug_colors=colorizeXmlOutputForEasyDebug)
 
     if prettyPrint:
         print("{}>>>>>>>>>>>>>>>>>>>> INPUT  <<<<<<<<<<<<<<<<<<<<<{}".format(bcolors.PURPLE, bcolors.ENDC))
@@ -594,11 +553,9 @@ def markup(s: str,
     s = handle_titles(s)
 
     # Internal replacement file
-    logging.info(f"Replacing text based on internal dictionary ({len(INTERNAL_REPLACE_STRINGS.keys())} keys): {s}")
     for key in INTERNAL_REPLACE_STRINGS.keys():
-        # s = replace_string_with_pad(string=s, replace_key=key, replace_value=INTERNAL_REPLACE_STRINGS[key])
         s = s.replace(key, INTERNAL_REPLACE_STRINGS[key])
-    logging.info(f"    Replacement result: {s}")
+    trace.record("markup.internal_replacement", keys=len(INTERNAL_REPLACE_STRINGS), text=s)
 
     if sys.version_info < (3, 0):
         s = unidecode(unicode(s, encoding="UTF-8"))
@@ -4,13 +4,12 @@ Sub-module to markup.py as the final step.
 """
 
 import collections
-import logging
+import functools
 import xml.etree.ElementTree as ET
 from typing import List, Union, Tuple
-import xml.dom.minidom
 
 from .tagspan import TagSpan
-from ..utils import bcolors
+from ..utils import trace
 from .. import markup
 from ..ml import mlparams
 from ..ml import mlrules_utils
@@ -18,7 +17,6 @@ from .._version import __package_version__
 
 def append_text(element, s, colorize=False):
     """Appends text to Element.text"""
-    logging.debug("append_text({})".format(s))
     if element.text is None:
         element.text = ""
     space_char_if_need = ' ' if len(element.text) > 0 else ''
@@ -33,7 +31,6 @@ def append_text(element, s, colorize=False):
 
 def append_tail(element, s, colorize=False):
     """Appends text to Element.tail"""
-    logging.debug("append_tail({})".format(s))
     if element.tail is None:
         element.tail = ""
 
@@ -47,22 +44,15 @@ def append_tail(element, s, colorize=False):
 
 def is_word_tagged(tag_index: int, tags_for_insert_staging: List[TagSpan], word_index: int) -> Tuple[bool, int]:
     """Returns (bool) if-word_has_tag, (int) out_tag-index-in-tagsForInsertStagingList"""
-    logging.debug("is_word_tagged(iTag={}, tagsForInsertStagingList={}, iWord={})".format(tag_index,
-                                                                                          len(tags_for_insert_staging),
-                                                                                          word_index))
     word_has_tag: bool = False
     out_tag: int = -1
     while tag_index < len(tags_for_insert_staging):
         span = tags_for_insert_staging[tag_index]
-        logging.debug(f"    {span.associated_str}, span_index={bcolors.OKGREEN}[{span.start_index}, {span.end_index}]{bcolors.ENDC}, size={bcolors.OKGREEN}{span.size}{bcolors.ENDC}")
         word_has_tag = word_index >= span.start_index and word_index <= span.end_index
         if word_has_tag:
             out_tag = tag_index
-            logging.debug("        {}BREAKING out? word_has_tag={}, out_tag={}{}".format(bcolors.FAIL, word_has_tag, out_tag, bcolors.ENDC))
             break
         tag_index += 1
-
-    logging.debug("        {}Returning word_has_tag={}, out_tag={}{}".format(bcolors.WARNING, word_has_tag, out_tag, bcolors.ENDC))
     return word_has_tag, out_tag
 
 
@@ -82,21 +72,18 @@ def spans_to_tree(tags_for_insert_staging: List[TagSpan], words: List[str], debu
     last_element_above_root: Union[ET.Element, None] = None
     word_had_a_tag = False
     inject_to_text_not_tail = False
+    tracing = trace.enabled()
     while word_index < len(words):
         word = words[word_index]
-        logging.debug("{}({}){}, {}{}{}".format(bcolors.OKGREEN, word_index, bcolors.ENDC, bcolors.FAINT, word, bcolors.ENDC))
 
         # Check if last element is done; remove from deque if so
         iTagCheck = len(tag_span_stack) - 1
         while iTagCheck > 0: # > 0 since we are not getting rid or root node
-            logging.debug("words[{}]={}, tag_span_stack[{}]=[{}, {}] {}({}){}".format(word_index, word, iTagCheck, tag_span_stack[iTagCheck].start_index, tag_span_stack[iTagCheck].end_index, bcolors.FAINT, tag_span_stack[iTagCheck].associated_str, bcolors.ENDC))
             if word_index > tag_span_stack[iTagCheck].end_index:
-                logging.debug("    Popping")
                 e = element_stack.pop()
                 t = tag_span_stack.pop()
                 inject_to_text_not_tail = False
                 last_element_above_root = e # Store for "tail"ing
-            logging.debug("    len(element_stack)={}".format(len(element_stack)))
             iTagCheck -= 1
 
         # Check word for tag scope
@@ -120,8 +107,6 @@ def spans_to_tree(tags_for_insert_staging: List[TagSpan], words: List[str], debu
             if word_has_tag:
                 current_tag = tag_index
 
-        if current_tag > len(tags_for_insert_staging):
-            logging.debug("{}current_tag/span={}{} ({})".format(bcolors.OKBLUE, current_tag, bcolors.ENDC, tags_for_insert_staging[current_tag].associated_str))
         # Add word to tag text or previous' tail
         if word_had_a_tag:
             last_e = element_stack[-1]
@@ -135,17 +120,16 @@ def spans_to_tree(tags_for_insert_staging: List[TagSpan], words: List[str], debu
             else:
                 append_tail(last_element_above_root, word, colorize=debug_colors)
 
-        # Pretty tree view
-        debug_xml = xml.dom.minidom.parseString(ET.tostring(root).decode("UTF-8"))
-        logging.debug(f'{bcolors.FAIL}XML-TREE{bcolors.ENDC}:\n{debug_xml.toprettyxml(indent="---|")}')
-
-        logging.debug("{}CURRENTLY{}: {}".format(bcolors.FAIL, bcolors.ENDC, ET.tostring(root).decode("UTF-8")))
+        # Tree so far
+        if tracing:
+            trace.record("xml.word", index=word_index, word=word, depth=len(element_stack) - 1,
+                         tree=ET.tostring(root).decode("UTF-8"))
         word_index += 1
     return root
 
 
-def spans_to_xml(tags_for_insert_staging: List[TagSpan], words: List[str], debug_colors: bool = False):
-    """Processes TagSpans into XML tree, and then returns an XML string"""
+def spans_to_xml_etree(tags_for_insert_staging: List[TagSpan], words: List[str], debug_colors: bool = False):
+    """Processes TagSpans into XML tree, and then returns an XML string (reference for spans_to_xml)"""
     root = spans_to_tree(tags_for_insert_staging, words, debug_colors=debug_colors)
 
     # Clean result string
@@ -154,3 +138,129 @@ def spans_to_xml(tags_for_insert_staging: List[TagSpan], words: List[str], debug
     result = result.replace("&gt;", ">").replace("&lt;", "<")
     result = result.replace(" {}".format(mlparams.CHAR_EOL), "").replace(mlparams.CHAR_EOL, "")
     return result
+
+
+@functools.lru_cache(maxsize=4096)
+def element_string(associated_str: str) -> str:
+    """
+    The rule as an empty XML element, exactly as ET.tostring writes it: <tag attr="value" />
+    """
+    return ET.tostring(mlrules_utils.deserialize_element(associated_str)).decode("UTF-8")
+
+
+def _escape_text(text: str) -> str:
+    """Escapes element text and tails as ElementTree does"""
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
+
+class _Node:
+    """Element of the markup being assembled, just what serializing it needs"""
+    __slots__ = ("tag", "start", "text", "tail", "children")
+
+    def __init__(self, tag: str, start: str):
+        self.tag = tag
+        self.start = start
+        self.text = None
+        self.tail = None
+        self.children = []
+
+    def write(self, out: List[str]):
+        if self.text or self.children:
+            out.append(self.start)
+            out.append(">")
+            if self.text:
+                out.append(_escape_text(self.text))
+            for child in self.children:
+                child.write(out)
+            out.append("</{}>".format(self.tag))
+        else:
+            out.append(self.start)
+            out.append(" />")
+        if self.tail:
+            out.append(_escape_text(self.tail))
+
+
+@functools.lru_cache(maxsize=4096)
+def _start_tag(associated_str: str) -> Tuple[str, str]:
+    """(tag, start tag without its closing bracket) for a rule"""
+    start = element_string(associated_str)[:-len(" />")]
+    return start[1:].split(" ", 1)[0], start
+
+
+def spans_to_xml(tags_for_insert_staging: List[TagSpan], words: List[str], debug_colors: bool = False):
+    """
+    Processes TagSpans into an XML string.  Walks the words once, nesting and filling elements exactly as
+    spans_to_tree() does, but with plain nodes whose start tags are made once per rule, then writes the
+    string directly.  Output is byte-identical to spans_to_xml_etree().
+    """
+    spans = tags_for_insert_staging
+    root = _Node("root", "<root")
+    root.text = "<{} version=\"{}\"/>".format(markup.AUTO_GEN_ATTRIB_NAME, __package_version__)
+    node_stack = [ root ]
+    end_stack = [ len(words) ]
+
+    def tagged(tag_index: int, word_index: int) -> int:
+        # first span from tag_index holding the word; spans are sorted by start, so none after a later start can
+        while tag_index < len(spans):
+            span = spans[tag_index]
+            if span.start_index > word_index:
+                return -1
+            if word_index <= span.end_index:
+                return tag_index
+            tag_index += 1
+        return -1
+
+    current_tag = 0
+    last_popped = None
+    for word_index, word in enumerate(words):
+        # Close finished elements; like spans_to_tree, each finished one found pops the innermost
+        i = len(end_stack) - 1
+        while i > 0:
+            if word_index > end_stack[i]:
+                last_popped = node_stack.pop()
+                end_stack.pop()
+            i -= 1
+
+        tag_index = tagged(current_tag, word_index)
+        word_had_a_tag = tag_index >= 0
+        if word_had_a_tag:
+            current_tag = tag_index
+        check_index = current_tag
+        while tag_index >= 0:
+            span = spans[tag_index]
+            if span.start_index == word_index:
+                node = _Node(*_start_tag(span.associated_str))
+                node_stack[-1].children.append(node)
+                node_stack.append(node)
+                end_stack.append(span.end_index)
+            check_index += 1
+            tag_index = tagged(check_index, word_index)
+            if tag_index >= 0:
+                current_tag = tag_index
+
+        # Add word to tag text or previous' tail
+        if word_had_a_tag:
+            last = node_stack[-1]
+            if last.tag in mlparams.UNSCOPED_TAGS:
+                last.tail = "{} {}".format(last.tail or "", word)
+            else:
+                last.text = "{}{}{}".format(last.text or "", " " if last.text else "", word)
+        elif last_popped is None:
+            root.text = "{}{}{}".format(root.text, " " if root.text else "", word)
+        else:
+            last_popped.tail = "{} {}".format(last_popped.tail or "", word)
+
+    out = [ _escape_text(root.text) ]
+    for child in root.children:
+        child.write(out)
+    # ET.tostring writes us-ascii, anything else as character references
+    result = "".join(out).encode("ascii", "xmlcharrefreplace").decode("ascii")
+    result = result.replace("&gt;", ">").replace("&lt;", "<")
+    result = result.replace(" {}".format(mlparams.CHAR_EOL), "").replace(mlparams.CHAR_EOL, "")
+    return result
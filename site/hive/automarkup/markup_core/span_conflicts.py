@@ -0,0 +1,85 @@
+"""Resolves badly nested spans across tags, removing the worst offender until none conflict."""
+
+import bisect
+import heapq
+from typing import Dict, List
+
+from .tagspan import TagSpan
+
+
+def crossing_pairs(spans: List[TagSpan]) -> List[tuple]:
+    """
+    Index pairs (i, j) of spans that conflict per TagSpan.conflicts: they overlap with neither containing
+    the other, and neither is a 1-word span.  Found with one sweep over the spans sorted by start, looking
+    only at spans starting inside each one.
+    """
+    order = sorted(range(len(spans)), key=lambda i: spans[i].start_index)
+    starts = [ spans[i].start_index for i in order ]
+    pairs = []
+    for a in order:
+        span = spans[a]
+        if span.size == 1:
+            continue
+        lo = bisect.bisect_right(starts, span.start_index)
+        hi = bisect.bisect_right(starts, span.end_index)
+        for b in order[lo:hi]:
+            other = spans[b]
+            if other.size != 1 and other.end_index > span.end_index:
+                pairs.append((a, b))
+    return pairs
+
+
+def resolve_span_conflicts(spans_per_tag: Dict[str, List[TagSpan]]) -> Dict[str, List[TagSpan]]:
+    """
+    Same result as calling check_span_conflicts() and remove_worst_offending_span() until no conflict is
+    left, with conflicts found once and counts updated as spans go instead of rechecking every pair of
+    spans per removal.  Lists in spans_per_tag are pruned in place.
+    """
+    tags = list(spans_per_tag.keys())
+    spans, tag_of = [], []
+    for r, tag in enumerate(tags):
+        spans.extend(spans_per_tag[tag])
+        tag_of.extend([ r ] * len(spans_per_tag[tag]))
+    same, other = [ [] for _ in spans ], [ [] for _ in spans ]
+    for a, b in crossing_pairs(spans):
+        (same if tag_of[a] == tag_of[b] else other)[a].append(b)
+        (same if tag_of[a] == tag_of[b] else other)[b].append(a)
+
+    # Each tag first drops its own spans that conflict with one still in it, last to first
+    alive = [ True ] * len(spans)
+    for i in reversed(range(len(spans))):
+        if any(alive[j] for j in same[i]):
+            alive[i] = False
+
+    # The first check counts each tag against the later tags before they drop their own conflicts
+    worst, worst_count = None, 0
+    for i in range(len(spans)):
+        if alive[i]:
+            count = sum(1 for j in other[i] if tag_of[j] > tag_of[i] or alive[j])
+            if count > worst_count:
+                worst, worst_count = i, count
+    if worst is None:
+        return _prune(spans_per_tag, tags, spans, tag_of, alive)
+    alive[worst] = False
+
+    # From then on, the span in most conflicts goes, ties to the first tag and span, as the check orders them
+    counts = [ sum(1 for j in other[i] if alive[j]) for i in range(len(spans)) ]
+    heap = [ (-counts[i], i) for i in range(len(spans)) if alive[i] and counts[i] ]
+    heapq.heapify(heap)
+    while heap:
+        negative, i = heapq.heappop(heap)
+        if not alive[i] or -negative != counts[i]:
+            continue
+        alive[i] = False
+        for j in other[i]:
+            if alive[j]:
+                counts[j] -= 1
+                if counts[j]:
+                    heapq.heappush(heap, (-counts[j], j))
+    return _prune(spans_per_tag, tags, spans, tag_of, alive)
+
+
+def _prune(spans_per_tag, tags, spans, tag_of, alive):
+    for r, tag in enumerate(tags):
+        spans_per_tag[tag][:] = [ span for span, t, keep in zip(spans, tag_of, alive) if t == r and keep ]
+    return spans_per_tag
@@ -0,0 +1,62 @@
+"""Whole-word text replacement, compiled once into a single regex pass."""
+
+import json
+import logging
+import os
+import re
+import threading
+from typing import Dict
+
+
+class TextReplacements(dict):
+    """
+    Replacement dictionary (key -> value) that also holds one compiled pattern for all of its keys.
+
+    A key is only replaced where it stands alone: at the start of the string or after a pad char, and at
+    the end or before one.  Longer keys are tried first, so "lolz" wins over "lol".  Treat instances as
+    read-only, the pattern isn't rebuilt if the dictionary changes.
+    """
+
+    def __init__(self, replacements: Dict[str, str], pad_chars: str):
+        super().__init__(replacements)
+        keys = sorted((k for k in self.keys() if k), key=len, reverse=True)
+        pad = re.escape(pad_chars)
+        self._pattern = re.compile(f"(?<![^{pad}])(?:{'|'.join(re.escape(k) for k in keys)})(?![^{pad}])") if keys else None
+
+    def apply(self, string: str) -> str:
+        if self._pattern is None:
+            return string
+        return self._pattern.sub(self._replace, string)
+
+    def _replace(self, match: re.Match) -> str:
+        return self[match.group(0)]
+
+
+_cache_lock = threading.Lock()
+_cache: Dict[str, tuple] = {}
+
+
+def load_text_replacements(path: str, pad_chars: str) -> TextReplacements:
+    """
+    Load a replacement json file, reusing the compiled result until the file's modification time changes.
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = None
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    if mtime is None:
+        logging.error(f"Text replacement file cannot be found, empty replacement dictionary will be returned: "
+                      f"'{path}'")
+        replacements = TextReplacements({}, pad_chars)
+    else:
+        logging.debug(f"Loading text replacement json: file://{path}")
+        with open(path, "r") as f:
+            replacements = TextReplacements(json.loads(f.read()), pad_chars)
+        logging.debug(f"    Got {len(replacements.keys())} replacement keys")
+    with _cache_lock:
+        _cache[path] = (mtime, replacements)
+    return replacements
@@ -9,12 +9,12 @@ Sub-module to markup.py.
 """
 
 import json
-import logging
 import random
 from string import punctuation
 from typing import List, Dict
 
 from ..utils import bcolors
+from ..utils import trace
 from .. import markup as m
 from ..ml import mlparams
 from .._version import __package_version__
@@ -54,17 +54,30 @@ WORDS_HIGH = ["up", "above", "higher", "high", "wow", "great", "fantastic", "won
 def gesture_change_word_count():
     return random.randint(GESTURE_CHANGE_WORDS_MIN, GESTURE_CHANGE_WORDS_MAX)
 
+def _behavior_rule(behavior_name: str) -> str:
+    command = 'cmd:behaviour-tree,data:{+transition+:0.5,+duration+:1.0,+repeat+:1,+layerBlendInTime+:0.5,+layerBlendOutTime+:0.5,+blocking+:false,+action+:4,+variableName+:++,+variableValue+:++,+eventName+:+' + behavior_name + '+,+lifetime+:0,+category+:+None+,+behaviour+:++,+Track+:++}'
+    return json.dumps({TAG: {"name": command}})
+
+# Serialized rule for every gesture, built once and shared read-only by all markup threads
+BEHAVIOR_RULES: Dict[str, str] = {
+    name: _behavior_rule(name) for name in [
+        GESTURE_NONE, GESTURE_TALK, GESTURE_QSTN, GESTURE_SELF, GESTURE_YOU, GESTURE_US,
+        GESTURE_HIGH, GESTURE_LOW, GESTURE_BIG, GESTURE_SMALL, GESTURE_DIRECTION
+    ]
+}
+
+def behavior_rule(behavior_name: str) -> str:
+    rule = BEHAVIOR_RULES.get(behavior_name)
+    return rule if rule is not None else _behavior_rule(behavior_name)
+
 class MarkupBehavior:
     behavior_name: str = ""
-    b_dict: Dict[str, Dict[str, str]] = {}
 
     def __init__(self, behavior_name: str):
         self.behavior_name = behavior_name
-        self.b_dict[TAG] = {}
-        self.b_dict[TAG]["name"] = 'cmd:behaviour-tree,data:{+transition+:0.5,+duration+:1.0,+repeat+:1,+layerBlendInTime+:0.5,+layerBlendOutTime+:0.5,+blocking+:false,+action+:4,+variableName+:++,+variableValue+:++,+eventName+:+' + self.behavior_name + '+,+lifetime+:0,+category+:+None+,+behaviour+:++,+Track+:++}'
 
     def json(self):
-        return json.dumps(self.b_dict)
+        return behavior_rule(self.behavior_name)
 
 
 def CanMarkupFit(markedIndices, index, minDistance, hasPunctuation: bool = False):
@@ -79,9 +92,7 @@ def CanMarkupFit(markedIndices, index, minDistance, hasPunctuation: bool = False
         lowerIndexOffset = lowerIndex if hasPunctuation else (lowerIndex + minDistance)
         upperIndexOffset = upperIndex if hasPunctuation else (upperIndex - minDistance)
 
-        logging.debug("{} <= {} ? {}".format(lowerIndexOffset,upperIndexOffset,(lowerIndexOffset <= upperIndexOffset)))
         if lowerIndexOffset <= upperIndexOffset:
-            logging.debug("{} > {} AND {} < {} ? {}".format(index,lowerIndexOffset,index,upperIndexOffset,(index > lowerIndexOffset and index < upperIndexOffset)))
             if index > lowerIndexOffset and index < upperIndexOffset:
                 return True
         i += 1
@@ -89,7 +100,7 @@ def CanMarkupFit(markedIndices, index, minDistance, hasPunctuation: bool = False
     return False
 
 def get_behaviors_from_str(words: List[str], orig_words: List[str], outRules: List[MarkupBehavior]):
-    logging.debug("Adding behavior markup using default method")
+    tracing = trace.enabled()
 
     # Bool-dict per word to see which words might have gestures correlating with them
     b_dict: Dict[str, List[bool]] = {}
@@ -102,7 +113,6 @@ def get_behaviors_from_str(words: List[str], orig_words: List[str], outRules: Li
     b_dict[GESTURE_NONE] = []
     lastGestureIndex = 0
     gestureChangeWordCount = gesture_change_word_count()
-    logging.debug("Will change words at {} words".format(gestureChangeWordCount))
     multiSentence = False
     i = 0
     while i < len(words) - 1:
@@ -126,7 +136,6 @@ def get_behaviors_from_str(words: List[str], orig_words: List[str], outRules: Li
         if (i - lastGestureIndex) >= gestureChangeWordCount:
             doTalkGesture = True
             gestureChangeWordCount = gesture_change_word_count()
-            logging.debug("Next word will be {} words later (at index {})".format(gestureChangeWordCount, i + gestureChangeWordCount))
             lastGestureIndex = i
         b_dict[GESTURE_TALK].append(doTalkGesture)
 
@@ -141,37 +150,10 @@ def get_behaviors_from_str(words: List[str], orig_words: List[str], outRules: Li
     b_dict[GESTURE_TALK].append(False)
     b_dict[GESTURE_NONE].append(True)
 
-    # Debugging
-    # if getattr(logging):
-    msgW = "{:30}".format("word")
-    msgQ = "{:30}".format(GESTURE_QSTN)
-    msgS = "{:30}".format(GESTURE_SELF)
-    msgY = "{:30}".format(GESTURE_YOU)
-    msgH = "{:30}".format(GESTURE_HIGH)
-    msgTP = "{:30}".format(GESTURE_TALK_PRIORITY)
-    msgT = "{:30}".format(GESTURE_TALK)
-    msgN = "{:30}".format(GESTURE_NONE)
-    i = 0
-    while i < len(words):
-        word = words[i]
-        msgW = "{}{:<15}".format(msgW, word)
-        msgQ = "{}{:<15}".format(msgQ, b_dict[GESTURE_QSTN][i] if b_dict[GESTURE_QSTN][i] else "")
-        msgS = "{}{:<15}".format(msgS, b_dict[GESTURE_SELF][i] if b_dict[GESTURE_SELF][i] else "")
-        msgY = "{}{:<15}".format(msgY, b_dict[GESTURE_YOU][i] if b_dict[GESTURE_YOU][i] else "")
-        msgH = "{}{:<15}".format(msgH, b_dict[GESTURE_HIGH][i] if b_dict[GESTURE_HIGH][i] else "")
-        msgTP = "{}{:<15}".format(msgTP, b_dict[GESTURE_TALK_PRIORITY][i] if b_dict[GESTURE_TALK_PRIORITY][i] else "")
-        msgT = "{}{:<15}".format(msgT, b_dict[GESTURE_TALK][i] if b_dict[GESTURE_TALK][i] else "")
-        msgN = "{}{:<15}".format(msgN, b_dict[GESTURE_NONE][i] if b_dict[GESTURE_NONE][i] else "")
-        i += 1
-
-    logging.debug(msgW)
-    logging.debug(msgQ)
-    logging.debug(msgS)
-    logging.debug(msgY)
-    logging.debug(msgH)
-    logging.debug(msgTP)
-    logging.debug(msgT)
-    logging.debug(msgN)
+    # Word indices that could take each gesture
+    if tracing:
+        trace.record("behavior.candidates", words=len(words),
+                     **{ tag: [ i for i, on in enumerate(b_dict[tag]) if on ] for tag in b_dict })
 
     # Assemble rules
     indicesMarked = [ 0, len(words) - 1 ] # first and last always marked
@@ -185,13 +167,13 @@ def get_behaviors_from_str(words: List[str], orig_words: List[str], outRules: Li
         while i < len(words) - 1:
             if b_dict[tag][i]:
                 hasPunctuation = any(p in orig_words[i-1] or (i+1<len(orig_words) and p in orig_words[i+1]) for p in punctuation)
-                logging.debug("Checking fit for {}".format(tag))
-                if CanMarkupFit(indicesMarked, i, GESTURE_CHANGE_WORDS_MIN, hasPunctuation):
+                fits = CanMarkupFit(indicesMarked, i, GESTURE_CHANGE_WORDS_MIN, hasPunctuation)
+                if tracing:
+                    trace.record("behavior.fit", gesture=tag, index=i, punctuation=hasPunctuation, fits=fits)
+                if fits:
                     indicesMarked.append(i)
 
-                    behaviorMarkup = MarkupBehavior(thisTag)
-                    outRule = behaviorMarkup.json()
-                    outRules[i] = outRule
+                    outRules[i] = BEHAVIOR_RULES[thisTag]
 
             i += 1
 
@@ -222,9 +204,9 @@ def get_behaviors_from_str(words: List[str], orig_words: List[str], outRules: Li
     outRulesShifted[lastRule] = outRules[lastRule]
     # End shift
 
-    logging.debug("Behavior markup rules")
-    for r in outRulesShifted:
-        logging.debug("    {}".format(r))
+    if tracing:
+        names = { rule: name for name, rule in BEHAVIOR_RULES.items() }
+        trace.record("behavior.rules", rules={ i: names.get(r, r) for i, r in enumerate(outRulesShifted) if r })
 
     return outRulesShifted
 
@@ -244,7 +226,7 @@ def markup(words: List[str], orig_words: List[str]):
     outRules = []
     for w in words:
         outRules.append(None)
-    outRules[0] = MarkupBehavior(GESTURE_TALK).json()
-    outRules[-1] = MarkupBehavior(GESTURE_NONE).json()
+    outRules[0] = BEHAVIOR_RULES[GESTURE_TALK]
+    outRules[-1] = BEHAVIOR_RULES[GESTURE_NONE]
 
     return get_behaviors_from_str(words, orig_words, outRules)
@@ -74,19 +74,33 @@ MOOD_MAP = {
     "surprise":     {"type": MOOD_SURPRISED, "steps": [ 0, 0.333, 0.666 ]}
 }
 
+def _mood_rule(mood: str, intensity: int) -> str:
+    command = 'cmd:playback-mood,data:{+mood+:' + mood + ',+intensity+:' + str(intensity) + '}'
+    return json.dumps({mlparams.ALIAS_TAG_MARK_MOOD: {"name": command}})
+
+# Serialized rule for every mood and intensity, built once and shared read-only by all markup threads
+MOOD_RULES: Dict[tuple, str] = {
+    (mood, intensity): _mood_rule(mood, intensity)
+    for mood in [ MOOD_NEUTRAL, MOOD_HAPPY, MOOD_SAD, MOOD_ANGRY, MOOD_SHY, MOOD_SURPRISED, MOOD_AFRAID,
+                  MOOD_CONCERNED, MOOD_CONFUSED, MOOD_CURIOUS, MOOD_EMBARRASSED ]
+    for intensity in range(mlparams.MOOD_INTENSITY_MAX + 1)
+}
+
+def mood_rule(mood: str, intensity: int) -> str:
+    intensity = min(intensity, mlparams.MOOD_INTENSITY_MAX)
+    rule = MOOD_RULES.get((mood, intensity))
+    return rule if rule is not None else _mood_rule(mood, intensity)
+
 class MarkupMood:
     mood: str = ""
     intensity: int = 0
-    b_dict: Dict[str, Dict[str, str]] = {}
 
     def __init__(self, mood, intensity):
         self.mood = mood
         self.intensity = min(intensity, mlparams.MOOD_INTENSITY_MAX)
-        self.b_dict[mlparams.ALIAS_TAG_MARK_MOOD] = {}
-        self.b_dict[mlparams.ALIAS_TAG_MARK_MOOD]["name"] = 'cmd:playback-mood,data:{+mood+:' + self.mood + ',+intensity+:' + str(self.intensity) + '}'
 
     def json(self):
-        return json.dumps(self.b_dict)
+        return mood_rule(self.mood, self.intensity)
 
 def get_intensity_level(intensity: float, steps: List[float]):
     # we expect normalized intensity in [0,1] range
@@ -131,9 +145,9 @@ def markup(words: List[str], mood: str = None, intensity: float = 0) -> List[Uni
         out_rules.append(None)
 
     emotion = get_emotion(mood, intensity)
-    out_rules[0] = MarkupMood(*emotion).json()
+    out_rules[0] = mood_rule(*emotion)
     
     # always end with neutral
-    out_rules[-1] = MarkupMood(MOOD_NEUTRAL, 0).json()
+    out_rules[-1] = MOOD_RULES[(MOOD_NEUTRAL, 0)]
 
     return out_rules
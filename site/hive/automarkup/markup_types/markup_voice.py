@@ -3,7 +3,6 @@
 Sub-module to markup.py.
 """
 
-import logging
 import random
 import xml.etree.ElementTree as ET
 from typing import List
@@ -26,6 +25,80 @@ def vocal_variant(genre: str, variant: int = 0, specialMark: bool = False) -> st
 
 
 
+# Kinds of compiled tag tables: rules used as they are, and usel rules whose variant is decided per word
+PLAIN = 0
+USEL = 1
+
+_compiled = (None, None)
+
+
+def _with_variant(rule: str, variant: str) -> str:
+    e = mlrules_utils.deserialize_element(rule)
+    e.attrib["variant"] = variant
+    return mlrules_utils.serialize_element(e)
+
+
+def _usel_entry(rule: str):
+    """
+    (rule, genre, variant, clamped, variants) for a usel rule, where variants holds the rule serialized for
+    every variant a word can end up with (0 to CLAMP_MAX_USEL_VARIANT, or its own).
+    """
+    e = mlrules_utils.deserialize_element(rule)
+    variant = e.attrib["variant"]
+    clamped = int(variant) > CLAMP_MAX_USEL_VARIANT
+    variants = { v: _with_variant(rule, v) for v in [ str(n) for n in range(CLAMP_MAX_USEL_VARIANT + 1) ] + [ variant ] }
+    return (rule, e.attrib["genre"], variant, clamped, variants)
+
+
+def _prosody_rule(rule: str) -> str:
+    # clamp very-fast/slow speeds and any volume
+    e = mlrules_utils.deserialize_element(rule)
+    if e.attrib["rate"] == "x-slow":
+        e.attrib["rate"] = "slow"
+        rule = mlrules_utils.serialize_element(e)
+    if e.attrib["volume"] != "medium":
+        e.attrib["volume"] = "medium"
+        rule = mlrules_utils.serialize_element(e)
+    return rule
+
+
+def compile_rules(rules: dict) -> list:
+    """
+    Compile loaded rules into [(tag, kind, {word: entry})], with every rule that doesn't depend on the
+    sentence resolved ahead of time, so marking up a word is a dict lookup.  The last rules compiled are
+    kept and reused while the same rules object is passed in.
+    """
+    global _compiled
+    cached_rules, table = _compiled
+    if cached_rules is rules:
+        return table
+
+    uselTag = mlrules_utils.clean_dict_key_str(mlparams.TAG_USEL)
+    prosodyTag = mlrules_utils.clean_dict_key_str(mlparams.TAG_PROSODY)
+    table = []
+    for tag in rules.keys():
+        if tag in mlparams.IGNORE_TAGS_LIST:
+            continue
+        # TODO: Mechanism to CHOOSE a rule. For now default to the first one
+        firstRules = { w: wordRules[0].associated_str for w, wordRules in rules[tag].items() }
+        if tag == uselTag:
+            table.append((tag, USEL, { w: _usel_entry(r) for w, r in firstRules.items() }))
+        elif tag == prosodyTag:
+            table.append((tag, PLAIN, { w: _prosody_rule(r) for w, r in firstRules.items() }))
+        else:
+            table.append((tag, PLAIN, firstRules))
+    _compiled = (rules, table)
+    return table
+
+
+def use_compiled_rules(rules: dict, table: list):
+    """
+    Use an already compiled table (from the rules cache) for this rules object.
+    """
+    global _compiled
+    _compiled = (rules, table)
+
+
 def markup(words: List[str], orig_words: List[str], rules: dict, markVoiceSpecialMarkGenre: bool = True, 
            synthRate: float = mlparams.SYNTH_RATE_DEFAULT, debug=False):
     """
@@ -43,64 +116,29 @@ def markup(words: List[str], orig_words: List[str], rules: dict, markVoiceSpecia
                   else  {"sig": [sigTag]*(len(words)-1) + [None] }
 
     rulesPerWordDict = markup_synth_rate(synthRate=synthRate, words=words)
-    for tag in rules.keys():
-        if tag in mlparams.IGNORE_TAGS_LIST:
-            logging.debug("Skipping tag '{}' since it is marked in the IGNORE list".format(tag))
+    for tag, kind, tagRules in compile_rules(rules):
+        if kind == PLAIN:
+            rulesPerWordDict[tag] = [ tagRules.get(w) for w in words ]
             continue
-        tagRules = rules[tag]
-        tagRulesApplied = []
-
-        isUselTag = tag == mlrules_utils.clean_dict_key_str(mlparams.TAG_USEL)
-        isProsodyTag = tag == mlrules_utils.clean_dict_key_str(mlparams.TAG_PROSODY)
-        if debug:
-            if isUselTag: print("{}Check usel variants and clamping{}".format(bcolors.PURPLE, bcolors.ENDC))
-            if isProsodyTag: print("{}Check prosody rates and clamping{}".format(bcolors.PURPLE, bcolors.ENDC))
 
-        lastUselRule = None
+        if debug: print("{}Check usel variants and clamping{}".format(bcolors.PURPLE, bcolors.ENDC))
+        # This is where some higher-level rules are applied, based on observed style
+        tagRulesApplied = []
+        lastGenre = lastVariant = None
         for w in words:
-            wordRule = None
-            if w in tagRules.keys():
-                # TODO: Mechanism to CHOOSE a rule. For now default to the first one
-                wordRule = tagRules[w][0].associated_str
-
-                # This is where some higher-level rules are applied, based on observed style
-                # Check usel variants and clamping
-                if isUselTag:
-                    e = mlrules_utils.deserialize_element(wordRule)
-                    varAttrib = int(e.attrib["variant"])
-                    logging.debug("    word={}, tag={}, variant={}".format(w, mlrules_utils.clean_dict_key_str(mlparams.TAG_USEL), varAttrib))
-                    if varAttrib > CLAMP_MAX_USEL_VARIANT:
-                        newVarAttrib = random.randint(0, CLAMP_MAX_USEL_VARIANT)
-                        e.attrib["variant"] = str(newVarAttrib)
-                        logging.debug("        Variant ({}) larger than max-constrained-value per this script of {}. Variant now set to {}".format(varAttrib, CLAMP_MAX_USEL_VARIANT, newVarAttrib))
-                        wordRule = mlrules_utils.serialize_element(e)
-
-                    if lastUselRule is not None and lastUselRule["genre"] == e.attrib["genre"]:
-                        e.attrib["variant"] = lastUselRule["variant"]
-                        logging.debug("        Modifying usel variant to match last word's rule ({}), to reduce choppiness ".format(e.attrib["variant"]))
-                        wordRule = mlrules_utils.serialize_element(e)
-
-                    lastUselRule = e.attrib
-                else:
-                    lastUselRule = None
-                
-                # Check prosody playback speed, clamp very-fast/slow speeds
-                if isProsodyTag:
-                    e = mlrules_utils.deserialize_element(wordRule)
-                    rateAttrib = e.attrib["rate"]
-                    volAttrib = e.attrib["volume"]
-                    logging.debug("    word={}, tag={}, rate={}, volume={}".format(w, mlrules_utils.clean_dict_key_str(mlparams.TAG_PROSODY), rateAttrib, volAttrib))
-
-                    if rateAttrib == "x-slow":
-                        e.attrib["rate"] = "slow"
-                        wordRule = mlrules_utils.serialize_element(e)
-                        logging.debug("        Rate is 'x-slow', clamping to 'slow'")
-
-                    if volAttrib != "medium":
-                        e.attrib["volume"] = "medium"
-                        wordRule = mlrules_utils.serialize_element(e)
-                        logging.debug("        Rate is '{}', clamping to 'slow'".format(volAttrib))
-
+            entry = tagRules.get(w)
+            if entry is None:
+                tagRulesApplied.append(None)
+                continue
+            wordRule, genre, variant, clamped, variants = entry
+            if clamped:
+                variant = str(random.randint(0, CLAMP_MAX_USEL_VARIANT))
+                wordRule = variants[variant]
+            # match the last word's variant when the genre continues, to reduce choppiness
+            if lastGenre == genre:
+                variant = lastVariant
+                wordRule = variants.get(variant) or _with_variant(wordRule, variant)
+            lastGenre, lastVariant = genre, variant
             tagRulesApplied.append(wordRule)
         rulesPerWordDict[tag] = tagRulesApplied
     
@@ -13,6 +13,13 @@ ML_DATA_PATH = str(pathlib.Path(_FILE_DIR, os.path.join(DATA_PATH, "_mlprocessed
 ML_DATA_EXE_PATH = str(pathlib.Path(_FILE_DIR, os.path.join(EXE_DATA_PATH, "_mlprocesseddata.txt")).resolve())
 TXT_REPLACE_FILE_PATH = str(pathlib.Path(_FILE_DIR, os.path.join(DATA_PATH, "text_replacement.json")).resolve())
 TXT_REPLACE_FILE_EXE_PATH = str(pathlib.Path(_FILE_DIR, os.path.join(EXE_DATA_PATH, "text_replacement.json")).resolve())
+# Compiled rules cache, one file per rules data hash (see mlrules_utils.load_rules_cached).  Per user, since
+# the cache is unmarshalled on load: it is only used if the directory is the user's own and no one else can write it.
+RULES_CACHE_DIR = os.getenv("AUTOMARKUP_CACHE_DIR",
+                            os.path.join(os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+                                         "openmoxie-automarkup"))
+# Per-stage trace records on the "automarkup.trace" logger (see utils/trace.py), off unless set
+TRACE = os.getenv("AUTOMARKUP_TRACE", "false").lower() == "true"
 
 # Overall knobs
 RESTRICT_TO_DISTINCT_TAG = True # Default False; True = ONLY look at all of the same tags (ie. Only look at all vocalVariant usage, ignoring any non-marked/otherwise-marked words)
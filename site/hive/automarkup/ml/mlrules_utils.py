@@ -1,8 +1,12 @@
 """Utility class to mlrules.py for data serialization."""
 
+import hashlib
 import json
+import logging
+import marshal
 import os
 import re
+import stat
 import sys
 import xml.etree.ElementTree as ET
 from typing import Dict, List
@@ -11,15 +15,15 @@ from . import mlassociation
 from . import mlparams
 
 
-def load_rules() -> Dict[str, Dict[str, List[mlassociation.Rule]]]:
+def _rules_data_path() -> str:
     data_path = mlparams.ML_DATA_PATH
     if not os.path.exists(mlparams.ML_DATA_PATH):
         data_path = mlparams.ML_DATA_EXE_PATH
+    return data_path
 
-    f = open(data_path, "r")
-    rules = json.loads(f.read())
-    f.close()
 
+def _rules_from_json(text) -> Dict[str, Dict[str, List[mlassociation.Rule]]]:
+    rules = json.loads(text)
     for key in rules.keys():
         for ikey in rules[key].keys():
             json_list = rules[key][ikey]
@@ -29,6 +33,83 @@ def load_rules() -> Dict[str, Dict[str, List[mlassociation.Rule]]]:
     return rules
 
 
+def load_rules() -> Dict[str, Dict[str, List[mlassociation.Rule]]]:
+    with open(_rules_data_path(), "r") as f:
+        return _rules_from_json(f.read())
+
+
+# Bump when the cached layout or the compiled voice tables change
+RULES_CACHE_VERSION = 1
+
+
+def _private(st: os.stat_result) -> bool:
+    """True if a cache file or directory belongs to this user and no one else can write to it"""
+    owned = not hasattr(os, "getuid") or st.st_uid == os.getuid()
+    return owned and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def _private_cache_dir(path: str) -> bool:
+    """
+    Create the cache directory for this user only (0700), and check that an existing one is a real directory
+    that no one else can put files in, since anything found there is unmarshalled.
+    """
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        st = os.lstat(path)
+    except OSError as e:
+        logging.warning(f"Could not create automarkup rules cache directory '{path}': {e}")
+        return False
+    if not stat.S_ISDIR(st.st_mode) or not _private(st):
+        logging.warning(f"Not using automarkup rules cache '{path}': it must be a directory owned by this user "
+                        f"and writable by no one else")
+        return False
+    return True
+
+
+def load_rules_cached() -> Dict[str, Dict[str, List[mlassociation.Rule]]]:
+    """
+    Load rules and their compiled voice tables from a marshal cache keyed by the rules data hash, building
+    and writing the cache first if there isn't a valid one.  Falls back to plain loading if the cache
+    can't be written, or if its directory or file could have been written by another user.
+    """
+    from ..markup_types import markup_voice
+
+    with open(_rules_data_path(), "rb") as f:
+        source = f.read()
+    digest = hashlib.sha256(source).hexdigest()
+    if not _private_cache_dir(mlparams.RULES_CACHE_DIR):
+        return _rules_from_json(source.decode("utf-8"))
+    cache_path = os.path.join(mlparams.RULES_CACHE_DIR,
+                              "rules-v{}-py{}{}-{}.marshal".format(RULES_CACHE_VERSION, *sys.version_info[:2], digest[:16]))
+    try:
+        with open(cache_path, "rb") as f:
+            if not _private(os.fstat(f.fileno())):
+                raise ValueError("cache file writable by another user")
+            version, cached_digest, plain, table = marshal.loads(f.read())
+        if version == RULES_CACHE_VERSION and cached_digest == digest:
+            rules = { tag: { word: [ mlassociation.Rule(*r) for r in word_rules ] for word, word_rules in words.items() }
+                      for tag, words in plain.items() }
+            markup_voice.use_compiled_rules(rules, table)
+            return rules
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    rules = _rules_from_json(source.decode("utf-8"))
+    table = markup_voice.compile_rules(rules)
+    plain = { tag: { word: [ (r.associated_str, r.support, r.confidence, r.lift) for r in word_rules ]
+                     for word, word_rules in words.items() }
+              for tag, words in rules.items() }
+    try:
+        # written aside and renamed, so other processes only ever see a complete file
+        tmp_path = "{}.{}.tmp".format(cache_path, os.getpid())
+        with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
+            f.write(marshal.dumps((RULES_CACHE_VERSION, digest, plain, table)))
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logging.warning(f"Could not write automarkup rules cache '{cache_path}': {e}")
+    return rules
+
+
 def serialize_element(element: ET.Element) -> str:
     """
     Serializes a TreeElement and returns json-string
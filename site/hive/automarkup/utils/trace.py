@@ -0,0 +1,62 @@
+"""Debug tracing for the markup pipeline, free when turned off.
+
+Records go to the "automarkup.trace" logger, outside the "hive" logger tree so the server's DEBUG level
+doesn't turn it on.  It is on when that logger (or the root logger, as with the CLI's --verbose) is at
+DEBUG, or when AUTOMARKUP_TRACE is set in the environment (see mlparams.TRACE).
+
+Nothing is formatted while tracing is off: hot loops check enabled() once per call and skip building
+their debug tables altogether, and record() hands the logger its fields, only turned into text if a
+handler writes the record.  Each record also carries them as record.trace, {"stage": name, **fields},
+for handlers that want structured output.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+
+from ..ml import mlparams
+
+logger = logging.getLogger("automarkup.trace")
+if mlparams.TRACE:
+    logger.setLevel(logging.DEBUG)
+
+
+class _Message:
+    """Log message rendered from the trace fields only when a handler formats it"""
+    __slots__ = ("fields",)
+
+    def __init__(self, fields: dict):
+        self.fields = fields
+
+    def __str__(self):
+        fields = self.fields
+        return "{} {}".format(fields["stage"], " ".join("{}={!r}".format(k, v) for k, v in fields.items() if k != "stage"))
+
+
+def enabled() -> bool:
+    """True if trace records are wanted; check once before building anything costly for them"""
+    return logger.isEnabledFor(logging.DEBUG)
+
+
+def record(stage: str, **fields):
+    """Emit one trace record for a pipeline stage"""
+    if logger.isEnabledFor(logging.DEBUG):
+        fields = dict(stage=stage, **fields)
+        logger.debug(_Message(fields), extra={"trace": fields})
+
+
+@contextmanager
+def stage(name: str, **fields):
+    """
+    Time a block as one trace record, with its duration as ms.  Yields the record's fields (None when
+    tracing is off) so the block can add results to them.
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        yield None
+        return
+    start = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        fields["ms"] = round((time.perf_counter() - start) * 1000, 3)
+        record(name, **fields)
@@ -0,0 +1,69 @@
+'''
+BENCH - Benchmark suites for the hive hot paths
+
+Suites register themselves by name with the @suite decorator and are run from the command line
+using `python manage.py benchmark <suite>`.  Each suite prints its own report to stdout.
+'''
+import importlib
+import statistics
+import time
+
+SUITES = {}
+
+# Modules that hold suites, imported on demand so only the benchmark command pays for them
+_SUITE_MODULES = [ "prompt_cache", "prompt_render", "memory_index", "global_match", "fuzzy_match", "text_replace", "voice_rules", "span_conflicts", "xml_assembly", "markup_trace" ]
+
+# Register a suite function, called with the dict of command options
+def suite(name, help=""):
+    def register(func):
+        SUITES[name] = (func, help)
+        return func
+    return register
+
+def load_suites():
+    for mod in _SUITE_MODULES:
+        importlib.import_module(f"{__name__}.{mod}")
+    return SUITES
+
+# Time a no-arg callable, returning the list of per-call durations in seconds
+def time_calls(func, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+# Reduce samples (seconds) to the usual stats, in milliseconds
+def summarize(samples):
+    ordered = sorted(samples)
+    if not ordered:
+        return { "n": 0, "mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0 }
+    return {
+        "n": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+# Same stats for any list of numbers, in their own units
+def distribution(values):
+    ordered = sorted(values)
+    if not ordered:
+        return { "n": 0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0 }
+    return {
+        "n": len(ordered),
+        "mean": statistics.fmean(ordered),
+        "p50": ordered[len(ordered) // 2],
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+    }
+
+def print_table(headers, rows):
+    cells = [ [ f"{c:.3f}" if isinstance(c, float) else str(c) for c in row ] for row in rows ]
+    widths = [ max(len(h), *(len(r[i]) for r in cells)) if cells else len(h) for i,h in enumerate(headers) ]
+    print("  ".join(h.ljust(w) for h,w in zip(headers, widths)))
+    print("  ".join("-" * w for w in widths))
+    for row in cells:
+        print("  ".join(c.ljust(w) for c,w in zip(row, widths)))
@@ -0,0 +1,57 @@
+'''
+FUZZY MATCH - Approximate global command lookup at 100 to 5,000 literal phrases
+
+Builds global command patterns made of literal phrases (wake word alternations and fixed commands,
+as the stock ones are) and times the fuzzy lookup for speech with a speech-to-text slip in it, for
+speech matching no command, and for the exact phrase.  Reports how many misheard phrases found
+their own command and how many unrelated utterances fired one.
+'''
+import random
+from . import suite, time_calls, summarize, print_table
+from ..mqtt.fuzzy_commands import FuzzyCommandIndex
+
+_SIZES = [ 100, 1000, 5000 ]
+
+_WAKE = "(moxie|moxy|foxy)"
+_VERBS = [ "play", "tell me", "show me", "start", "juega", "cuentame", "pon", "dime" ]
+_WORDS = [ "musica", "cuento", "chiste", "baile", "juego", "adivinanza", "poema", "cancion", "dato", "historia",
+           "dinosaurio", "planeta", "animal", "color", "numero", "robot", "pelota", "estrella" ]
+_SLIPS = [ ("moxie", "moxi"), ("moxie", "moxy"), ("c", "s"), ("t", "th"), ("e", "a"), ("o", "u"), ("r", ""), ("a", "") ]
+_MISSES = [ "me gusta mucho jugar con mis amigos", "que comiste hoy en la escuela", "hola como estas",
+            "tell me about the moon", "cuentame algo divertido" ]
+
+# Patterns, and the phrase each one was built from
+def _patterns(n, rng):
+    out = []
+    for i in range(n):
+        phrase = f"{rng.choice(_VERBS)} {rng.choice(_WORDS)} {rng.choice(_WORDS)}{i}"
+        out.append((f"^{_WAKE} {phrase}$", f"moxie {phrase}"))
+    return out
+
+# A copy of the phrase with one slip a speech-to-text engine might make, some only spelled differently
+def _misheard(phrase, rng):
+    for _ in range(10):
+        old, new = rng.choice(_SLIPS)
+        if old in phrase:
+            at = rng.choice([ i for i in range(len(phrase)) if phrase.startswith(old, i) ])
+            return phrase[:at] + new + phrase[at + len(old):]
+    return phrase[:-1]
+
+@suite("fuzzy_match", help="Fuzzy global command lookup for misheard and unrelated speech, 100 to 5,000 phrases")
+def run(options):
+    iterations = options.get("iterations") or 1000
+    rng = random.Random(5)
+    rows = []
+    for n in _SIZES:
+        pairs = _patterns(n, rng)
+        index = FuzzyCommandIndex([ p for p, _ in pairs ])
+        probes = [ (i, _misheard(pairs[i][1], rng)) for i in rng.sample(range(n), min(n, 200)) ]
+        found = sum(1 for i, speech in probes if (hit := index.match(speech)) and hit.index == i)
+        fired = sum(1 for speech in _MISSES if index.match(speech))
+        cases = { "misheard": probes[0][1], "unrelated": _MISSES[0], "exact": pairs[-1][1] }
+        for label, speech in cases.items():
+            stats = summarize(time_calls(lambda: index.match(speech), iterations))
+            rows.append([ n, index.size, label, stats["p50_ms"] * 1000, stats["p95_ms"] * 1000,
+                          f"{found}/{len(probes)}", f"{fired}/{len(_MISSES)}" ])
+    print(f"Fuzzy global command lookup, {iterations} iterations each (times in microseconds)")
+    print_table([ "patterns", "phrases", "speech", "p50_us", "p95_us", "misheard_found", "unrelated_fired" ], rows)
@@ -0,0 +1,81 @@
+'''
+GLOBAL MATCH - Global command matching cost, linear regex scan vs the literal-prefiltered matcher
+
+Builds sets of 10 to 5,000 synthetic global command patterns in the style of the stock ones
+(wake word alternations, fixed phrases, captured entities, a few catch-alls) and times finding the
+first match for utterances that hit early, late or nothing.  Both ways must agree on the pattern
+and its groups; the suite stops if they don't.  The "default" column is what PatternMatcher does at
+its default min_patterns, the crossover these numbers put at 20 to 30 patterns.
+'''
+import random
+import re
+from . import suite, time_calls, summarize, print_table
+from ..mqtt.pattern_matcher import PatternMatcher
+
+_SIZES = [ 10, 20, 30, 50, 100, 1000, 5000 ]
+
+_WAKE = "(moxie|moxy|foxy|boxy|oxy)"
+_VERBS = [ "play", "tell me", "show me", "start", "juega", "cuéntame", "pon", "dime" ]
+_WORDS = [ "musica", "cuento", "chiste", "baile", "juego", "adivinanza", "poema", "cancion", "dato", "historia",
+           "dinosaurio", "planeta", "animal", "color", "numero", "robot", "pelota", "estrella" ]
+
+# Patterns, and an utterance each one matches
+def _patterns(n, rng):
+    out = []
+    for i in range(n):
+        word = f"{rng.choice(_WORDS)}{i}"
+        verb = rng.choice(_VERBS)
+        kind = i % 10
+        if kind < 5:
+            out.append((f"^{_WAKE} {verb} (?:a |un |una )?{word}$", f"moxie {verb} un {word}"))
+        elif kind < 8:
+            out.append((f"^{_WAKE} (?:{word}|{rng.choice(_WORDS)}{i}x) (.*)$", f"foxy {word} por favor"))
+        elif kind < 9:
+            out.append((f"^(?:hey )?{_WAKE},? {word} (\\d+) (minute|hour|second)s?$", f"hey moxie, {word} 5 minutes"))
+        else:
+            out.append((f".*\\b{word}\\b.*", f"me gusta {word} mucho"))
+    # a pattern with no required literal, like real catch-alls
+    out.insert(n // 2, (r"^\d+ \d+$", "12 34"))
+    return out
+
+def _first_linear(compiled, speech):
+    for i, r in enumerate(compiled):
+        m = r.match(speech)
+        if m:
+            return i, m.groups()
+    return None
+
+def _first_indexed(compiled, matcher, speech):
+    for i in matcher.candidates(speech):
+        m = compiled[i].match(speech)
+        if m:
+            return i, m.groups()
+    return None
+
+@suite("global_match", help="First matching global command, linear scan vs literal-prefiltered matcher, 10 to 5,000 patterns")
+def run(options):
+    iterations = options.get("iterations") or 1000
+    rng = random.Random(11)
+    rows = []
+    for n in _SIZES:
+        pairs = _patterns(n, rng)
+        patterns = [ p for p, _ in pairs ]
+        compiled = [ re.compile(p) for p in patterns ]
+        matcher = PatternMatcher(patterns, min_patterns=0)
+        default = "linear" if PatternMatcher(patterns).prefiltered == 0 else "matcher"
+        utterances = {
+            "early": pairs[0][1],
+            "late": pairs[-1][1],
+            "none": "me gusta mucho jugar con mis amigos en el parque",
+        }
+        for label, speech in utterances.items():
+            expected = _first_linear(compiled, speech)
+            if _first_indexed(compiled, matcher, speech) != expected:
+                raise RuntimeError(f"Matcher disagrees with linear scan for '{speech}' at {n} patterns")
+            linear = summarize(time_calls(lambda: _first_linear(compiled, speech), iterations))
+            indexed = summarize(time_calls(lambda: _first_indexed(compiled, matcher, speech), iterations))
+            rows.append([ n, label, "-" if expected is None else expected[0], len(matcher.candidates(speech)),
+                          linear["p50_ms"] * 1000, indexed["p50_ms"] * 1000, f"{linear['mean_ms'] / indexed['mean_ms']:.1f}x",
+                          default ])
+    print(f"Global command matching, {iterations} iterations each (times in microseconds)")
+    print_table([ "patterns", "utterance", "matched", "candidates", "linear_p50_us", "matcher_p50_us", "speedup", "default" ], rows)
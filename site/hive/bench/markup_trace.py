@@ -0,0 +1,82 @@
+'''
+MARKUP TRACE - Automarkup process() time with eager debug formatting, and tracing off and on
+
+Marks up 10 to 200-word answers made of rule vocabulary three ways:
+
+    eager   the baseline, as the pipeline ran before lazy tracing: every debug payload is built and
+            formatted into a message for logging.debug, which a logger at WARNING then drops
+    off     the default, the automarkup.trace logger off, so nothing is built or formatted
+    on      the trace logger at DEBUG, records going to a handler that formats and drops them
+
+saved is the CPU per process() call that off saves over eager.  The eager baseline formats the trace
+records rather than the old messages, and leaves out the old per-word pretty-printed XML tree, so it
+is a lower bound on what the old code paid.  All three must give the same markup; the suite stops if
+they don't.
+'''
+import logging
+import random
+from contextlib import contextmanager
+from . import suite, time_calls, summarize, print_table
+from ..automarkup import process, initialize_rules
+from ..automarkup.utils import trace
+
+_LENGTHS = [ 10, 25, 50, 100, 200 ]
+
+class _Discard(logging.Handler):
+    def emit(self, record):
+        self.format(record)
+
+# Build and format every trace payload up front, for a logger that drops it, as logging.debug(f"...") did
+@contextmanager
+def _eager():
+    dropped = logging.getLogger("automarkup.eager")
+    dropped.setLevel(logging.WARNING)
+    enabled, record = trace.enabled, trace.record
+
+    def eager_record(stage, **fields):
+        dropped.debug("{} {}".format(stage, " ".join("{}={!r}".format(k, v) for k, v in fields.items())))
+
+    trace.enabled, trace.record = (lambda: True), eager_record
+    try:
+        yield
+    finally:
+        trace.enabled, trace.record = enabled, record
+
+def _process(text, rules):
+    random.seed(50)
+    return process(text, rules, mood_and_intensity=("joy", 0.5))
+
+@suite("markup_trace", help="Automarkup process() with eager debug formatting vs tracing off and on, 10 to 200 words")
+def run(options):
+    iterations = options.get("iterations") or 100
+    rules = initialize_rules()
+    vocab = sorted(set(w for t in rules for w in rules[t]))
+    rng = random.Random(50)
+    handler = _Discard()
+    level, propagate = trace.logger.level, trace.logger.propagate
+    rows = []
+    for words in _LENGTHS:
+        text = " ".join(rng.choice(vocab) + rng.choice([ "", "", "", ",", ".", "?" ]) for _ in range(words))
+        trace.logger.setLevel(logging.WARNING)
+        off = summarize(time_calls(lambda: _process(text, rules), iterations))
+        expected = _process(text, rules)
+        with _eager():
+            eager = summarize(time_calls(lambda: _process(text, rules), iterations))
+            if _process(text, rules) != expected:
+                raise RuntimeError(f"Markup differs with eager formatting at {words} words")
+        trace.logger.addHandler(handler)
+        trace.logger.setLevel(logging.DEBUG)
+        trace.logger.propagate = False
+        try:
+            on = summarize(time_calls(lambda: _process(text, rules), iterations))
+            if _process(text, rules) != expected:
+                raise RuntimeError(f"Markup differs with tracing on at {words} words")
+        finally:
+            trace.logger.removeHandler(handler)
+            trace.logger.setLevel(level)
+            trace.logger.propagate = propagate
+        saved = eager["mean_ms"] - off["mean_ms"]
+        rows.append([ words, eager["p50_ms"], off["p50_ms"], saved, f"{100 * saved / eager['mean_ms']:.0f}%",
+                      on["p50_ms"], f"{on['mean_ms'] / off['mean_ms']:.1f}x" ])
+    print(f"Automarkup process(), {iterations} iterations each (saved is eager - off, mean ms per call)")
+    print_table([ "words", "eager_p50_ms", "off_p50_ms", "saved_ms", "saved", "on_p50_ms", "on_cost" ], rows)
@@ -0,0 +1,34 @@
+'''
+MEMORY INDEX - Build and top-k lookup cost of the per-device memory index
+
+Indexes synthetic transcripts of increasing size (Spanish filler lines like a long-running device
+would collect) and times adding lines and searching them with short child-like utterances.
+'''
+import random
+import time
+from . import suite, time_calls, summarize, print_table
+from ..mqtt.latency_profiles import sample_text
+from ..mqtt.memory_index import MemoryIndex
+
+_SIZES = [ 1000, 10000, 50000 ]
+
+_QUERIES = [ "me gusta el fútbol", "mi color favorito es el azul", "fuimos al parque con mis amigos",
+             "tengo un perro", "la música es divertida", "qué animales te gustan" ]
+
+@suite("memory_index", help="Memory index add and top-k search time by transcript size")
+def run(options):
+    iterations = options.get("iterations") or 1000
+    rng = random.Random(7)
+    rows = []
+    for size in _SIZES:
+        lines = [ f"{sample_text(rng, rng.randint(6, 30))} {rng.randint(0, size)}" for _ in range(size) ]
+        index = MemoryIndex()
+        start = time.perf_counter()
+        for line in lines:
+            index.add(line)
+        add_us = (time.perf_counter() - start) / size * 1e6
+        queries = iter(_QUERIES * (iterations // len(_QUERIES) + 1))
+        stats = summarize(time_calls(lambda: index.search(next(queries), k=5), iterations))
+        rows.append([ size, len(index), add_us, stats["p50_ms"], stats["p95_ms"], stats["max_ms"] ])
+    print(f"Memory index, {iterations} searches per size, k=5")
+    print_table([ "lines", "indexed", "add_us", "search_p50_ms", "search_p95_ms", "search_max_ms" ], rows)
@@ -0,0 +1,74 @@
+'''
+PROMPT CACHE - Prompt-eval time per turn for the classic and stable prefix prompt layouts
+
+Replays the same short conversation against a local Ollama model once per layout, using a prompt
+that references volley data which changes every turn (a clock), and reports the prompt tokens
+Ollama had to evaluate and the time it spent doing so.  With the classic layout the system message
+changes every turn and the whole request is evaluated again; with the stable prefix layout only the
+tail after the cached prefix is.
+'''
+from django.conf import settings
+from . import suite, print_table
+from ..mqtt.conversations import SingleContextChatSession, PROMPT_LAYOUT_CLASSIC, PROMPT_LAYOUT_STABLE_PREFIX
+from ..mqtt.volley import Volley
+
+_PERSONA = ("You are a robot named Moxie who comes from the Global Robotics Laboratory. You are having a conversation "
+            "with a person who is your friend. Chat about a topic that the person finds interesting and fun. Share short "
+            "facts and opinions about the topic, one fact or opinion at a time. You are curious and love learning about "
+            "your friend.  Your utterances are around 30 words long.  Ask only one question per response and ask it at "
+            "the end of your response.\n")
+
+# A line of volley data that changes every turn, ahead of a long persona
+_PROMPT = "The time right now is {{volley.local_data.clock}}.\n" + _PERSONA * 6
+
+_TURNS = [
+    "hi moxie",
+    "i went to the park today",
+    "we played soccer with my cousins",
+    "my team won three to one",
+    "i scored the last goal",
+    "then we had ice cream",
+    "chocolate is my favorite",
+    "what is your favorite flavor",
+    "do robots eat ice cream",
+    "i think you would like strawberry",
+]
+
+def _replay(client, model, layout, turns):
+    session = SingleContextChatSession(prompt=_PROMPT, model=model, prompt_layout=layout)
+    history = []
+    evals = []
+    for i,speech in enumerate(_TURNS[:turns]):
+        volley = Volley.request_from_speech(speech, local_data={ "clock": f"10:{i:02d} AM" })
+        context, trailer = session.make_volley_context(volley)
+        history.append({ "role": "user", "content": speech })
+        resp = client.chat(model=model, messages=context + history + trailer, stream=False,
+                           options={ "temperature": 0, "num_predict": 24 })
+        history.append({ "role": "assistant", "content": resp["message"]["content"] })
+        evals.append((resp.get("prompt_eval_count") or 0, (resp.get("prompt_eval_duration") or 0) / 1e6))
+    return evals
+
+@suite("prompt_cache", help="Ollama prompt-eval time per turn, classic vs stable_prefix prompt layout (needs a live Ollama)")
+def run(options):
+    import ollama
+    host = options.get("host") or getattr(settings, "OLLAMA_HOST", "http://127.0.0.1:11434")
+    model = options.get("model") or getattr(settings, "OLLAMA_MODEL", "llama3")
+    turns = min(options.get("turns") or len(_TURNS), len(_TURNS))
+    client = ollama.Client(host=host)
+    # load the model first, so the first layout doesn't pay the cold start
+    client.chat(model=model, messages=[ { "role": "user", "content": "hi" } ], options={ "num_predict": 1 })
+
+    print(f"Prompt-eval on {model} @ {host}, {turns} turns per layout")
+    totals = {}
+    rows = []
+    for layout in (PROMPT_LAYOUT_CLASSIC, PROMPT_LAYOUT_STABLE_PREFIX):
+        evals = _replay(client, model, layout, turns)
+        totals[layout] = sum(ms for _,ms in evals)
+        for turn,(count,ms) in enumerate(evals, 1):
+            rows.append([ layout, turn, count, ms ])
+    print_table([ "layout", "turn", "prompt_tokens_evaluated", "prompt_eval_ms" ], rows)
+
+    classic = totals[PROMPT_LAYOUT_CLASSIC]
+    stable = totals[PROMPT_LAYOUT_STABLE_PREFIX]
+    saved = (1 - stable / classic) * 100 if classic else 0.0
+    print(f"\nTotal prompt-eval: classic {classic:.1f} ms, stable_prefix {stable:.1f} ms ({saved:.1f}% saved)")
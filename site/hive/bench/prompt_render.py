@@ -0,0 +1,50 @@
+'''
+PROMPT RENDER - Cost of rendering a volley's prompt context, Template.render vs compiled prompts
+
+Renders prompts of typical sizes (a short persona, the stock chat prompt size and a long lesson
+prompt) in each compiled form: static with no tags, plain {{ variable }} references, and with
+{% tags %}.  The baseline is what make_volley_context used to do every volley, building a Context
+and rendering the Template; the compiled column is the same volley through compile_prompt.
+'''
+from django.template import Template, Context
+from . import suite, time_calls, summarize, print_table
+from ..mqtt.prompt_compiler import CompiledPrompt
+from ..mqtt.volley import Volley
+
+_PERSONA = ("You are a robot named Moxie who comes from the Global Robotics Laboratory. You are having a conversation "
+            "with a person who is your friend. Chat about a topic that the person finds interesting and fun. ")
+
+_SIZES = { "short": 1, "typical": 4, "long": 16 }
+
+_VARIABLES = "The time right now is {{volley.local_data.clock}}. Your friend is called {{volley.local_data.name|default:'friend'}}.\n"
+_TAGS = "{% if volley.local_data.name %}Your friend is called {{volley.local_data.name}}.{% endif %}\n"
+
+def _prompts():
+    for size, repeat in _SIZES.items():
+        body = _PERSONA * repeat
+        yield size, "static", body
+        yield size, "variables", _VARIABLES + body
+        yield size, "tags", _TAGS + body
+
+@suite("prompt_render", help="Prompt context rendering per volley, Template.render vs compiled prompts")
+def run(options):
+    iterations = options.get("iterations") or 1000
+    volley = Volley.request_from_speech("hi moxie", local_data={ "clock": "10:00 AM", "name": "Ana" })
+    data = { "volley": volley, "session": None }
+    rows = []
+    for size, kind, prompt in _prompts():
+        template = Template(prompt)
+        compiled = CompiledPrompt(prompt)
+        assert compiled.render(data) == template.render(Context(data))
+        if compiled.is_static:
+            fast = lambda: [ compiled.message ]
+        else:
+            fast = lambda: [ { "role": "system", "content": compiled.render(data) } ]
+        slow = lambda: [ { "role": "system", "content": template.render(Context(data)) } ]
+        base = summarize(time_calls(slow, iterations))
+        comp = summarize(time_calls(fast, iterations))
+        speedup = base["mean_ms"] / comp["mean_ms"] if comp["mean_ms"] else float("inf")
+        rows.append([ size, len(prompt), kind, compiled.kind, base["mean_ms"] * 1000, comp["mean_ms"] * 1000,
+                      comp["p95_ms"] * 1000, f"{speedup:.1f}x" ])
+    print(f"Prompt context rendering, {iterations} iterations each (times in microseconds)")
+    print_table([ "size", "chars", "prompt", "compiled_as", "render_us", "compiled_us", "compiled_p95_us", "speedup" ], rows)
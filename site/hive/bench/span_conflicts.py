@@ -0,0 +1,63 @@
+'''
+SPAN CONFLICTS - Automarkup span conflict resolution, repeated full checks vs the sweep
+
+Builds span sets like automarkup's for 10 to 200-word answers (runs of voice rules on a few tags,
+some merged across neighbours so they cross other tags' spans) and times removing the worst
+offending span until nothing conflicts: the original loop, calling check_span_conflicts after
+every removal, against resolve_span_conflicts.  Both must keep the same spans; the suite stops if
+they don't.
+'''
+import copy
+import random
+from . import suite, time_calls, summarize, print_table
+from ..automarkup.markup import check_span_conflicts, remove_worst_offending_span
+from ..automarkup.markup_core.tagspan import TagSpan
+from ..automarkup.markup_core.span_conflicts import resolve_span_conflicts
+
+_LENGTHS = [ 10, 25, 50, 100, 200 ]
+_TAGS = [ "usel", "prosody", "emphasis" ]
+
+def _spans(words, rng):
+    spans_per_tag = {}
+    for tag in _TAGS:
+        spans, i = [], 0
+        while i < words:
+            i += rng.randint(0, 3)
+            end = min(words - 1, i + rng.choice([ 0, 1, 2, 3, 5 ]))
+            span = TagSpan(f"{tag}{rng.randint(0, 3)}", i, end)
+            # merged spans reach further, with their size one short as the merge leaves it
+            if rng.random() < 0.2:
+                span.end_index = min(words - 1, span.end_index + rng.randint(2, 8))
+                span.size = span.end_index - span.start_index
+            spans.append(span)
+            i = end + 1
+        spans_per_tag[tag] = spans
+    return spans_per_tag
+
+def _resolve_rechecking(spans_per_tag):
+    _, _, worst = check_span_conflicts(spans_per_tag)
+    while worst[1] is not None:
+        spans_per_tag = remove_worst_offending_span(spans_per_tag, worst)
+        _, _, worst = check_span_conflicts(spans_per_tag)
+    return spans_per_tag
+
+def _kept(spans_per_tag):
+    return { tag: [ (s.associated_str, s.start_index, s.end_index) for s in spans ] for tag, spans in spans_per_tag.items() }
+
+@suite("span_conflicts", help="Automarkup span conflict resolution, full recheck per removal vs sweep, 10 to 200 words")
+def run(options):
+    iterations = options.get("iterations") or 200
+    rng = random.Random(3)
+    rows = []
+    for words in _LENGTHS:
+        base = _spans(words, rng)
+        if _kept(_resolve_rechecking(copy.deepcopy(base))) != _kept(resolve_span_conflicts(copy.deepcopy(base))):
+            raise RuntimeError(f"Sweep keeps different spans than the recheck loop at {words} words")
+        copies = [ copy.deepcopy(base) for _ in range(2 * iterations) ]
+        old = summarize(time_calls(lambda: _resolve_rechecking(copies.pop()), iterations))
+        new = summarize(time_calls(lambda: resolve_span_conflicts(copies.pop()), iterations))
+        total = sum(len(spans) for spans in base.values())
+        kept = sum(len(spans) for spans in resolve_span_conflicts(copy.deepcopy(base)).values())
+        rows.append([ words, total, total - kept, old["p50_ms"] * 1000, new["p50_ms"] * 1000, f"{old['mean_ms'] / new['mean_ms']:.1f}x" ])
+    print(f"Span conflict resolution, {iterations} iterations each (times in microseconds)")
+    print_table([ "words", "spans", "removed", "recheck_p50_us", "sweep_p50_us", "speedup" ], rows)
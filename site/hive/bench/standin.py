@@ -0,0 +1,170 @@
+'''
+STANDIN - Local HTTP servers that mimic the OpenAI and Ollama chat APIs
+
+Stand-ins let the vendor benchmark (and anything else that talks to a vendor over HTTP) run offline.
+They answer the chat endpoints of each API, streaming or not, with filler text timed by a latency
+profile, and support just enough of the rest (Ollama ps/generate) for the hive to treat them as real.
+
+    server = StandInServer("ollama", parse_profile("local_gpu")).start()
+    provider = OllamaProvider(host=server.url, model="llama3")
+    ...
+    server.stop()
+'''
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from ..mqtt.latency_profiles import LatencyProfile, sample_text
+
+logger = logging.getLogger(__name__)
+
+OPENAI = "openai"
+OLLAMA = "ollama"
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "StandInServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.server.kind == OLLAMA and self.path in ("/api/ps", "/api/tags"):
+            models = [ { "name": m, "model": m } for m in sorted(self.server.models_seen) ]
+            self._send_json(200, { "models": models })
+        else:
+            self._send_json(404, { "error": f"not found: {self.path}" })
+
+    def do_POST(self):
+        body = self._read_json()
+        if self.server.kind == OPENAI and self.path.endswith("/chat/completions"):
+            self._chat(body, self._openai_chunk, self._openai_final, "text/event-stream")
+        elif self.server.kind == OLLAMA and self.path == "/api/chat":
+            self._chat(body, self._ollama_chunk, self._ollama_final, "application/x-ndjson")
+        elif self.server.kind == OLLAMA and self.path == "/api/generate":
+            # model preload
+            self.server.models_seen.add(body.get("model"))
+            self._send_json(200, { "model": body.get("model"), "response": "", "done": True })
+        else:
+            self._send_json(404, { "error": f"not found: {self.path}" })
+
+    def _chat(self, body, chunk_fn, final_fn, stream_type):
+        model = body.get("model", "standin")
+        self.server.models_seen.add(model)
+        stream = body.get("stream", False)
+        ttft, words, outcome = self.server.sample()
+        self.server.count("requests")
+        if outcome == "fail":
+            self.server.count("failed")
+            self._send_json(500, { "error": { "message": "simulated failure" } })
+            return
+        if outcome == "timeout":
+            self.server.count("hung")
+            time.sleep(self.server.profile.hang_ms / 1000)
+            return
+        text = self.server.text(words)
+        tokens = [ w + " " for w in text.split(" ") ]
+        tokens[-1] = tokens[-1].rstrip()
+        time.sleep(ttft / 1000)
+        if not stream:
+            time.sleep(self.server.profile.token_ms * (len(tokens) - 1) / 1000)
+            self._send_json(200, final_fn(model, text, len(tokens), body))
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", stream_type)
+        self.end_headers()
+        try:
+            for i, tok in enumerate(tokens):
+                if i:
+                    time.sleep(self.server.profile.token_ms / 1000)
+                self.wfile.write(chunk_fn(model, tok))
+                self.wfile.flush()
+            self.wfile.write(chunk_fn(model, None, final=final_fn(model, "", len(tokens), body)))
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # the client hung up, like a cancelled or budget-limited request
+            self.server.count("aborted")
+
+    @staticmethod
+    def _openai_chunk(model, tok, final=None):
+        if final is not None:
+            done = { "id": "standin", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                     "choices": [ { "index": 0, "delta": {}, "finish_reason": "stop" } ] }
+            return f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode("utf-8")
+        chunk = { "id": "standin", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                  "choices": [ { "index": 0, "delta": { "role": "assistant", "content": tok }, "finish_reason": None } ] }
+        return f"data: {json.dumps(chunk)}\n\n".encode("utf-8")
+
+    @staticmethod
+    def _openai_final(model, text, ntokens, body):
+        prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4
+        return { "id": "standin", "object": "chat.completion", "created": int(time.time()), "model": model,
+                 "choices": [ { "index": 0, "message": { "role": "assistant", "content": text }, "finish_reason": "stop" } ],
+                 "usage": { "prompt_tokens": prompt_tokens, "completion_tokens": ntokens, "total_tokens": prompt_tokens + ntokens } }
+
+    @staticmethod
+    def _ollama_chunk(model, tok, final=None):
+        rec = final if final is not None else { "model": model, "message": { "role": "assistant", "content": tok }, "done": False }
+        return (json.dumps(rec) + "\n").encode("utf-8")
+
+    @staticmethod
+    def _ollama_final(model, text, ntokens, body):
+        prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4
+        return { "model": model, "message": { "role": "assistant", "content": text }, "done": True, "done_reason": "stop",
+                 "load_duration": 0, "prompt_eval_count": prompt_tokens, "eval_count": ntokens }
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, kind, profile: LatencyProfile, seed=0, port=0):
+        if kind not in (OPENAI, OLLAMA):
+            raise ValueError(f"No stand-in for vendor API '{kind}'")
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.kind = kind
+        self.profile = profile
+        self.models_seen = set()
+        self.stats = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def sample(self):
+        with self._lock:
+            return (self.profile.sample_ttft(self._rng), self.profile.sample_words(self._rng),
+                    self.profile.sample_outcome(self._rng))
+
+    def text(self, words):
+        with self._lock:
+            return sample_text(self._rng, words)
+
+    def count(self, name):
+        with self._lock:
+            self.stats[name] = self.stats.get(name, 0) + 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name=f"standin-{self.kind}", daemon=True)
+        self._thread.start()
+        logger.debug(f"Stand-in {self.kind} server on {self.url}")
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
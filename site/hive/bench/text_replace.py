@@ -0,0 +1,58 @@
+'''
+TEXT REPLACE - Automarkup text replacement, per-key scans vs the compiled single pass
+
+Times the replacement stage of automarkup for a few typical responses: the original way (loading
+text_replacement.json for the call, then one padded scan of the sentence per key) against the
+cached replacement table and its single regex pass.  Both must produce the same text for these
+sentences; the suite stops if they don't.  Also times a whole automarkup.process call.
+'''
+import json
+from . import suite, time_calls, summarize, print_table
+from ..automarkup import process, initialize_rules
+from ..automarkup import markup
+from ..automarkup.ml import mlparams
+
+_SENTENCES = [
+    "Hola amigo, hoy vamos a jugar un juego muy divertido.",
+    "That's so funny lol, brb I'll grab my tv remote :)",
+    "afaik dinosaurs lived millions of years ago, g2g now, thx! <3",
+    "Let's take a deep breath together, in and out, slowly and calmly, one more time.",
+]
+
+# The replacement stage as it was: read the file, then scan the sentence once per key
+def _load_uncached():
+    with open(mlparams.TXT_REPLACE_FILE_EXE_PATH, "r") as f:
+        return json.loads(f.read())
+
+def _replace_per_key(string, replacements):
+    for key, value in replacements.items():
+        if key not in string:
+            continue
+        j = 0
+        while j < len(string) and j + len(key) <= len(string):
+            end = j + len(key)
+            if string[j:end] == key and (j == 0 or string[j-1] in markup.PAD_CHARS) \
+                    and (end == len(string) or string[end] in markup.PAD_CHARS):
+                string = string[:j] + value + string[end:]
+                j += len(value) - len(key)
+            j += 1
+    return string
+
+@suite("text_replace", help="Automarkup text replacement, file load plus per-key scans vs cached single pass")
+def run(options):
+    iterations = options.get("iterations") or 1000
+    rows = []
+    for speech in _SENTENCES:
+        before = _replace_per_key(speech, _load_uncached())
+        after = markup.get_internal_text_replacements().apply(speech)
+        if before != after:
+            raise RuntimeError(f"Replacement differs for '{speech}': '{before}' vs '{after}'")
+        old = summarize(time_calls(lambda: _replace_per_key(speech, _load_uncached()), iterations))
+        new = summarize(time_calls(lambda: markup.get_internal_text_replacements().apply(speech), iterations))
+        rows.append([ speech[:40], old["p50_ms"] * 1000, new["p50_ms"] * 1000, f"{old['mean_ms'] / new['mean_ms']:.1f}x" ])
+    print(f"Text replacement per sentence, {iterations} iterations each (times in microseconds)")
+    print_table([ "sentence", "per_key_p50_us", "compiled_p50_us", "speedup" ], rows)
+
+    rules = initialize_rules()
+    full = summarize(time_calls(lambda: process(_SENTENCES[1], rules), max(1, iterations // 10)))
+    print(f"\nautomarkup.process, whole call: p50 {full['p50_ms']:.2f} ms, p95 {full['p95_ms']:.2f} ms")
@@ -0,0 +1,164 @@
+'''
+VENDORS - Replay a corpus of conversation turns against LLM vendors and compare them
+
+Each target is a vendor and model (for example ollama:llama3.2:3b or openai:gpt-4o-mini).  Every
+corpus turn is sent to every target as a streaming request, recording time to first token, total
+latency, token rate and reply length.  Token counts are estimated from the reply text (about four
+characters per token) so vendors are compared on the same footing.  Vendors that can't stream
+(xAI here) report their first token at the end of the request.
+
+With offline set, OpenAI and Ollama targets talk to local stand-in servers instead (see standin.py),
+timed by a latency profile.  Mock targets (mock:echo@cloud) run in process, online or not.
+'''
+import json
+import time
+from pathlib import Path
+from django.conf import settings
+from . import distribution, print_table
+from ..mqtt.latency_profiles import parse_profile
+from .standin import StandInServer, OPENAI, OLLAMA
+from ..models import AIVendor, HiveConfiguration
+from ..mqtt.ai_factory import OpenAIProvider, OllamaProvider, _create_provider, set_openai_key, set_xai_key
+
+DEFAULT_CORPUS = Path(__file__).parent / "corpus.jsonl"
+
+_VENDOR_NAMES = { "openai": AIVendor.OPEN_AI, "open_ai": AIVendor.OPEN_AI, "ollama": AIVendor.OLLAMA, "xai": AIVendor.XAI, "mock": AIVendor.MOCK }
+
+def load_corpus(path=None):
+    turns = []
+    with open(path or DEFAULT_CORPUS, encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if line.strip():
+                rec = json.loads(line)
+                turns.append({ "id": rec.get("id", str(i)), "messages": rec["messages"] })
+    return turns
+
+# Parse vendor:model[@profile], the profile only matters offline
+def parse_target(spec):
+    vendor_name, _, rest = spec.partition(":")
+    vendor = _VENDOR_NAMES.get(vendor_name.lower())
+    if not vendor:
+        raise ValueError(f"Unknown vendor '{vendor_name}' in target '{spec}'")
+    model, _, profile = rest.partition("@")
+    return { "name": spec, "vendor": vendor, "model": model or None, "profile": profile or None }
+
+# The mock vendor needs no server, its latency profile rides in the model name
+def _mock_provider(target, default_profile):
+    profile = target["profile"] or default_profile
+    model = target["model"] or "lorem"
+    return _create_provider(AIVendor.MOCK, f"{model}@{profile}" if profile else model)
+
+def _offline_provider(target, servers, default_profile):
+    kind = { AIVendor.OPEN_AI: OPENAI, AIVendor.OLLAMA: OLLAMA }.get(target["vendor"])
+    if not kind:
+        raise ValueError(f"No offline stand-in for {target['vendor'].name}")
+    profile = target["profile"] or default_profile
+    key = (kind, profile)
+    if key not in servers:
+        servers[key] = StandInServer(kind, parse_profile(profile), seed=len(servers)).start()
+    url = servers[key].url
+    if kind == OLLAMA:
+        return OllamaProvider(host=url, model=target["model"] or "llama3")
+    from openai import OpenAI
+    return OpenAIProvider(model=target["model"] or "gpt-4o-mini", client=OpenAI(api_key="standin", base_url=f"{url}/v1"))
+
+def _load_keys():
+    hive_config = HiveConfiguration.objects.filter(name="default").first()
+    set_openai_key(hive_config.openai_api_key if hive_config else None)
+    set_xai_key(hive_config.xai_api_key if hive_config else None)
+
+# One streamed request, returning its timings and reply text
+def measure(provider, messages, max_tokens, temperature):
+    start = time.perf_counter()
+    first = None
+    parts = []
+    try:
+        chunks = provider.chat(messages, temperature=temperature, stream=True, max_tokens=max_tokens)
+        if isinstance(chunks, str):
+            chunks = [ chunks ]
+        for delta in chunks:
+            if first is None:
+                first = time.perf_counter()
+            parts.append(delta)
+    except Exception as e:
+        return { "error": str(e), "total_ms": (time.perf_counter() - start) * 1000 }
+    end = time.perf_counter()
+    text = "".join(parts)
+    tokens = max(1, round(len(text) / 4))
+    gen_s = end - (first or end)
+    return {
+        "ttft_ms": ((first or end) - start) * 1000,
+        "total_ms": (end - start) * 1000,
+        "words": len(text.split()),
+        "est_tokens": tokens,
+        "tokens_per_s": tokens / gen_s if gen_s > 0 else None,
+        "text": text,
+    }
+
+def _dist(values):
+    return { k: (round(v, 1) if k != "n" else v) for k, v in distribution(values).items() }
+
+def summarize_target(samples):
+    ok = [ s for s in samples if "error" not in s ]
+    rates = [ s["tokens_per_s"] for s in ok if s.get("tokens_per_s") ]
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "ttft_ms": _dist([ s["ttft_ms"] for s in ok ]),
+        "total_ms": _dist([ s["total_ms"] for s in ok ]),
+        "tokens_per_s": round(sum(rates) / len(rates), 1) if rates else None,
+        "words": _dist([ s["words"] for s in ok ]),
+    }
+
+def run(targets, corpus, repeat=1, max_tokens=70, temperature=0.5, offline=False, profile=None, report=None, stdout=print):
+    servers = {}
+    results = {}
+    if not offline:
+        _load_keys()
+    try:
+        for spec in targets:
+            target = parse_target(spec)
+            try:
+                if target["vendor"] == AIVendor.MOCK:
+                    provider = _mock_provider(target, profile)
+                elif offline:
+                    provider = _offline_provider(target, servers, profile)
+                else:
+                    provider = _create_provider(target["vendor"], target["model"])
+            except Exception as e:
+                stdout(f"Skipping {spec}: {e}")
+                continue
+            stdout(f"Replaying {len(corpus)} turns x{repeat} against {spec} ({provider.model})")
+            samples = []
+            for _ in range(repeat):
+                for turn in corpus:
+                    sample = measure(provider, turn["messages"], max_tokens, temperature)
+                    sample["turn"] = turn["id"]
+                    samples.append(sample)
+            results[spec] = { "model": provider.model, "summary": summarize_target(samples), "samples": samples }
+    finally:
+        for server in servers.values():
+            server.stop()
+
+    rows = []
+    for spec, res in results.items():
+        s = res["summary"]
+        rows.append([ spec, s["requests"], s["errors"],
+                      s["ttft_ms"]["p50"], s["ttft_ms"]["p95"],
+                      s["total_ms"]["p50"], s["total_ms"]["p95"],
+                      s["tokens_per_s"] if s["tokens_per_s"] is not None else "-",
+                      s["words"]["p50"], s["words"]["p95"], s["words"]["max"] ])
+    stdout("")
+    print_table([ "target", "n", "err", "ttft_p50", "ttft_p95", "total_p50", "total_p95", "tok/s",
+                  "words_p50", "words_p95", "words_max" ], rows)
+
+    if report:
+        with open(report, "w", encoding="utf-8") as f:
+            json.dump({ "generated": time.strftime("%Y-%m-%dT%H:%M:%S"), "offline": offline, "profile": profile,
+                        "repeat": repeat, "max_tokens": max_tokens, "temperature": temperature,
+                        "targets": results }, f, indent=2, ensure_ascii=False)
+        stdout(f"\nReport written to {report}")
+    return results
+
+def default_targets():
+    return [ f"ollama:{getattr(settings, 'OLLAMA_MODEL', 'llama3')}", f"openai:{getattr(settings, 'OPENAI_MODEL', 'gpt-4o-mini')}" ]
@@ -0,0 +1,70 @@
+'''
+VOICE RULES - Automarkup voice rules per word, parsing rule JSON vs the compiled tables
+
+Times the voice stage of automarkup on sentences drawn from the rule vocabulary: the original way
+(json.loads and an ElementTree element for every matched usel or prosody word, serialized again when
+clamped) against markup_voice's compiled tables.  With the same random seed both must produce the
+same rules; the suite stops if they don't.
+'''
+import random
+from . import suite, time_calls, summarize, print_table
+from ..automarkup import initialize_rules
+from ..automarkup.markup_types import markup_voice
+from ..automarkup.ml import mlparams, mlrules_utils
+
+_LENGTHS = [ 5, 15, 40 ]
+
+# The voice rules per word as they were, without the special mark genre pass
+def _markup_parsing(words, rules):
+    uselTag = mlrules_utils.clean_dict_key_str(mlparams.TAG_USEL)
+    prosodyTag = mlrules_utils.clean_dict_key_str(mlparams.TAG_PROSODY)
+    out = {}
+    for tag in rules.keys():
+        if tag in mlparams.IGNORE_TAGS_LIST:
+            continue
+        applied = []
+        lastUselRule = None
+        for w in words:
+            wordRule = None
+            if w in rules[tag]:
+                wordRule = rules[tag][w][0].associated_str
+                if tag == uselTag:
+                    e = mlrules_utils.deserialize_element(wordRule)
+                    if int(e.attrib["variant"]) > markup_voice.CLAMP_MAX_USEL_VARIANT:
+                        e.attrib["variant"] = str(random.randint(0, markup_voice.CLAMP_MAX_USEL_VARIANT))
+                        wordRule = mlrules_utils.serialize_element(e)
+                    if lastUselRule is not None and lastUselRule["genre"] == e.attrib["genre"]:
+                        e.attrib["variant"] = lastUselRule["variant"]
+                        wordRule = mlrules_utils.serialize_element(e)
+                    lastUselRule = e.attrib
+                if tag == prosodyTag:
+                    e = mlrules_utils.deserialize_element(wordRule)
+                    if e.attrib["rate"] == "x-slow":
+                        e.attrib["rate"] = "slow"
+                        wordRule = mlrules_utils.serialize_element(e)
+                    if e.attrib["volume"] != "medium":
+                        e.attrib["volume"] = "medium"
+                        wordRule = mlrules_utils.serialize_element(e)
+            applied.append(wordRule)
+        out[tag] = applied
+    return out
+
+@suite("voice_rules", help="Automarkup voice rules per word, rule JSON parsing vs compiled tables")
+def run(options):
+    iterations = options.get("iterations") or 1000
+    rules = initialize_rules()
+    vocab = sorted(set(w for tag in rules for w in rules[tag])) + [ "hola", "amigo", "juego" ]
+    rng = random.Random(7)
+    rows = []
+    for n in _LENGTHS:
+        words = [ rng.choice(vocab) for _ in range(n) ] + [ mlparams.CHAR_EOL ]
+        random.seed(1)
+        expected = _markup_parsing(words, rules)
+        random.seed(1)
+        if markup_voice.markup(words, words, rules, markVoiceSpecialMarkGenre=False) != expected:
+            raise RuntimeError(f"Compiled voice rules differ for {words}")
+        old = summarize(time_calls(lambda: _markup_parsing(words, rules), iterations))
+        new = summarize(time_calls(lambda: markup_voice.markup(words, words, rules, markVoiceSpecialMarkGenre=False), iterations))
+        rows.append([ n, old["p50_ms"] * 1000, new["p50_ms"] * 1000, f"{old['mean_ms'] / new['mean_ms']:.1f}x" ])
+    print(f"Voice rules per sentence, {iterations} iterations each (times in microseconds)")
+    print_table([ "words", "parsing_p50_us", "compiled_p50_us", "speedup" ], rows)
@@ -0,0 +1,47 @@
+'''
+XML ASSEMBLY - Automarkup XML assembly, ElementTree round-trip vs direct string building
+
+Marks up 10 to 200-word answers made of rule vocabulary, keeping the spans and words each one
+hands to the assembly step, then times turning those into the markup string: spans_to_xml_etree
+(ElementTree tree, tostring and clean-up) against spans_to_xml.  Both must give the same string;
+the suite stops if they don't.
+'''
+import random
+from . import suite, time_calls, summarize, print_table
+from ..automarkup import process, initialize_rules
+from ..automarkup.markup_core import markup_xmlassembly
+
+_LENGTHS = [ 10, 25, 50, 100, 200 ]
+
+# Spans and words automarkup assembles for the text, one sentence
+def _assembly_input(text, rules):
+    seen = []
+    assemble = markup_xmlassembly.spans_to_xml
+    def keep(spans, words, debug_colors=False):
+        seen.append((list(spans), list(words)))
+        return assemble(spans, words, debug_colors=debug_colors)
+    markup_xmlassembly.spans_to_xml = keep
+    try:
+        process(text, rules, mood_and_intensity=("joy", 0.5))
+    finally:
+        markup_xmlassembly.spans_to_xml = assemble
+    return seen[0]
+
+@suite("xml_assembly", help="Automarkup XML assembly, ElementTree vs direct strings, 10 to 200 words")
+def run(options):
+    iterations = options.get("iterations") or 200
+    rules = initialize_rules()
+    vocab = sorted(set(w for t in rules for w in rules[t]))
+    rng = random.Random(49)
+    random.seed(49)
+    rows = []
+    for words in _LENGTHS:
+        text = " ".join(rng.choice(vocab) + rng.choice([ "", "", "", "," ]) for _ in range(words))
+        spans, marked = _assembly_input(text, rules)
+        if markup_xmlassembly.spans_to_xml(spans, marked) != markup_xmlassembly.spans_to_xml_etree(spans, marked):
+            raise RuntimeError(f"String assembly differs from ElementTree at {words} words")
+        old = summarize(time_calls(lambda: markup_xmlassembly.spans_to_xml_etree(spans, marked), iterations))
+        new = summarize(time_calls(lambda: markup_xmlassembly.spans_to_xml(spans, marked), iterations))
+        rows.append([ words, len(spans), old["p50_ms"] * 1000, new["p50_ms"] * 1000, f"{old['mean_ms'] / new['mean_ms']:.1f}x" ])
+    print(f"Markup XML assembly, {iterations} iterations each (times in microseconds)")
+    print_table([ "words", "spans", "etree_p50_us", "string_p50_us", "speedup" ], rows)
@@ -0,0 +1,31 @@
+# bench_vendors.py
+from django.core.management.base import BaseCommand
+from ...bench import vendors
+from ...mqtt.latency_profiles import PROFILES
+
+class Command(BaseCommand):
+    help = 'Replay a corpus of conversation turns against LLM vendors and compare latency and reply length.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', dest='targets', default=None,
+                            help='vendor:model[@profile] to benchmark, repeatable (vendors: openai, ollama, xai). '
+                                 'Defaults to the configured Ollama and OpenAI models')
+        parser.add_argument('--corpus', default=None, help='JSONL file of turns, one {"id", "messages"} per line')
+        parser.add_argument('--repeat', type=int, default=1, help='Times to replay the corpus per target')
+        parser.add_argument('--max-tokens', type=int, default=70, help='max_tokens for each request')
+        parser.add_argument('--temperature', type=float, default=0.5, help='Temperature for each request')
+        parser.add_argument('--offline', action='store_true', help='Use local stand-in OpenAI/Ollama servers instead of real vendors')
+        parser.add_argument('--profile', default='local_gpu',
+                            help=f'Stand-in latency profile: one of {", ".join(PROFILES)} or key=value pairs')
+        parser.add_argument('--report', default=None, help='Write the full comparison as JSON to this file')
+
+    def handle(self, *args, **options):
+        vendors.run(options['targets'] or vendors.default_targets(),
+                    vendors.load_corpus(options['corpus']),
+                    repeat=options['repeat'],
+                    max_tokens=options['max_tokens'],
+                    temperature=options['temperature'],
+                    offline=options['offline'],
+                    profile=options['profile'],
+                    report=options['report'],
+                    stdout=self.stdout.write)
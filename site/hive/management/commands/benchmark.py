@@ -0,0 +1,19 @@
+# benchmark.py
+from django.core.management.base import BaseCommand
+from ...bench import load_suites
+
+class Command(BaseCommand):
+    help = 'Run a benchmark suite against the hive hot paths.'
+
+    def add_arguments(self, parser):
+        suites = load_suites()
+        parser.add_argument('suite', choices=sorted(suites.keys()),
+                            help='; '.join(f'{name}: {h}' for name,(_,h) in sorted(suites.items())))
+        parser.add_argument('--iterations', type=int, default=1000, help='Iterations for micro-benchmarks')
+        parser.add_argument('--turns', type=int, default=None, help='Conversation turns to replay, for LLM suites')
+        parser.add_argument('--model', default=None, help='Model name, for LLM suites')
+        parser.add_argument('--host', default=None, help='Ollama host URL, for LLM suites')
+
+    def handle(self, *args, **options):
+        func, _ = load_suites()[options['suite']]
+        func(options)
@@ -0,0 +1,39 @@
+# export_transcripts.py
+import json
+import sys
+from datetime import datetime
+from django.core.management.base import BaseCommand
+from ...mqtt.transcripts import get_transcript_store
+
+def _to_ms(value):
+    if value is None:
+        return None
+    if value.isdigit():
+        return int(value)
+    return int(datetime.fromisoformat(value).timestamp() * 1000)
+
+class Command(BaseCommand):
+    help = 'Export stored device transcripts as JSON lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('device_id', nargs='*', help='Devices to export (default all)')
+        parser.add_argument('--module', default=None, help='Only lines from this module ID')
+        parser.add_argument('--since', default=None, help='Start time, ISO format or ms since the epoch')
+        parser.add_argument('--until', default=None, help='End time, ISO format or ms since the epoch')
+        parser.add_argument('--output', default=None, help='Write to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        store = get_transcript_store()
+        devices = options['device_id'] or store.devices()
+        since, until = _to_ms(options['since']), _to_ms(options['until'])
+        out = open(options['output'], 'w', encoding='utf-8') if options['output'] else sys.stdout
+        count = 0
+        try:
+            for device_id in devices:
+                for rec in store.export(device_id, module=options['module'], since_ms=since, until_ms=until):
+                    out.write(json.dumps(rec, ensure_ascii=False) + '\n')
+                    count += 1
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        self.stderr.write(f'Exported {count} lines from {len(devices)} devices')
@@ -0,0 +1,63 @@
+# run_jobs.py
+import concurrent.futures
+import os
+import time
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from ...mqtt import jobs, metrics
+
+class Command(BaseCommand):
+    help = 'Run durable background jobs (chat complete hooks) in a process pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None, help='Worker processes (default JOBS_PROCESSES)')
+        parser.add_argument('--batch-size', type=int, default=None, help='Most jobs sharing a model claimed at once (default JOBS_BATCH_SIZE)')
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds between checks when idle')
+        parser.add_argument('--stats-every', type=float, default=60.0, help='Seconds between throughput reports')
+        parser.add_argument('--once', action='store_true', help='Exit once no jobs are due')
+
+    def handle(self, *args, **options):
+        processes = options['processes'] or getattr(settings, 'JOBS_PROCESSES', 2)
+        batch_size = options['batch_size'] or getattr(settings, 'JOBS_BATCH_SIZE', 8)
+        # worker processes load the app too, keep them from starting their own MQTT client
+        os.environ['HIVE_NO_SERVER'] = '1'
+        run_stat = metrics.latency('jobs.run')
+        counts = { 'done': metrics.counter('jobs.done'), 'retry': metrics.counter('jobs.retried'), 'failed': metrics.counter('jobs.failed') }
+        in_flight = set()
+        last_stats = time.monotonic()
+        done_at_stats = 0
+        self.stdout.write(f'Running background jobs with {processes} processes, batches of up to {batch_size}')
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes, initializer=django.setup) as pool:
+            while True:
+                jobs.reclaim_stale()
+                while len(in_flight) < processes:
+                    pks = jobs.claim_batch(batch_size)
+                    if not pks:
+                        break
+                    # children must open their own database connections
+                    connections.close_all()
+                    in_flight.add(pool.submit(jobs.run_batch, pks))
+                if not in_flight:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll'])
+                else:
+                    finished, _ = concurrent.futures.wait(in_flight, timeout=options['poll'], return_when=concurrent.futures.FIRST_COMPLETED)
+                    for fut in finished:
+                        in_flight.discard(fut)
+                        try:
+                            for pk, outcome, ms in fut.result():
+                                counts[outcome].inc()
+                                run_stat.observe(ms)
+                        except Exception as e:
+                            # the job stays RUNNING and is reclaimed after its lease
+                            self.stderr.write(f'Job batch crashed: {e}')
+                now = time.monotonic()
+                if now - last_stats >= options['stats_every']:
+                    done = counts['done'].value
+                    rate = (done - done_at_stats) / (now - last_stats) * 60
+                    self.stdout.write(f'Jobs: {rate:.1f}/min, backlog {jobs.backlog()}, {metrics.snapshot()["counters"]}')
+                    last_stats, done_at_stats = now, done
+        self.stdout.write(f'No jobs due, {counts["done"].value} done, {counts["retry"].value} retried, {counts["failed"].value} failed')
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hive', '0022_configuracion_espanol'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='singlepromptchat',
+            name='cache_responses',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-19 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hive', '0023_singlepromptchat_cache_responses'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='singlepromptchat',
+            name='hedge_vendor',
+            field=models.IntegerField(blank=True, choices=[(1, 'OPEN_AI'), (2, 'OLLAMA'), (3, 'XAI')], null=True),
+        ),
+        migrations.AddField(
+            model_name='singlepromptchat',
+            name='hedge_model',
+            field=models.CharField(blank=True, default='', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='singlepromptchat',
+            name='hedge_after_ms',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-19 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hive', '0024_singlepromptchat_hedge'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='singlepromptchat',
+            name='max_sentences',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='singlepromptchat',
+            name='max_words',
+            field=models.IntegerField(default=0),
+        ),
+    ]
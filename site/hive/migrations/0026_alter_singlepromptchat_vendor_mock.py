@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-19 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hive', '0025_singlepromptchat_sentence_budget'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='singlepromptchat',
+            name='vendor',
+            field=models.IntegerField(choices=[(1, 'OPEN_AI'), (2, 'OLLAMA'), (3, 'XAI'), (4, 'MOCK')], default=1),
+        ),
+        migrations.AlterField(
+            model_name='singlepromptchat',
+            name='hedge_vendor',
+            field=models.IntegerField(blank=True, choices=[(1, 'OPEN_AI'), (2, 'OLLAMA'), (3, 'XAI'), (4, 'MOCK')], null=True),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-19 14:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hive', '0026_alter_singlepromptchat_vendor_mock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackgroundJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=80)),
+                ('device_id', models.CharField(blank=True, max_length=200, null=True)),
+                ('batch_key', models.CharField(blank=True, default='', max_length=200)),
+                ('payload', models.JSONField()),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('status', models.IntegerField(choices=[(1, 'PENDING'), (2, 'RUNNING'), (3, 'DONE'), (4, 'FAILED'), (5, 'APPLIED')], default=1)),
+                ('attempts', models.IntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('started', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after'], name='job_status_idx')],
+            },
+        ),
+    ]
@@ -2,11 +2,13 @@ from enum import Enum
 from django.db import models
 from django.core.validators import validate_comma_separated_integer_list
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 
 class AIVendor(Enum):
     OPEN_AI = 1
     OLLAMA  = 2
     XAI  = 3
+    MOCK = 4    # scripted responses with simulated latency, for testing (see mqtt/mock_llm.py)
 
 class SinglePromptChat(models.Model):
     name = models.CharField(max_length=200)
@@ -23,6 +25,15 @@ class SinglePromptChat(models.Model):
     max_tokens = models.IntegerField(default=70)
     temperature = models.FloatField(default=0.5)
     code = models.TextField(null=True, blank=True) # Python code for filter methods
+    # cache responses even when temperature > 0, for modules whose replies may repeat across robots
+    cache_responses = models.BooleanField(default=False)
+    # optional secondary vendor, raced against the primary when it hasn't answered in hedge_after_ms
+    hedge_vendor = models.IntegerField(choices=[(tag.value, tag.name) for tag in AIVendor], null=True, blank=True)
+    hedge_model = models.CharField(max_length=200, blank=True, default="")
+    hedge_after_ms = models.IntegerField(default=0)
+    # stop generating once a reply has this many sentences / words, 0 for no limit
+    max_sentences = models.IntegerField(default=0)
+    max_words = models.IntegerField(default=0)
     source_version = models.IntegerField(default=1)
     
     def __str__(self):
@@ -43,6 +54,9 @@ class SinglePromptChat(models.Model):
 
     def is_grok(self) -> bool:
         return self.vendor_enum == AIVendor.XAI
+
+    def is_mock(self) -> bool:
+        return self.vendor_enum == AIVendor.MOCK
     
 class MoxieSchedule(models.Model):
     name = models.CharField(max_length=200)
@@ -181,4 +195,35 @@ class PersistentData(models.Model):
     data = models.JSONField()
 
     def __str__(self):
-        return f'{self.device} - Data'
\ No newline at end of file
+        return f'{self.device} - Data'
+
+
+class JobStatus(Enum):
+    PENDING = 1
+    RUNNING = 2
+    DONE = 3      # finished in the job worker, results not yet merged back by the hive
+    FAILED = 4    # out of attempts
+    APPLIED = 5
+
+# Durable background work (conversation complete hooks), run by the run_jobs worker command
+class BackgroundJob(models.Model):
+    kind = models.CharField(max_length=80)
+    device_id = models.CharField(max_length=200, null=True, blank=True)
+    batch_key = models.CharField(max_length=200, blank=True, default='')  # vendor/model, jobs sharing one run together
+    payload = models.JSONField()
+    result = models.JSONField(null=True, blank=True)
+    status = models.IntegerField(choices=[(tag.value, tag.name) for tag in JobStatus],default=JobStatus.PENDING.value)
+    attempts = models.IntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind}-{self.pk}-{JobStatus(self.status).name}'
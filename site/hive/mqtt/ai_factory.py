@@ -1,9 +1,20 @@
 from openai import OpenAI
+import concurrent.futures
+import contextvars
 import logging
+import threading
+import time
 import ollama
 from typing import List, Dict, Any, Generator, Union
 from django.conf import settings
 from ..models import AIVendor
+from .llm_cache import ResponseCache, get_response_cache
+from .vendor_guard import get_vendor_guard
+from .ollama_pool import OllamaPool, get_ollama_hosts, get_ollama_pool
+from .model_residency import get_residency_manager
+from .cancellation import Cancelled, ChildToken, current_token, use_token
+from .sentence_budget import SentenceBudget, STOP_SEQUENCES, apply_budget
+from . import metrics
 # NEW: xai-sdk (sync)
 try:
     from xai_sdk import Client as XAIClient
@@ -31,7 +42,7 @@ def set_xai_key(key):  # <— NEW
 def create_openai():
     """Used by Whisper/STT and any legacy OpenAI chat paths."""
     global _OPENAPI_KEY
-    return OpenAI(api_key=_OPENAPI_KEY)
+    return OpenAI(api_key=_OPENAPI_KEY, timeout=getattr(settings, "LLM_TIMEOUT", 30.0))
 
 
 
@@ -47,9 +58,14 @@ def create_xai():
     if not _XAI_SDK_OK:
         raise RuntimeError("xai-sdk not installed. Run `pip install xai-sdk`.")
     base = getattr(settings, "XAI_BASE_URL", None)  # usually None; SDK has default
+    kwargs = {"api_key": _XAI_API_KEY}
     if base:
-        return XAIClient(api_key=_XAI_API_KEY, base_url=base)
-    return XAIClient(api_key=_XAI_API_KEY)
+        kwargs["base_url"] = base
+    try:
+        return XAIClient(timeout=getattr(settings, "LLM_TIMEOUT", 30.0), **kwargs)
+    except TypeError:
+        # Older SDKs have no client timeout; the vendor guard still caps in-flight calls
+        return XAIClient(**kwargs)
 
 
 
@@ -67,20 +83,38 @@ class LLMProvider:
         raise NotImplementedError
 
 class OpenAIProvider(LLMProvider):
-    def __init__(self, model: str):
+    def __init__(self, model: str, client=None):
         self.model = model
-        self.client = create_openai()
+        self.client = client or create_openai()
 
     def chat(self, messages, temperature=0.7, stream=False, **kwargs):
         max_tokens = kwargs.get("max_tokens")
-        # (streaming optional later; keep behavior identical to current non-stream)
+        max_sentences = kwargs.get("max_sentences")
+        max_words = kwargs.get("max_words")
+        extra = {"stop": STOP_SEQUENCES} if (max_sentences or max_words) else {}
+        if stream:
+            chunks = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                **extra
+            )
+            def gen():
+                for chunk in chunks:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        yield delta
+            return gen()
         resp = self.client.chat.completions.create(
             model=self.model,
             messages=messages,
             temperature=temperature,
-            max_tokens=max_tokens
+            max_tokens=max_tokens,
+            **extra
         )
-        return resp.choices[0].message.content
+        return apply_budget(resp.choices[0].message.content, max_sentences, max_words)
 
 # --- xAI provider (Grok) ---
 '''
@@ -166,16 +200,19 @@ class XAIProvider(LLMProvider):
                 (p.get("text", "") if isinstance(p, dict) else str(p))
                 for p in text
             )
-        return text or ""
+        return apply_budget(text or "", kwargs.get("max_sentences"), kwargs.get("max_words"))
 
 
 class OllamaProvider(LLMProvider):
     def __init__(self, host: str, model: str):
         self.model = model
         import ollama
-        self.client = ollama.Client(host=host)
+        self.client = ollama.Client(host=host, timeout=getattr(settings, "LLM_TIMEOUT", 30.0))
 
     def chat(self, messages, temperature=0.7, stream=False, **kwargs):
+        return self._chat(self.client, messages, temperature, stream, **kwargs)
+
+    def _chat(self, client, messages, temperature, stream, **kwargs):
         num_predict = kwargs.get("max_tokens")
         options = {"temperature": temperature}
         #if num_predict is not None:
@@ -183,51 +220,232 @@ class OllamaProvider(LLMProvider):
 
         if isinstance(num_predict, int) and num_predict > 0:
             options["num_predict"] = num_predict
-        # else: omit -> unlimited
-
+        else:
+            # never generate without a limit, Moxie won't say it anyway
+            options["num_predict"] = getattr(settings, "OLLAMA_NUM_PREDICT", 256)
+        budget = SentenceBudget(kwargs.get("max_sentences"), kwargs.get("max_words"))
+        if budget.active:
+            options["stop"] = STOP_SEQUENCES
+
+        residency = get_residency_manager()
+        residency.record_use(self.model)
         payload = {
             "model": self.model,
             "messages": messages,
             "options": options,
             "stream": stream,
+            "keep_alive": residency.keep_alive_for(self.model),
         }
+        token = current_token()
         if stream:
-            def gen():
-                for chunk in self.client.chat(**payload):
-                    msg = chunk.get("message") or {}
-                    delta = msg.get("content", "")
-                    if delta:
-                        yield delta
-            return gen()
-        else:
-            resp = self.client.chat(**payload)
-            return (resp.get("message") or {}).get("content", "")
+            return self._stream(client, payload, residency, token)
+        if token or budget.active:
+            # stream under the hood, so a superseded volley or a spent budget can drop the connection
+            # and stop generation
+            payload["stream"] = True
+            chunks = self._stream(client, payload, residency, token)
+            try:
+                for delta in chunks:
+                    if budget.feed(delta):
+                        break
+            finally:
+                chunks.close()
+            return budget.finish()
+        resp = client.chat(**payload)
+        residency.observe_response(self.model, resp)
+        return (resp.get("message") or {}).get("content", "")
+
+    def _stream(self, client, payload, residency, token=None):
+        chunks = client.chat(**payload)
+        try:
+            for chunk in chunks:
+                if token and token.cancelled:
+                    # closing the stream disconnects, and Ollama stops generating
+                    metrics.counter("llm.ollama.aborted").inc()
+                    raise Cancelled(f"Ollama request for {self.model} aborted")
+                if chunk.get("done"):
+                    residency.observe_response(self.model, chunk)
+                msg = chunk.get("message") or {}
+                delta = msg.get("content", "")
+                if delta:
+                    yield delta
+        finally:
+            close = getattr(chunks, "close", None)
+            if close:
+                close()
+
+class OllamaPoolProvider(OllamaProvider):
+    """Ollama across the OLLAMA_HOSTS pool, each request on the least loaded host with the model resident."""
+    def __init__(self, pool: OllamaPool, model: str):
+        self.model = model
+        self.pool = pool
 
+    def chat(self, messages, temperature=0.7, stream=False, **kwargs):
+        host = self.pool.acquire(self.model)
+        start = time.monotonic()
+        try:
+            resp = self._chat(host.client, messages, temperature, stream, **kwargs)
+        except BaseException:
+            self.pool.release(host, 0, ok=False)
+            raise
+        if not stream:
+            self.pool.release(host, (time.monotonic() - start) * 1000, self.model)
+            return resp
+        def gen():
+            ok = False
+            try:
+                yield from resp
+                ok = True
+            finally:
+                self.pool.release(host, (time.monotonic() - start) * 1000, self.model, ok=ok)
+        return gen()
+
+
+
+
+
+# --- Vendor guard and hedging wrappers ----------------------------------------
+class GuardedProvider(LLMProvider):
+    """Runs every call through the vendor's shared concurrency limit and circuit breaker."""
+    def __init__(self, provider: LLMProvider, vendor: AIVendor):
+        self.provider = provider
+        self.model = provider.model
+        self.guard = get_vendor_guard(vendor)
+
+    def chat(self, messages, temperature=0.7, stream=False, **kwargs):
+        call = lambda: self.provider.chat(messages, temperature=temperature, stream=stream, **kwargs)
+        return self.guard.stream(call) if stream else self.guard.call(call)
+
+# Threads for hedged requests, shared by all sessions and sized by HEDGE_WORKERS.  Both legs of a hedged
+# request run here, and a losing leg keeps its thread until its vendor call ends.
+_HEDGE_POOL = None
+_HEDGE_POOL_LOCK = threading.Lock()
+
+def _hedge_pool():
+    global _HEDGE_POOL
+    with _HEDGE_POOL_LOCK:
+        if _HEDGE_POOL is None:
+            _HEDGE_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=getattr(settings, "HEDGE_WORKERS", 16),
+                                                                thread_name_prefix="hive-hedge")
+        return _HEDGE_POOL
+
+class HedgedProvider(LLMProvider):
+    """
+    Sends the request to the primary provider, and if it hasn't answered within hedge_after seconds (or
+    fails), sends the same request to the secondary.  Both run on the hedge pool and the first good
+    answer is returned as soon as it arrives.  The losing request is cancelled through its own cancel
+    token and left to finish in the background, since most vendor calls can't be aborted.  Streaming
+    requests go to the primary only.
+    """
+    def __init__(self, primary: LLMProvider, secondary: LLMProvider, hedge_after: float):
+        self.primary = primary
+        self.secondary = secondary
+        self.model = primary.model
+        self.hedge_after = hedge_after
+        self._fired = metrics.counter("llm.hedge.fired")
+        self._won = metrics.counter("llm.hedge.won")
 
+    def chat(self, messages, temperature=0.7, stream=False, **kwargs):
+        if stream:
+            return self.primary.chat(messages, temperature=temperature, stream=True, **kwargs)
+        volley_token = current_token()
+
+        def leg(provider, token):
+            with use_token(token):
+                return provider.chat(messages, temperature=temperature, stream=False, **kwargs)
+
+        # each leg runs in a copy of our context under its own token, cancelled with the volley's
+        def submit(provider):
+            token = ChildToken(volley_token)
+            return _hedge_pool().submit(contextvars.copy_context().run, leg, provider, token), token
+
+        primary, primary_token = submit(self.primary)
+        done, _ = concurrent.futures.wait([ primary ], timeout=self.hedge_after)
+        if done and not primary.exception():
+            return primary.result()
+        if volley_token:
+            volley_token.raise_if_cancelled()
+        self._fired.inc()
+        secondary, secondary_token = submit(self.secondary)
+        legs = { primary: secondary_token, secondary: primary_token }
+        pending = set(legs)
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if not future.exception():
+                    # the other leg is given up, its result is dropped whenever it comes
+                    legs[future].cancel()
+                    if future is secondary:
+                        self._won.inc()
+                    return future.result()
+        # both failed, report the primary's error
+        raise primary.exception()
+
+
+# --- Response cache wrapper ---------------------------------------------------
+class CachedProvider(LLMProvider):
+    """
+    Serves repeated requests from the shared response cache, and coalesces identical
+    requests in flight into one upstream call.  Only deterministic requests (temperature 0)
+    are cached unless always_cache is set; streaming requests always go upstream.
+    """
+    def __init__(self, provider: LLMProvider, vendor: AIVendor, cache: ResponseCache, always_cache=False):
+        self.provider = provider
+        self.vendor = vendor
+        self.model = provider.model
+        self.cache = cache
+        self.always_cache = always_cache
 
+    def chat(self, messages, temperature=0.7, stream=False, **kwargs):
+        if stream or not (self.always_cache or temperature == 0):
+            return self.provider.chat(messages, temperature=temperature, stream=stream, **kwargs)
+        key = ResponseCache.make_key(self.vendor, self.model, messages, temperature, kwargs.get("max_tokens"),
+                                     budget=[kwargs.get("max_sentences"), kwargs.get("max_words")])
+        return self.cache.get_or_call(key, lambda: self.provider.chat(messages, temperature=temperature, stream=False, **kwargs))
 
 
 # ---- Factory ----------------------------------------------------------------
 
-def get_llm_provider_from_vendor(vendor: AIVendor, model: str) -> LLMProvider:
+def get_llm_provider_from_vendor(vendor: AIVendor, model: str, cache_responses: bool = False,
+                                 hedge_vendor: AIVendor = None, hedge_model: str = None, hedge_after_ms: int = 0) -> LLMProvider:
     """
     Create a chat provider based on DB-selected vendor enum.
     - vendor: AIVendor.OPEN_AI or AIVendor.OLLAMA
     - model: model name stored with the chat (e.g., "gpt-4o-mini" or "llama3")
+    - cache_responses: cache non-deterministic responses too (SinglePromptChat.cache_responses)
+    - hedge_vendor/hedge_model/hedge_after_ms: secondary vendor to race when the primary is slow
     """
     # normalize in case an int slipped through
     if not isinstance(vendor, AIVendor):
         vendor = AIVendor(int(vendor))
 
+    provider = GuardedProvider(_create_provider(vendor, model), vendor)
+    if hedge_vendor is not None and hedge_after_ms:
+        if not isinstance(hedge_vendor, AIVendor):
+            hedge_vendor = AIVendor(int(hedge_vendor))
+        secondary = GuardedProvider(_create_provider(hedge_vendor, hedge_model), hedge_vendor)
+        provider = HedgedProvider(provider, secondary, hedge_after_ms / 1000)
+    cache = get_response_cache()
+    if cache.enabled:
+        return CachedProvider(provider, vendor, cache, always_cache=cache_responses)
+    return provider
+
+def _create_provider(vendor: AIVendor, model: str) -> LLMProvider:
     if vendor == AIVendor.OLLAMA:
-        host = getattr(settings, "OLLAMA_HOST", "http://127.0.0.1:11434")
         fallback = getattr(settings, "OLLAMA_MODEL", "llama3")
-        return OllamaProvider(host=host, model=(model or fallback))
+        hosts = get_ollama_hosts()
+        if len(hosts) > 1:
+            return OllamaPoolProvider(get_ollama_pool(), model=(model or fallback))
+        return OllamaProvider(host=hosts[0], model=(model or fallback))
 
     if vendor == AIVendor.XAI:
         fallback = getattr(settings, "XAI_MODEL", "grok-3-mini")
         return XAIProvider(model=(model or fallback))
 
+    if vendor == AIVendor.MOCK:
+        from .mock_llm import MockProvider
+        return MockProvider(model=model)
+
 
     # default OPEN_AI
     fallback = getattr(settings, "OPENAI_MODEL", "gpt-3.5-turbo")
@@ -0,0 +1,103 @@
+'''
+CANCELLATION - Per-device volley tokens for cooperative cancellation of in-flight work
+
+Each volley being worked on for a device holds a token.  A newer volley from the same device, or a
+telehealth interrupt, cancels the older token.  Code doing slow work checks the token of the volley it
+is running for (current_token) and gives up early; providers that stream can abort the request to the
+vendor, and RemoteChat drops any result whose token was cancelled instead of publishing it.
+
+The token travels with the work in a context variable, so it follows calls into helper threads that
+run with a copy of the caller's context.
+'''
+import contextvars
+import logging
+import threading
+from contextlib import contextmanager
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+class Cancelled(Exception):
+    pass
+
+class CancelToken:
+    def __init__(self, name=""):
+        self.name = name
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        self._event.set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise Cancelled(f"Volley {self.name} was superseded")
+
+# A token that is also cancelled with its parent, for part of a volley's work that can be given up alone
+class ChildToken(CancelToken):
+    def __init__(self, parent, name=""):
+        super().__init__(name or (parent.name if parent else ""))
+        self._parent = parent
+
+    @property
+    def cancelled(self):
+        return self._event.is_set() or (self._parent is not None and self._parent.cancelled)
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise Cancelled(f"Volley {self.name} was superseded")
+
+_current = contextvars.ContextVar("hive_cancel_token", default=None)
+
+# The token of the volley this code is running for, None outside of one
+def current_token():
+    return _current.get()
+
+def raise_if_cancelled():
+    token = _current.get()
+    if token:
+        token.raise_if_cancelled()
+
+# Run a block of code on behalf of a token
+@contextmanager
+def use_token(token):
+    reset = _current.set(token)
+    try:
+        yield token
+    finally:
+        _current.reset(reset)
+
+class VolleyTokens:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = {}
+        self._cancelled = metrics.counter("volley.cancelled")
+
+    # Start a new volley for a device, cancelling the one it supersedes
+    def begin(self, device_id, name=""):
+        token = CancelToken(name)
+        with self._lock:
+            previous = self._tokens.get(device_id)
+            self._tokens[device_id] = token
+        if previous and not previous.cancelled:
+            self._cancel(device_id, previous)
+        return token
+
+    def cancel(self, device_id):
+        with self._lock:
+            token = self._tokens.pop(device_id, None)
+        if token and not token.cancelled:
+            self._cancel(device_id, token)
+
+    def finish(self, device_id, token):
+        with self._lock:
+            if self._tokens.get(device_id) is token:
+                del self._tokens[device_id]
+
+    def _cancel(self, device_id, token):
+        logger.info(f"Cancelling volley {token.name} for {device_id}")
+        self._cancelled.inc()
+        token.cancel()
@@ -5,11 +5,14 @@ import os
 
 import logging
 import copy
+import difflib
 import random
 import re
 import traceback
-from django.template import Template, Context
+from django.conf import settings
 from .ai_factory import create_openai, get_llm_provider_from_vendor#, _hive 
+from .cancellation import Cancelled
+from .prompt_compiler import compile_prompt, FrozenMessage
 from ..models import SinglePromptChat, AIVendor
 
 from .volley import Volley
@@ -18,6 +21,31 @@ logger = logging.getLogger(__name__)
 
 _DEFAULT_SUMMARY_PROMPT = "Summarize the following conversation between the friendly robot Moxie, and the user.  Keep the summary brief, but include any important details."
 
+# Prompt layouts (settings.PROMPT_LAYOUT).  CLASSIC renders the prompt into the leading system message
+# every volley.  STABLE_PREFIX keeps the first rendering of the session as the leading message, so the
+# request prefix stays byte-identical and local LLMs can reuse their KV cache, and sends the lines that
+# volley data changed since then as a trailing system message after the history, labelled as overriding
+# the leading one.  A line dropped from the prompt can't be overridden that way, so the prefix is
+# rendered again when a volley removes one.
+PROMPT_LAYOUT_CLASSIC = "classic"
+PROMPT_LAYOUT_STABLE_PREFIX = "stable_prefix"
+
+_DELTA_LABEL = "Context update. Where it differs from the instructions above, follow this instead:"
+
+# Lines of a prompt rendering that are new or changed compared to the stable prefix rendering, or None
+# if the rendering dropped lines of the prefix
+def _prompt_delta(prefix, ctx):
+    base = prefix.splitlines()
+    current = ctx.splitlines()
+    lines = []
+    for op, i1, i2, j1, j2 in difflib.SequenceMatcher(a=base, b=current, autojunk=False).get_opcodes():
+        # fewer lines in place of more, so some of the prefix's lines are gone
+        if op == 'delete' or (op == 'replace' and i2 - i1 > j2 - j1):
+            return None
+        if op in ('replace', 'insert'):
+            lines.extend(current[j1:j2])
+    return "\n".join(lines)
+
 '''
 Base type of a module that has a chat session interaction on Moxie.  It
 manages the history, rotating out records to keep tokens more lean.
@@ -59,6 +87,10 @@ class ChatSession:
     def get_opener(self, msg='Welcome to open chat'):
         return msg,self.overflow()
 
+    # Choose the opener ahead of the prompt volley so it can be prepared early, None if it can't be known
+    def prepare_opener(self):
+        return None
+
     def ingest_notify(self, volley:Volley):
         rcr = volley.request
         # RULES - speech field is what 'assistant' said, but we should skip the [animation]
@@ -70,7 +102,7 @@ class ChatSession:
         if speech and 'animation:' not in speech and 'silent:' not in speech:
             self.add_history('assistant', speech)
 
-    def next_response(self, speech, context):
+    def next_response(self, speech, context, trailer=None):
         logger.debug(f'Inference using history:\n{self._history}')
         return f"chat history {len(self._history)}", None
 
@@ -104,7 +136,14 @@ class SingleContextChatSession(ChatSession):
                  max_tokens=70,
                  temperature=0.5,
                  exit_line="Well, that was fun.  Let's move on.",
-                 vendor: AIVendor = AIVendor.OPEN_AI
+                 vendor: AIVendor = AIVendor.OPEN_AI,
+                 prompt_layout=None,
+                 cache_responses=False,
+                 hedge_vendor=None,
+                 hedge_model=None,
+                 hedge_after_ms=0,
+                 max_sentences=0,
+                 max_words=0
                  ):
         super().__init__(max_history)
         self._max_volleys = max_volleys        
@@ -121,7 +160,15 @@ class SingleContextChatSession(ChatSession):
         self._post_filter = None
         self._notify_handler = None
         self._complete_handler = None
-        self._prompt_template = Template(prompt)
+        self._prompt = compile_prompt(prompt)
+        self._prompt_layout = prompt_layout or getattr(settings, "PROMPT_LAYOUT", PROMPT_LAYOUT_CLASSIC)
+        self._stable_prefix = None
+        self._stable_message = None
+        self._next_opener = None
+        self._cache_responses = cache_responses
+        self._hedge = { "hedge_vendor": hedge_vendor, "hedge_model": hedge_model, "hedge_after_ms": hedge_after_ms }
+        self._max_sentences = max_sentences
+        self._max_words = max_words
         # default vendor (can be overridden by DB subclass)
         self._vendor = AIVendor.OPEN_AI
 
@@ -138,13 +185,37 @@ class SingleContextChatSession(ChatSession):
     # Check if we exceed max volleys for a conversation
     def overflow(self):
         return self._total_volleys >= self._max_volleys
+
+    def reset(self):
+        super().reset()
+        self._stable_prefix = None
+        self._stable_message = None
     
-    # Render an updated prompt context for this volley
+    # Render an updated prompt context for this volley, as (leading, trailing) message lists that
+    # go before and after the history
     def make_volley_context(self, volley:Volley):
-        ctx = self._prompt_template.render(Context({'volley': volley, 'session': self}))
-        return [ { "role": "system", 
-                    "content": ctx
-                    } ]
+        if self._prompt.is_static:
+            # nothing in the prompt depends on the volley, every layout sends the same shared message
+            return [ self._prompt.message ], []
+        ctx = self._prompt.render({'volley': volley, 'session': self})
+        if self._prompt_layout != PROMPT_LAYOUT_STABLE_PREFIX:
+            return [ { "role": "system", 
+                        "content": ctx
+                        } ], []
+        delta = None
+        if self._stable_prefix is not None and ctx != self._stable_prefix:
+            delta = _prompt_delta(self._stable_prefix, ctx)
+            if delta is None:
+                # lines the prefix still has are gone from the prompt, start a new prefix without them
+                self._stable_prefix = None
+        if self._stable_prefix is None:
+            self._stable_prefix = ctx
+            self._stable_message = FrozenMessage(role="system", content=ctx)
+        leading = [ self._stable_message ]
+        if not delta:
+            return leading, []
+        # volley data changed the prompt, keep the prefix and send the changed lines last
+        return leading, [ { "role": "system", "content": f"{_DELTA_LABEL}\n{delta}" } ]
     
     # Handle Moxie saying something, accumulate to history
     def ingest_notify(self, volley:Volley):
@@ -173,7 +244,8 @@ class SingleContextChatSession(ChatSession):
                 text,overflow = self.get_opener()
             else:
                 speech = "hm" if volley.request.get("command")=="reprompt" else volley.request["speech"]
-                text,overflow = self.next_response(speech, self.make_volley_context(volley))
+                context, trailer = self.make_volley_context(volley)
+                text,overflow = self.next_response(speech, context, trailer)
             volley.set_output(text, None)
             if overflow:
                 volley.add_launch_or_exit()
@@ -183,6 +255,9 @@ class SingleContextChatSession(ChatSession):
                 self._post_filter(volley, self)
             # handle any actions tags in the response
             volley.ingest_action_tags()
+        except Cancelled:
+            # superseded by a newer volley, nobody will hear this one
+            raise
         except Exception as e:
             stack = traceback.format_exc()
             logger.error(f"Error handling volley: {e}\n{stack}")
@@ -191,7 +266,7 @@ class SingleContextChatSession(ChatSession):
             volley.set_output(err_text,err_text)
 
     # Get the next thing we should say, given the user speech and the history
-    def next_response(self, speech, context):
+    def next_response(self, speech, context, trailer=None):
         of = self.overflow()
         if self._auto_history:
             # accumulating automatically, no interruptions or aborts
@@ -204,7 +279,7 @@ class SingleContextChatSession(ChatSession):
         try:
             # DEBUG: helpful logs while wiring        
             logger.info(f"Using vendor={getattr(self._vendor,'name',self._vendor)}, model={self._model}")
-            provider = get_llm_provider_from_vendor(self._vendor, self._model)
+            provider = get_llm_provider_from_vendor(self._vendor, self._model, cache_responses=self._cache_responses, **self._hedge)
             logger.info(f"Provider class: {provider.__class__.__name__}")            
 
             #if self._vendor == AIVendor.XAI:
@@ -214,11 +289,15 @@ class SingleContextChatSession(ChatSession):
 
 
             resp = provider.chat(
-                messages=context + history,
+                messages=context + history + (trailer or []),
                 temperature=self._temperature,
                 stream=False,
-                max_tokens=self._max_tokens
+                max_tokens=self._max_tokens,
+                max_sentences=self._max_sentences,
+                max_words=self._max_words
             )
+        except Cancelled:
+            raise
         except Exception as e:
             logger.warning(f'Exception attempting inference: {e}')
             resp = "Oh no.  I have run into a bug"
@@ -230,20 +309,28 @@ class SingleContextChatSession(ChatSession):
     
     # Prompt in this case is an opener line to say when we start the conversation module
     def get_opener(self):
-        # Supports multiple random prompts separated by |, pick a random one
-        opener = random.choice(self._opener.split('|'))
+        # Supports multiple random prompts separated by |, pick a random one unless prepared already
+        opener = self._next_opener or random.choice(self._opener.split('|'))
+        self._next_opener = None
         resp,overflow = super().get_opener(msg=opener)
         if self._auto_history:
             self.add_history('assistant', resp)
         return resp,overflow
     
+    def prepare_opener(self):
+        # a pre-filter may answer the prompt volley itself
+        if self._pre_filter:
+            return None
+        self._next_opener = random.choice(self._opener.split('|'))
+        return self._next_opener
+
     def summarize(self, model=None, prompt_base=None, max_tokens=None, append_transcript=True):
         try:
             if not model:
                 model = self._model
             if not max_tokens:
                 max_tokens = self._max_tokens
-            provider = get_llm_provider_from_vendor(self._vendor, model)
+            provider = get_llm_provider_from_vendor(self._vendor, model, cache_responses=self._cache_responses, **self._hedge)
             prompt = prompt_base if prompt_base else _DEFAULT_SUMMARY_PROMPT
             if append_transcript:
                 # Concatenate the chat history into a single string
@@ -254,12 +341,11 @@ class SingleContextChatSession(ChatSession):
                 "content": prompt
                 } ]
             resp = provider.chat(
-                    model=model,
                     messages=msgs,
                     max_tokens=max_tokens,
                     temperature=self._temperature,
                     stream=False,
-                    ).choices[0].message.content
+                    )
             return resp
         except Exception as e:
             stack = traceback.format_exc()
@@ -281,7 +367,10 @@ class SingleContextChatSession(ChatSession):
 class SinglePromptDBChatSession(SingleContextChatSession):
     def __init__(self, pk):
         source = SinglePromptChat.objects.get(pk=pk)
-        super().__init__(max_history=source.max_history, max_volleys=source.max_volleys, model=source.model, prompt=source.prompt, opener=source.opener, max_tokens=source.max_tokens, temperature=source.temperature)
+        self.chat_pk = pk
+        super().__init__(max_history=source.max_history, max_volleys=source.max_volleys, model=source.model, prompt=source.prompt, opener=source.opener, max_tokens=source.max_tokens, temperature=source.temperature, cache_responses=source.cache_responses,
+                         hedge_vendor=source.hedge_vendor, hedge_model=source.hedge_model, hedge_after_ms=source.hedge_after_ms,
+                         max_sentences=source.max_sentences, max_words=source.max_words)
         # pick vendor from the DB row
         self._vendor = source.vendor_enum
 
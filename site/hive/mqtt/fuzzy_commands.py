@@ -0,0 +1,163 @@
+'''
+FUZZY COMMANDS - Catch global commands that speech-to-text got slightly wrong
+
+Global commands are exact regexes, so "moxi time" or "moxie thyme" miss "^moxie time$" and go
+to the LLM instead.  Patterns that are only literal phrases (with alternations and optional parts,
+see pattern_matcher.literal_phrases) are indexed here for an approximate match that runs only when
+no pattern matched exactly.
+
+Phrases and speech are reduced to a rough phonetic key (accents dropped, "th"->"t", "v"->"b",
+"ce"->"se", silent "h" removed, doubled letters collapsed, ...), then to character trigrams.  A
+lookup counts shared trigrams per phrase with one NumPy bincount, keeps the few phrases missing the
+fewest, and checks those with an edit distance bounded by the confidence threshold (a phrase missing
+more trigrams than its allowed edits could break is skipped without one).  The fewest edits wins,
+ties going to the pattern that sorts first.  A command fires
+only if 1 - distance / length reaches FUZZY_COMMANDS_THRESHOLD.  Phrases shorter than
+FUZZY_COMMANDS_MIN_LENGTH are left out, since a couple of edits turns any short phrase into another.
+The same goes for words: a phrase's words shorter than 5 letters ("go", "stop", "time") must appear
+in the speech with the same key, so edits only go to its longer words and "moxie no" or "moxie shop"
+are left to the LLM instead of running "moxie go" or "moxie stop".
+'''
+import re
+import numpy as np
+from unidecode import unidecode
+from .pattern_matcher import literal_phrases
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+_SOUNDS = [
+    (re.compile(r"ph"), "f"),
+    (re.compile(r"th"), "t"),
+    (re.compile(r"qu|k|c(?![eihs])"), "k"),
+    (re.compile(r"c(?=[ei])|z"), "s"),
+    (re.compile(r"v"), "b"),
+    (re.compile(r"y|ll"), "i"),
+    (re.compile(r"(?<![cs])h"), ""),
+    (re.compile(r"([a-z])\1+"), r"\1"),
+]
+
+# Folded, roughly phonetic form of a phrase, so common mishearings map to nearby keys
+def phonetic_key(text):
+    key = _NON_WORD.sub(" ", unidecode(text).lower()).strip()
+    for pattern, repl in _SOUNDS:
+        key = pattern.sub(repl, key)
+    return key
+
+def _trigrams(key):
+    padded = f"  {key} "
+    return { padded[i:i+3] for i in range(len(padded) - 2) }
+
+# Edit distance between a and b, or None once it must exceed limit.  Only cells within limit of the
+# diagonal can stay under it, so each row is computed over that band alone.
+def bounded_distance(a, b, limit):
+    if abs(len(a) - len(b)) > limit:
+        return None
+    over = limit + 1
+    prev = [ j if j <= limit else over for j in range(len(b) + 1) ]
+    for i, ca in enumerate(a, 1):
+        lo, hi = max(1, i - limit), min(len(b), i + limit)
+        cur = [ over ] * (len(b) + 1)
+        if i <= limit:
+            cur[0] = i
+        best = cur[0]
+        for j in range(lo, hi + 1):
+            d = min(prev[j] + 1, cur[j-1] + 1, prev[j-1] + (ca != b[j-1]))
+            cur[j] = d
+            if d < best:
+                best = d
+        if best > limit:
+            return None
+        prev = cur
+    return prev[-1] if prev[-1] <= limit else None
+
+class FuzzyMatch:
+    def __init__(self, index, phrase, confidence):
+        self.index = index
+        self.phrase = phrase
+        self.confidence = confidence
+
+class FuzzyCommandIndex:
+    def __init__(self, patterns, threshold=0.85, min_length=6, candidates=8, short_word=5):
+        self._threshold = threshold
+        self._candidates = candidates
+        # one entry per phrase: pattern index, literal phrase, its key, and whether speech must end with it
+        self._entries = []
+        # per entry, the words of its key too short to take an edit
+        self._fixed = []
+        self._exact = {}
+        seen = set()
+        grams = {}
+        for i, pattern in enumerate(patterns):
+            found = literal_phrases(pattern)
+            if not found:
+                continue
+            phrases, anchored = found
+            for phrase in phrases:
+                key = phonetic_key(phrase)
+                # spellings with the same key ("moxy", "moxi") are one entry
+                if len(key) < min_length or (key, i) in seen:
+                    continue
+                seen.add((key, i))
+                entry = len(self._entries)
+                self._exact.setdefault(key, entry)
+                self._entries.append((i, phrase, key, anchored))
+                self._fixed.append({ w for w in key.split(" ") if len(w) < short_word })
+                for g in _trigrams(key):
+                    grams.setdefault(g, []).append(entry)
+        self._grams = { g: np.array(ids, dtype=np.int32) for g, ids in grams.items() }
+        self._sizes = np.array([ len(_trigrams(e[2])) for e in self._entries ], dtype=np.int32)
+        # edits each phrase may take, each edit breaks at most 3 of its trigrams
+        self._limits = np.array([ int(len(e[2]) * (1 - threshold)) for e in self._entries ], dtype=np.int32)
+        self.size = len(self._entries)
+
+    # The best phrase within the threshold of the speech, or None
+    def match(self, speech):
+        if not self._entries:
+            return None
+        key = phonetic_key(speech)
+        entry = self._exact.get(key)
+        if entry is not None and self._entries[entry][3]:
+            i, phrase, _, _ = self._entries[entry]
+            return FuzzyMatch(i, phrase, 1.0)
+        postings = [ self._grams[g] for g in _trigrams(key) if g in self._grams ]
+        if not postings:
+            return None
+        shared = np.bincount(np.concatenate(postings), minlength=self.size)
+        # phrases missing more trigrams than their edits could break can't be close enough
+        missing = self._sizes - shared
+        possible = np.flatnonzero(missing <= 3 * self._limits)
+        if len(possible) > self._candidates:
+            possible = possible[np.argpartition(missing[possible], self._candidates - 1)[:self._candidates]]
+        # likeliest first, so the band narrows to the best distance found early
+        possible = possible[np.argsort(missing[possible], kind="stable")]
+        best = None
+        best_dist = None
+        words = key.split(" ")
+        for entry in possible:
+            i, phrase, phrase_key, anchored = self._entries[entry]
+            limit = int(self._limits[entry])
+            if best_dist is not None:
+                limit = min(limit, best_dist)
+            if (missing[entry] + 2) // 3 > limit:
+                continue
+            if anchored:
+                texts = [ key ]
+            else:
+                # speech that goes on past the phrase, compared at around the phrase's word count
+                n = phrase_key.count(" ") + 1
+                texts = { " ".join(words[:m]) for m in (n - 1, n, n + 1) if m > 0 }
+            fixed = self._fixed[entry]
+            for text in texts:
+                dist = bounded_distance(text, phrase_key, limit)
+                if dist is None:
+                    continue
+                # an edit inside a short word makes it a different word, not a mishearing
+                if dist and not fixed <= set(text.split(" ")):
+                    continue
+                confidence = 1 - dist / max(len(text), len(phrase_key))
+                if confidence < self._threshold:
+                    continue
+                # fewest edits wins, then the pattern that comes first
+                if best is None or (dist, i) < (best_dist, best.index):
+                    best = FuzzyMatch(i, phrase, confidence)
+                    best_dist = dist
+        return best
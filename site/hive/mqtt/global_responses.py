@@ -11,11 +11,15 @@ possible to avoid triggering them when you don't intend to.  Matching uses searc
 but can be constrained to whole sentence matching using ^moxie time$ for instance to 
 catch "moxie time" but ignore "moxie time is something i dont have"
 '''
-from concurrent.futures import ThreadPoolExecutor,TimeoutError
+from django.conf import settings
 from ..models import GlobalResponse, GlobalAction
 import re
 import logging
 from .volley import Volley
+from .pattern_matcher import PatternMatcher
+from .fuzzy_commands import FuzzyCommandIndex
+from .method_runner import compile_method, get_method_runner, MethodTimeout
+from . import metrics
 from functools import partial
 import traceback
 
@@ -48,25 +52,28 @@ class MethodPattern(ActionPattern):
     def __init__(self, source):
         super().__init__(source)
         self._entity_groups = [int(x) for x in source.entity_groups.split(',') if x] if source.entity_groups else None
+        # compiled once here, run on the shared method runner for every match
+        self.name = source.name
+        self.code = source.code
+        self.key = (source.pk, hash(source.code))
+        self.kind = self.func = None
+        self._load_error = None
+        try:
+            self.kind, self.func = compile_method(self.name, self.code)
+        except Exception as e:
+            logger.error(f"Method code for {source.name} failed to load: {e}")
+            self._load_error = e
+        self._latency = metrics.latency(f"global.method.{self.name}")
 
     def create_response(self, matches, volley):
-        loc = locals()
         try:
-            exec(self._source.code, globals(), loc)
-            func = loc.get('get_response')
-            func_v = loc.get('handle_volley')
-            if func or func_v:
+            if self._load_error:
+                raise self._load_error
+            if self.func:
                 entities = [matches.group(x) for x in self._entity_groups] if self._entity_groups else None
-                # run background, limited at 10s
-                with ThreadPoolExecutor(max_workers=1) as executor:
-                    if func_v:
-                        # handle_volley(volley)
-                        volley.local_data["entities"] = entities
-                        future = executor.submit(func_v, volley)
-                    else:
-                        # get_response(request, response, entities)
-                        future = executor.submit(func, volley.request, volley.response, entities)
-                    result = future.result(timeout=10.0)
+                # run on the shared runner, limited at METHOD_TIMEOUT
+                with self._latency.time():
+                    result = get_method_runner().run(self, volley, entities, getattr(settings, "METHOD_TIMEOUT", 10.0))
                 if isinstance(result, str):
                     # if string, overwrite text in canned response
                     volley.set_output(result, None, output_type='GLOBAL_COMMAND')
@@ -77,16 +84,21 @@ class MethodPattern(ActionPattern):
                     volley.update_output_type('GLOBAL_COMMAND')
             else:
                 volley.set_output("Script error: Could not locate method get_response", None)
-        except TimeoutError:
-            logger.error("Method code exceeded time limit.")
+        except MethodTimeout:
+            logger.error(f"Method code for {self.name} exceeded time limit.")
+            _method_timeouts.inc()
             volley.set_output("Script error: Timeout exceeded", None, output_type='GLOBAL_COMMAND')
         except Exception as e:
             exc_info = traceback.format_exc()
             logger.error(exc_info)
+            _method_errors.inc()
             volley.set_output(f"Script error: {e}", None, output_type='GLOBAL_COMMAND')
 
         return volley.response
 
+_method_timeouts = metrics.counter("global.method.timeouts")
+_method_errors = metrics.counter("global.method.errors")
+
 # The object owning ALL active Global Responses.  It loads them from the database only on
 # startup and request.  All response handling must be executed in the returned functor.
 class GlobalResponses:
@@ -94,32 +106,58 @@ class GlobalResponses:
 
     def __init__(self):
         self._patterns = []
+        # patterns and their matcher, swapped together on reload
+        self._compiled = ([], PatternMatcher([]), None)
 
     def update_from_database(self):
-        self._patterns = []
+        patterns = []
         for gr in GlobalResponse.objects.all().order_by('-sort_key'):
             if gr.action == GlobalAction.LAUNCH.value:
                 logger.info(f'Loading GlobalResponse LAUNCH type {gr}')                
-                self._patterns.append(ActionPattern(gr, action="launch"))
+                patterns.append(ActionPattern(gr, action="launch"))
             elif gr.action == GlobalAction.CONFIRM_LAUNCH.value:
                 logger.info(f'Loading GlobalResponse CONFIRM_LAUNCH type {gr}')                
-                self._patterns.append(ActionPattern(gr, action="launch_if_confirmed"))
+                patterns.append(ActionPattern(gr, action="launch_if_confirmed"))
             elif gr.action == GlobalAction.RESPONSE.value:
                 logger.info(f'Loading GlobalResponse RESPONSE type {gr}')
-                self._patterns.append(ActionPattern(gr))
+                patterns.append(ActionPattern(gr))
             elif gr.action == GlobalAction.METHOD.value:
                 logger.info(f'Loading GlobalResponse CUSTOM METHOD type {gr}')
-                self._patterns.append(MethodPattern(gr))
+                patterns.append(MethodPattern(gr))
             else:
                 logger.warning(f"Unsupported type {gr.action} in GlobalResponse {gr.name}")
+        matcher = PatternMatcher([p._source.pattern for p in patterns],
+                                 min_patterns=getattr(settings, "GLOBAL_MATCH_PREFILTER_MIN", 32))
+        logger.info(f'Global command matcher: {matcher.prefiltered} of {matcher.size} patterns prefiltered by literals')
+        fuzzy = None
+        if getattr(settings, "FUZZY_COMMANDS", True):
+            fuzzy = FuzzyCommandIndex([p._source.pattern for p in patterns],
+                                      threshold=getattr(settings, "FUZZY_COMMANDS_THRESHOLD", 0.85),
+                                      min_length=getattr(settings, "FUZZY_COMMANDS_MIN_LENGTH", 6))
+            logger.info(f'Global command fuzzy index: {fuzzy.size} phrases')
+        self._patterns = patterns
+        self._compiled = (patterns, matcher, fuzzy)
 
     def check_global(self, volley:Volley):
         speech = volley.request.get('speech')
         if speech:
             # all global commands match at lowercase
             speech = speech.lower()
-            for p in self._patterns:
-                f = p.response_functor(speech, volley)
+            patterns, matcher, fuzzy = self._compiled
+            # only patterns whose required literals appear in the speech can match, tried in sort order
+            for i in matcher.candidates(speech):
+                f = patterns[i].response_functor(speech, volley)
                 if f:
                     return f
-        return None
\ No newline at end of file
+            # nothing exact, try the literal phrases allowing for speech-to-text errors
+            if fuzzy:
+                with _fuzzy_lookup.time():
+                    hit = fuzzy.match(speech)
+                if hit:
+                    logger.info(f"Global command {patterns[hit.index]._source.name} fuzzy matched '{speech}' as '{hit.phrase}' ({hit.confidence:.2f})")
+                    _fuzzy_hits.inc()
+                    return patterns[hit.index].response_functor(hit.phrase, volley)
+        return None
+
+_fuzzy_lookup = metrics.latency("global.fuzzy.lookup")
+_fuzzy_hits = metrics.counter("global.fuzzy.hits")
\ No newline at end of file
@@ -0,0 +1,203 @@
+'''
+JOBS - Durable background jobs, stored in the hive database and run by a separate worker
+
+With BACKGROUND_JOBS=durable, conversation complete hooks (summaries, memory updates) are saved as
+BackgroundJob rows instead of running on the hive's in-memory executor, so a restart doesn't lose
+them and they never compete with live traffic.  `python manage.py run_jobs` claims and runs them in
+a process pool:
+
+    enqueue     on_chat_complete saves the session state the hook needs (history, local data, and
+                the robot's config, state and persist data at that moment)
+    claim       the worker takes the oldest due job plus others sharing its batch key (vendor and
+                model), so one process runs them back to back against a warm model
+    run         failures are retried with exponential backoff until JOBS_MAX_ATTEMPTS, jobs whose
+                worker died are reclaimed after JOBS_LEASE seconds
+    apply       the worker can't touch the hive's in-memory robot records, so a hook's changes to
+                persist data come back as the job result and the hive merges them in
+
+Backlog and throughput show in the hive metrics as jobs.backlog, jobs.failed and jobs.done_last_min.
+'''
+import copy
+import json
+import logging
+import threading
+import time
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from ..models import BackgroundJob, JobStatus
+from .workload import BACKGROUND, use_work_class
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+DURABLE = "durable"
+MEMORY = "memory"
+
+COMPLETE_HOOK = "complete_hook"
+
+def durable_enabled():
+    return getattr(settings, "BACKGROUND_JOBS", MEMORY) == DURABLE
+
+def enqueue(kind, payload, device_id=None, batch_key=""):
+    job = BackgroundJob.objects.create(kind=kind, payload=payload, device_id=device_id, batch_key=batch_key or "")
+    metrics.counter("jobs.enqueued").inc()
+    return job
+
+# Save a session's complete hook as a job, False if the session can't be rebuilt in the worker
+def enqueue_complete_hook(device_id, session, robot_data):
+    chat_pk = getattr(session, "chat_pk", None)
+    if chat_pk is None:
+        return False
+    payload = {
+        "chat_pk": chat_pk,
+        "history": session._history,
+        "total_volleys": session.total_volleys,
+        "local_data": session.local_data,
+        "robot_data": robot_data,
+    }
+    try:
+        # round trip now, so anything that won't store as JSON falls back to running in memory
+        payload = json.loads(json.dumps(payload))
+    except (TypeError, ValueError) as e:
+        logger.info(f"Complete hook for {device_id} can't be stored, running in memory: {e}")
+        return False
+    vendor = getattr(session, "_vendor", None)
+    enqueue(COMPLETE_HOOK, payload, device_id=device_id, batch_key=f"{getattr(vendor, 'name', vendor)}/{getattr(session, '_model', '')}")
+    return True
+
+# --- worker side ---
+
+def _run_complete_hook(payload):
+    from .conversations import SinglePromptDBChatSession
+    from .volley import Volley
+    session = SinglePromptDBChatSession(payload["chat_pk"])
+    session._history = payload["history"]
+    session._total_volleys = payload["total_volleys"]
+    session._local_data = payload["local_data"]
+    robot_data = payload["robot_data"]
+    before = copy.deepcopy(robot_data.get("persist", {}))
+    volley = Volley({}, data_only=True, robot_data=robot_data, local_data=session.local_data)
+    if not session.has_complete_hook():
+        return {}
+    # call the handler directly, session.complete_hook swallows errors and the job would never retry
+    session._complete_handler(volley, session)
+    after = volley.persist_data
+    return {
+        "persist_set": { k: v for k, v in after.items() if before.get(k) != v },
+        "persist_removed": [ k for k in before if k not in after ],
+    }
+
+_HANDLERS = {
+    COMPLETE_HOOK: _run_complete_hook,
+}
+
+# Claim the oldest due job and up to batch_size-1 more due jobs with the same batch key
+def claim_batch(batch_size):
+    now = timezone.now()
+    due = BackgroundJob.objects.filter(status=JobStatus.PENDING.value, run_after__lte=now).order_by("run_after", "pk")
+    first = due.first()
+    if not first:
+        return []
+    candidates = list(due.filter(batch_key=first.batch_key).values_list("pk", flat=True)[:batch_size])
+    claimed = []
+    for pk in candidates:
+        # another worker may have taken it since we looked, the status check makes the claim atomic
+        if BackgroundJob.objects.filter(pk=pk, status=JobStatus.PENDING.value).update(status=JobStatus.RUNNING.value, started=now):
+            claimed.append(pk)
+    return claimed
+
+# Put jobs back whose worker died while running them
+def reclaim_stale():
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, "JOBS_LEASE", 600))
+    count = BackgroundJob.objects.filter(status=JobStatus.RUNNING.value, started__lt=cutoff).update(status=JobStatus.PENDING.value)
+    if count:
+        logger.warning(f"Reclaimed {count} stale background jobs")
+    return count
+
+def _finish(job, ok, result=None, error=None):
+    job.attempts += 1
+    job.finished = timezone.now()
+    if ok:
+        job.status = JobStatus.DONE.value
+        job.result = result
+        job.error = None
+    elif job.attempts >= getattr(settings, "JOBS_MAX_ATTEMPTS", 5):
+        job.status = JobStatus.FAILED.value
+        job.error = error
+    else:
+        backoff = getattr(settings, "JOBS_BACKOFF", 10.0) * (2 ** (job.attempts - 1))
+        job.status = JobStatus.PENDING.value
+        job.run_after = job.finished + timedelta(seconds=backoff)
+        job.error = error
+    job.save()
+
+# Run claimed jobs in order, in a worker process.  Returns (pk, outcome, run_ms) per job.
+def run_batch(pks):
+    outcomes = []
+    for pk in pks:
+        job = BackgroundJob.objects.get(pk=pk)
+        start = time.perf_counter()
+        try:
+            with use_work_class(BACKGROUND):
+                result = _HANDLERS[job.kind](job.payload)
+            _finish(job, True, result=result)
+            outcome = "done"
+        except Exception as e:
+            logger.error(f"Background job {job} failed: {e}")
+            _finish(job, False, error=traceback.format_exc())
+            outcome = "failed" if job.status == JobStatus.FAILED.value else "retry"
+        outcomes.append((pk, outcome, (time.perf_counter() - start) * 1000))
+    connections.close_all()
+    return outcomes
+
+# --- hive side ---
+
+# Merge finished jobs' persist changes into the robots' records
+def apply_results(robot_data):
+    applied = 0
+    for job in BackgroundJob.objects.filter(status=JobStatus.DONE.value).order_by("finished", "pk"):
+        result = job.result or {}
+        if job.device_id and (result.get("persist_set") or result.get("persist_removed")):
+            robot_data.merge_persist(job.device_id, result.get("persist_set", {}), result.get("persist_removed", []))
+        BackgroundJob.objects.filter(pk=job.pk).update(status=JobStatus.APPLIED.value)
+        applied += 1
+    return applied
+
+def _count(**filters):
+    return BackgroundJob.objects.filter(**filters).count()
+
+# Jobs waiting for or running in a worker
+def backlog():
+    return _count(status__in=[JobStatus.PENDING.value, JobStatus.RUNNING.value])
+
+def register_metrics():
+    metrics.gauge("jobs.backlog", backlog)
+    metrics.gauge("jobs.failed", lambda: _count(status=JobStatus.FAILED.value))
+    metrics.gauge("jobs.done_last_min", lambda: _count(status__in=[JobStatus.DONE.value, JobStatus.APPLIED.value],
+                                                        finished__gte=timezone.now() - timedelta(minutes=1)))
+
+# Background thread in the hive that merges finished jobs back in
+class JobResultApplier:
+    def __init__(self, robot_data, interval=None):
+        self._robot_data = robot_data
+        self._interval = interval if interval is not None else getattr(settings, "JOBS_POLL_INTERVAL", 2.0)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="hive-job-results", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            try:
+                with transaction.atomic():
+                    apply_results(self._robot_data)
+            except Exception as e:
+                logger.warning(f"Failed to apply background job results: {e}")
@@ -0,0 +1,88 @@
+'''
+LATENCY PROFILES - Latency profiles for simulated LLM vendors (the MOCK vendor and the benchmarks)
+
+A profile describes how a vendor behaves in time: how long before the first token, how long per
+token after that, how long its replies run, and how often it fails or hangs.  Samples come from a
+seeded random generator so runs are repeatable.
+
+Profiles are named (see PROFILES) or given inline as comma separated key=value pairs, like
+"ttft_ms=300,token_ms=15,words=30".
+'''
+import random
+
+class LatencyProfile:
+    FIELDS = ("ttft_ms", "ttft_jitter", "token_ms", "words", "words_jitter", "fail_rate", "timeout_rate", "hang_ms")
+
+    def __init__(self,
+                 ttft_ms=200.0,       # mean time to first token
+                 ttft_jitter=0.25,    # +/- fraction of ttft_ms
+                 token_ms=20.0,       # mean time per token after the first
+                 words=30,            # mean reply length in words
+                 words_jitter=0.3,    # +/- fraction of words
+                 fail_rate=0.0,       # fraction of requests that fail with a server error
+                 timeout_rate=0.0,    # fraction of requests that never answer (hang for hang_ms)
+                 hang_ms=60000.0):
+        self.ttft_ms = ttft_ms
+        self.ttft_jitter = ttft_jitter
+        self.token_ms = token_ms
+        self.words = words
+        self.words_jitter = words_jitter
+        self.fail_rate = fail_rate
+        self.timeout_rate = timeout_rate
+        self.hang_ms = hang_ms
+
+    def as_dict(self):
+        return { f: getattr(self, f) for f in self.FIELDS }
+
+    def sample_ttft(self, rng: random.Random):
+        return max(0.0, self.ttft_ms * (1 + rng.uniform(-self.ttft_jitter, self.ttft_jitter)))
+
+    def sample_words(self, rng: random.Random):
+        return max(1, round(self.words * (1 + rng.uniform(-self.words_jitter, self.words_jitter))))
+
+    # "ok", "fail" or "timeout" for the next request
+    def sample_outcome(self, rng: random.Random):
+        roll = rng.random()
+        if roll < self.fail_rate:
+            return "fail"
+        if roll < self.fail_rate + self.timeout_rate:
+            return "timeout"
+        return "ok"
+
+PROFILES = {
+    "instant": LatencyProfile(ttft_ms=0.0, ttft_jitter=0.0, token_ms=0.0),
+    "local_gpu": LatencyProfile(ttft_ms=250.0, token_ms=25.0, words=35),
+    "local_cpu": LatencyProfile(ttft_ms=1500.0, token_ms=120.0, words=35),
+    "cloud": LatencyProfile(ttft_ms=450.0, ttft_jitter=0.5, token_ms=12.0, words=40),
+    "flaky": LatencyProfile(ttft_ms=600.0, ttft_jitter=0.8, token_ms=20.0, fail_rate=0.05, timeout_rate=0.02, hang_ms=10000.0),
+}
+
+def parse_profile(spec) -> LatencyProfile:
+    if not spec:
+        return PROFILES["local_gpu"]
+    if spec in PROFILES:
+        return PROFILES[spec]
+    fields = {}
+    for part in spec.split(","):
+        key, _, value = part.partition("=")
+        key = key.strip()
+        if key not in LatencyProfile.FIELDS:
+            raise ValueError(f"Unknown latency profile field '{key}' in '{spec}'")
+        fields[key] = int(value) if key == "words" else float(value)
+    return LatencyProfile(**fields)
+
+# Spanish filler for simulated replies, Moxie talks to kids about their day
+_WORDS = ("me encanta hablar contigo sobre el parque los animales la música y los juegos de fútbol "
+          "qué divertido suena eso cuéntame más sobre tus amigos y tu color favorito hoy").split()
+
+# A reply of about n words, cut into sentences
+def sample_text(rng: random.Random, n):
+    words = [ rng.choice(_WORDS) for _ in range(n) ]
+    out = []
+    for i, w in enumerate(words):
+        if i == 0 or out[-1].endswith("."):
+            w = w.capitalize()
+        if i == len(words) - 1 or rng.random() < 0.12:
+            w += "."
+        out.append(w)
+    return " ".join(out)
@@ -0,0 +1,113 @@
+'''
+LLM CACHE - Response cache with in-flight request coalescing for chat providers
+
+Many prompts repeat across robots (openers, the same first question in a module, summaries of
+empty chats, retries of the same event).  Responses are cached in an LRU with a TTL, keyed by a hash
+of (vendor, model, messages, temperature, max_tokens) plus any sentence/word budget.  Identical requests that arrive while one is
+still in flight wait for it and share its result instead of running their own inference.
+
+Only deterministic requests (temperature 0) are cached, unless the conversation opts in with
+SinglePromptChat.cache_responses.
+'''
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from django.conf import settings
+from .cancellation import Cancelled
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+class ResponseCache:
+    def __init__(self, max_entries=512, ttl=600.0):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, response)
+        self._inflight = {}            # key -> Future shared by coalesced callers
+        self._hits = metrics.counter("llm_cache.hits")
+        self._misses = metrics.counter("llm_cache.misses")
+        self._coalesced = metrics.counter("llm_cache.coalesced")
+
+    @staticmethod
+    def make_key(vendor, model, messages, temperature, max_tokens, budget=None):
+        payload = json.dumps([getattr(vendor, "name", str(vendor)), model, messages, temperature, max_tokens, budget],
+                             sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @property
+    def enabled(self):
+        return self._max_entries > 0
+
+    # Return the cached response for key, or run func once for all concurrent callers of the same key
+    def get_or_call(self, key, func):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._hits.inc()
+                    return entry[1]
+                del self._entries[key]
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self._misses.inc()
+            else:
+                self._coalesced.inc()
+
+        if not leader:
+            try:
+                # raises the leader's exception if its call failed
+                return future.result()
+            except Cancelled:
+                # the leader's volley was superseded, not ours, so make the call ourselves
+                return self.get_or_call(key, func)
+
+        try:
+            resp = func()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._inflight.pop(key, None)
+            if resp:
+                self._entries[key] = (time.monotonic() + self._ttl, resp)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self._max_entries:
+                    self._entries.popitem(last=False)
+        future.set_result(resp)
+        return resp
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        hits, misses, coalesced = self._hits.value, self._misses.value, self._coalesced.value
+        lookups = hits + misses + coalesced
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hit_rate": round((hits + coalesced) / lookups, 3) if lookups else 0.0,
+        }
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+# The process wide response cache, sized from settings
+def get_response_cache() -> ResponseCache:
+    global _CACHE
+    with _CACHE_LOCK:
+        if not _CACHE:
+            _CACHE = ResponseCache(max_entries=getattr(settings, "LLM_CACHE_MAX_ENTRIES", 512),
+                                   ttl=getattr(settings, "LLM_CACHE_TTL", 600.0))
+            metrics.gauge("llm_cache", _CACHE.stats)
+        return _CACHE
@@ -0,0 +1,214 @@
+'''
+MEMORY INDEX - Per-device lexical retrieval over past transcripts and notes
+
+Lets a module's prompt carry only the memories relevant to what the child just said, instead of
+whole histories or summaries.  Each device gets an in-process BM25 index over its transcript lines
+(see transcripts.py) and any notes code hooks add, built from the transcript store on first use
+and updated as new lines arrive.  The build reads what the store holds without waiting on its
+writer, and lines arriving meanwhile go straight into the index being built.
+
+Postings are NumPy arrays per term that grow in place, so adding a line is a few appends, and a
+top-k lookup scores only the documents sharing a term with the query (well under a millisecond for
+a device's history).  Words are folded to lowercase ASCII and common Spanish and English words are
+ignored.
+
+In prompt templates, memories relevant to the volley's speech:
+
+    {% for m in volley.memories %}- {{ m.text }}
+    {% endfor %}
+
+In code hooks:
+
+    volley.memory.search("futbol", k=3)
+    volley.memory.add_note("Le encanta el fútbol")
+'''
+import collections
+import math
+import re
+import threading
+import time
+import numpy as np
+from django.conf import settings
+from unidecode import unidecode
+from . import metrics
+from .transcripts import get_transcript_store, transcripts_enabled, NOTE
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+_STOPWORDS = frozenset("""
+a al algo como con de del el ella ellos en era es esta este esto eso fue ha hay la las le lo los me mi mas
+muy no nos o para pero por que se si sin su sus te tu un una uno y ya yo
+an and are as at be but by do for from have he i if in is it its me my no not of on or our she so that the
+their them they this to was we what with you your
+""".split())
+
+def tokenize(text):
+    return [ w for w in _WORD.findall(unidecode(text).lower()) if len(w) > 1 and w not in _STOPWORDS ]
+
+# A growable pair of arrays, document ids and term frequencies
+class _Postings:
+    __slots__ = ("docs", "tfs", "n")
+
+    def __init__(self):
+        self.docs = np.empty(4, dtype=np.int32)
+        self.tfs = np.empty(4, dtype=np.float32)
+        self.n = 0
+
+    def append(self, doc, tf):
+        if self.n == len(self.docs):
+            self.docs = np.resize(self.docs, self.n * 2)
+            self.tfs = np.resize(self.tfs, self.n * 2)
+        self.docs[self.n] = doc
+        self.tfs[self.n] = tf
+        self.n += 1
+
+class MemoryIndex:
+    def __init__(self, k1=1.2, b=0.75):
+        self._k1 = k1
+        self._b = b
+        self._lock = threading.Lock()
+        self._terms = {}
+        self._records = []
+        self._seen = set()
+        self._doc_len = np.empty(64, dtype=np.float32)
+        self._doc_module = np.empty(64, dtype=np.int32)
+        self._modules = {}
+        self._total_len = 0
+        # set once the index holds the device's stored lines
+        self.ready = threading.Event()
+
+    def __len__(self):
+        return len(self._records)
+
+    # Index a line of text, returns False if it had nothing to index or was already there
+    def add(self, text, role="", module="", ts=0):
+        tokens = tokenize(text)
+        if not tokens:
+            return False
+        with self._lock:
+            if text in self._seen:
+                return False
+            self._seen.add(text)
+            doc = len(self._records)
+            if doc == len(self._doc_len):
+                self._doc_len = np.resize(self._doc_len, doc * 2)
+                self._doc_module = np.resize(self._doc_module, doc * 2)
+            self._records.append({ "text": text, "role": role, "module": module, "ts": ts or time.time_ns() // 1_000_000 })
+            self._doc_len[doc] = len(tokens)
+            self._doc_module[doc] = self._modules.setdefault(module, len(self._modules))
+            self._total_len += len(tokens)
+            for term, tf in collections.Counter(tokens).items():
+                postings = self._terms.get(term)
+                if postings is None:
+                    postings = self._terms[term] = _Postings()
+                postings.append(doc, tf)
+        return True
+
+    # The k records scoring highest for the query, best first, each with its BM25 score
+    def search(self, query, k=5, module=None):
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self._records)
+            if not n or not terms:
+                return []
+            avgdl = self._total_len / n
+            doc_len = self._doc_len[:n]
+            scores = np.zeros(n, dtype=np.float32)
+            for term in terms:
+                postings = self._terms.get(term)
+                if postings is None:
+                    continue
+                docs = postings.docs[:postings.n]
+                tfs = postings.tfs[:postings.n]
+                idf = math.log(1 + (n - postings.n + 0.5) / (postings.n + 0.5))
+                norm = self._k1 * (1 - self._b + self._b * doc_len[docs] / avgdl)
+                scores[docs] += idf * tfs * (self._k1 + 1) / (tfs + norm)
+            if module is not None:
+                code = self._modules.get(module)
+                if code is None:
+                    return []
+                scores[self._doc_module[:n] != code] = 0
+            hits = int(np.count_nonzero(scores))
+            if not hits:
+                return []
+            k = min(k, hits)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [ dict(self._records[i], score=float(scores[i])) for i in top ]
+
+# Memory for one device, as handed to code hooks and templates
+class DeviceMemory:
+    def __init__(self, device_id, index: MemoryIndex):
+        self.device_id = device_id
+        self._index = index
+
+    def search(self, query, k=None, module=None):
+        k = k or getattr(settings, "MEMORY_TOP_K", 5)
+        with _search_stat.time():
+            return self._index.search(query, k=k, module=module)
+
+    # Remember a fact about the user, kept in the device transcript (if enabled) so it survives restarts
+    def add_note(self, text, module=""):
+        if transcripts_enabled():
+            get_transcript_store().append(self.device_id, NOTE, text, module=module)
+        self._index.add(text, role=NOTE, module=module)
+
+    def __len__(self):
+        return len(self._index)
+
+_search_stat = metrics.latency("memory.search")
+
+# Indexes of recently active devices, built from their transcripts on first use
+class MemoryIndexes:
+    def __init__(self, max_devices=None):
+        self._max_devices = max_devices or getattr(settings, "MEMORY_MAX_DEVICES", 32)
+        self._indexes = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._builds = metrics.counter("memory.builds")
+
+    def get(self, device_id) -> DeviceMemory:
+        with self._lock:
+            index = self._indexes.get(device_id)
+            build = index is None
+            if build:
+                # registered before it's built, so observe() adds lines arriving during the build
+                index = self._indexes[device_id] = MemoryIndex()
+                while len(self._indexes) > self._max_devices:
+                    self._indexes.popitem(last=False)
+            else:
+                self._indexes.move_to_end(device_id)
+        if build:
+            try:
+                if transcripts_enabled():
+                    for rec in get_transcript_store().records(device_id):
+                        index.add(rec["text"], role=rec["role"], module=rec["module"], ts=rec["ts"])
+                self._builds.inc()
+            except Exception:
+                # let the next get try again
+                with self._lock:
+                    if self._indexes.get(device_id) is index:
+                        del self._indexes[device_id]
+                raise
+            finally:
+                index.ready.set()
+        else:
+            # another thread is building it
+            index.ready.wait()
+        return DeviceMemory(device_id, index)
+
+    # A new transcript line, indexed now if the device's index is loaded (otherwise it's read on load)
+    def observe(self, device_id, role, text, module="", ts=0):
+        with self._lock:
+            index = self._indexes.get(device_id)
+        if index is not None:
+            index.add(text, role=role, module=module, ts=ts)
+
+_INDEXES = None
+_INDEXES_LOCK = threading.Lock()
+
+def get_memory_indexes() -> MemoryIndexes:
+    global _INDEXES
+    with _INDEXES_LOCK:
+        if _INDEXES is None:
+            _INDEXES = MemoryIndexes()
+        return _INDEXES
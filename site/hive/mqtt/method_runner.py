@@ -0,0 +1,218 @@
+'''
+METHOD RUNNER - Runs the code of METHOD global responses with a time limit
+
+METHOD code is compiled once when global responses load from the database, and each match runs the
+compiled function on a shared runner instead of exec'ing the text and building a one-off thread
+pool.  METHOD_EXECUTION picks the runner:
+
+    thread      a shared pool of METHOD_WORKERS threads.  A method past METHOD_TIMEOUT gets its
+                fallback response, but Python can't stop its thread, which stays busy until the
+                code returns (global.method.stuck counts them).  A new thread takes its place, so
+                hung methods never leave the pool short.
+    process     METHOD_WORKERS worker processes.  A method past the limit has its process killed
+                and replaced, so nothing is left running.  The volley goes to the worker and the
+                response, local data and persist data it changed are copied back.  Workers are
+                spawned fresh and set Django up themselves rather than forked from the hive, whose
+                MQTT and pool threads could hold a lock (logging's, say) in the fork forever.
+
+The time limit runs from when the method starts, a call that waits that long for a free worker
+times out without running.  Every method records its latency as global.method.<name> in the hive metrics, with counters for
+timeouts and errors.
+'''
+import concurrent.futures
+import contextvars
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from functools import partial
+from django.conf import settings
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+THREAD = "thread"
+PROCESS = "process"
+
+GET_RESPONSE = "get_response"
+HANDLE_VOLLEY = "handle_volley"
+
+class MethodTimeout(TimeoutError):
+    pass
+
+# Compile METHOD code and pull out its entry point, returns (kind, function).  The code sees the
+# globals of global_responses, as it did when it was exec'd there.
+def compile_method(name, code):
+    from . import global_responses
+    namespace = dict(vars(global_responses))
+    exec(compile(code, f"<global method {name}>", "exec"), namespace)
+    if callable(namespace.get(HANDLE_VOLLEY)):
+        return HANDLE_VOLLEY, namespace[HANDLE_VOLLEY]
+    if callable(namespace.get(GET_RESPONSE)):
+        return GET_RESPONSE, namespace[GET_RESPONSE]
+    return None, None
+
+def _call(kind, func, volley, entities):
+    if kind == HANDLE_VOLLEY:
+        volley.local_data["entities"] = entities
+        return func(volley)
+    return func(volley.request, volley.response, entities)
+
+class _Job:
+    def __init__(self, fn):
+        self.fn = fn
+        self.future = concurrent.futures.Future()
+        self.started = threading.Event()
+        # under the runner's lock: the method returned, or its caller gave up on it
+        self.finished = False
+        self.abandoned = False
+
+class ThreadMethodRunner:
+    def __init__(self, workers):
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self._stuck = 0
+        metrics.gauge("global.method.stuck", lambda: self._stuck)
+        for _ in range(workers):
+            self._start_worker()
+
+    def _start_worker(self):
+        threading.Thread(target=self._work, name="hive-method", daemon=True).start()
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            job.started.set()
+            try:
+                job.future.set_result(job.fn())
+            except BaseException as e:
+                job.future.set_exception(e)
+            with self._lock:
+                job.finished = True
+                if job.abandoned:
+                    # another thread took our place when the method overran
+                    self._stuck -= 1
+                    return
+
+    def run(self, method, volley, entities, timeout):
+        # in a copy of our context, so the method sees the volley's cancel token
+        job = _Job(partial(contextvars.copy_context().run, _call, method.kind, method.func, volley, entities))
+        self._jobs.put(job)
+        if not job.started.wait(timeout) and job.future.cancel():
+            raise MethodTimeout(f"Method {method.name} waited {timeout}s for a free worker")
+        try:
+            return job.future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            with self._lock:
+                overran = not job.finished
+                if overran:
+                    job.abandoned = True
+                    self._stuck += 1
+            if not overran:
+                return job.future.result()
+            # Python can't stop the thread, so leave it to the method and start another
+            self._start_worker()
+            raise MethodTimeout(f"Method {method.name} exceeded {timeout}s")
+
+# --- process runner ---
+
+def _worker_main(conn):
+    # a fresh interpreter: load the hive's apps, without starting another Moxie server
+    os.environ["HIVE_NO_SERVER"] = "1"
+    import django
+    django.setup()
+    conn.send("ready")
+    compiled = {}
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            return
+        key, name, code, volley, entities = msg
+        try:
+            if key not in compiled:
+                compiled[key] = compile_method(name, code)
+            kind, func = compiled[key]
+            result = _call(kind, func, volley, entities)
+            conn.send(("ok", result, volley))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}", None))
+
+# How long a new worker may take to start and set Django up, apart from any method's time limit
+_STARTUP_TIMEOUT = 60.0
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child,), name="hive-method-worker", daemon=True)
+        self.process.start()
+        child.close()
+        self.ready = False
+
+    # Wait for the worker to finish starting, False if it didn't
+    def wait_ready(self):
+        if not self.ready and self.conn.poll(_STARTUP_TIMEOUT):
+            self.ready = self.conn.recv() == "ready"
+        return self.ready
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(1)
+        self.conn.close()
+
+class ProcessMethodRunner:
+    def __init__(self, workers):
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle = queue.Queue()
+        for _ in range(workers):
+            self._idle.put(_Worker(self._ctx))
+        self._killed = metrics.counter("global.method.killed")
+
+    def run(self, method, volley, entities, timeout):
+        worker = self._idle.get()
+        try:
+            if not worker.wait_ready():
+                raise EOFError("worker failed to start")
+            worker.conn.send((method.key, method.name, method.code, volley, entities))
+            if worker.conn.poll(timeout):
+                status, result, child_volley = worker.conn.recv()
+            else:
+                status = None
+        except (EOFError, OSError) as e:
+            status, result = "died", f"Method worker died: {e}"
+        if status in (None, "died"):
+            worker.kill()
+            self._killed.inc()
+            worker = _Worker(self._ctx)
+        self._idle.put(worker)
+        if status is None:
+            raise MethodTimeout(f"Method {method.name} exceeded {timeout}s and was stopped")
+        if status != "ok":
+            raise RuntimeError(result)
+        _copy_back(volley, child_volley)
+        return result
+
+# Apply what the method changed in the worker's copy of the volley to the live one
+def _copy_back(volley, child):
+    for live, changed in ((volley.response, child.response), (volley.local_data, child.local_data),
+                          (volley.persist_data, child.persist_data)):
+        if live is not changed:
+            live.clear()
+            live.update(changed)
+
+_RUNNER = None
+_RUNNER_LOCK = threading.Lock()
+
+def get_method_runner():
+    global _RUNNER
+    with _RUNNER_LOCK:
+        if _RUNNER is None:
+            workers = getattr(settings, "METHOD_WORKERS", 4)
+            if getattr(settings, "METHOD_EXECUTION", THREAD) == PROCESS:
+                _RUNNER = ProcessMethodRunner(workers)
+            else:
+                _RUNNER = ThreadMethodRunner(workers)
+        return _RUNNER
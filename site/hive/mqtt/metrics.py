@@ -0,0 +1,111 @@
+'''
+METRICS - In-process counters, latency stats and gauges for the hive
+
+Metrics are created by name on first use and live for the life of the process.  They are logged
+periodically with the broker client metrics by MoxieServer.print_metrics, and served as JSON by the
+hive metrics view.  Names are dotted by area, like llm_cache.hits or queue.interactive.wait
+'''
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Number of recent samples each latency stat keeps for percentiles
+_LATENCY_WINDOW = 512
+
+class Counter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+    def snapshot(self):
+        return self._value
+
+# Count, mean and max over all samples, percentiles over a recent window.  Values are milliseconds.
+class LatencyStat:
+    def __init__(self, window=_LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self._count = 0
+        self._total = 0.0
+        self._max = 0.0
+        self._recent = deque(maxlen=window)
+
+    def observe(self, ms):
+        with self._lock:
+            self._count += 1
+            self._total += ms
+            if ms > self._max:
+                self._max = ms
+            self._recent.append(ms)
+
+    # Time a block of code into this stat
+    @contextmanager
+    def time(self):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe((time.monotonic() - start) * 1000)
+
+    def snapshot(self):
+        with self._lock:
+            recent = sorted(self._recent)
+            count, total, max_ms = self._count, self._total, self._max
+        if not recent:
+            return { "count": 0 }
+        return {
+            "count": count,
+            "mean_ms": round(total / count, 2),
+            "p50_ms": round(recent[len(recent) // 2], 2),
+            "p95_ms": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))], 2),
+            "max_ms": round(max_ms, 2),
+        }
+
+_registry_lock = threading.Lock()
+_counters = {}
+_latencies = {}
+_gauges = {}
+
+def counter(name) -> Counter:
+    with _registry_lock:
+        c = _counters.get(name)
+        if not c:
+            c = _counters[name] = Counter()
+        return c
+
+def latency(name) -> LatencyStat:
+    with _registry_lock:
+        s = _latencies.get(name)
+        if not s:
+            s = _latencies[name] = LatencyStat()
+        return s
+
+# Register a callable evaluated at snapshot time, returning any JSON friendly value
+def gauge(name, func):
+    with _registry_lock:
+        _gauges[name] = func
+
+def snapshot():
+    with _registry_lock:
+        counters = dict(_counters)
+        latencies = dict(_latencies)
+        gauges = dict(_gauges)
+    result = {
+        "counters": { name: c.snapshot() for name,c in sorted(counters.items()) },
+        "latency": { name: s.snapshot() for name,s in sorted(latencies.items()) },
+        "gauges": {},
+    }
+    for name,func in sorted(gauges.items()):
+        try:
+            result["gauges"][name] = func()
+        except Exception as e:
+            result["gauges"][name] = f"error: {e}"
+    return result
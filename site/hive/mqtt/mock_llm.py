@@ -0,0 +1,126 @@
+'''
+MOCK LLM - Deterministic stand-in vendor (AIVendor.MOCK) for load and regression testing
+
+Lets the hive run the full remote chat path without a model, GPU or network.  A chat selects it with
+vendor MOCK, and its model field picks what the mock says and how it behaves in time:
+
+    <reply>[@<profile>]
+
+where reply is one of
+    lorem          filler sentences, about as long as the profile says (the default)
+    echo           repeats the user's last utterance back
+    anything with {placeholders}, a template filled with {user}, {turn} and {model}
+
+and profile is a latency profile name or inline key=value pairs (see latency_profiles.py), which
+also sets the failure and timeout rates.  MOCK_LLM_PROFILE is used when none is given.
+
+If MOCK_LLM_SCRIPT names a JSON file of [{"match": "<regex>", "responses": ["...", ...]}, ...], the
+first entry whose regex matches the user's last utterance supplies the reply instead.
+
+Replies and timings are seeded from the request, so the same conversation always gets the same
+answers at the same pace.
+'''
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+from django.conf import settings
+from .latency_profiles import parse_profile, sample_text
+from .ai_factory import LLMProvider
+from .cancellation import Cancelled, current_token
+from .sentence_budget import SentenceBudget
+
+logger = logging.getLogger(__name__)
+
+# Sleeps are taken in slices this long, so a cancelled volley stops promptly
+_SLEEP_SLICE = 0.05
+
+_SCRIPT = None
+_SCRIPT_LOCK = threading.Lock()
+
+def _load_script():
+    global _SCRIPT
+    with _SCRIPT_LOCK:
+        if _SCRIPT is None:
+            path = getattr(settings, "MOCK_LLM_SCRIPT", "")
+            entries = []
+            if path:
+                try:
+                    with open(path, encoding="utf-8") as f:
+                        entries = [ (re.compile(e["match"], re.IGNORECASE), e["responses"]) for e in json.load(f) ]
+                except Exception as e:
+                    logger.error(f"Failed to load mock LLM script {path}: {e}")
+            _SCRIPT = entries
+        return _SCRIPT
+
+class MockTimeout(TimeoutError):
+    pass
+
+class MockProvider(LLMProvider):
+    def __init__(self, model: str):
+        self.model = model or "lorem"
+        reply, _, profile = self.model.partition("@")
+        self.reply = reply or "lorem"
+        self.profile = parse_profile(profile or getattr(settings, "MOCK_LLM_PROFILE", "instant"))
+
+    def _rng(self, messages):
+        seed = json.dumps([ self.model, messages ], sort_keys=True, ensure_ascii=False)
+        return random.Random(hashlib.sha256(seed.encode("utf-8")).digest())
+
+    def _text(self, rng, messages):
+        user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        turn = sum(1 for m in messages if m.get("role") == "user")
+        for pattern, responses in _load_script():
+            if pattern.search(user):
+                return rng.choice(responses).format(user=user, turn=turn, model=self.model)
+        if self.reply == "echo":
+            return f"Dijiste: {user}"
+        if "{" in self.reply:
+            return self.reply.format(user=user, turn=turn, model=self.model)
+        return sample_text(rng, self.profile.sample_words(rng))
+
+    @staticmethod
+    def _sleep(seconds, token):
+        end = time.monotonic() + seconds
+        while True:
+            if token and token.cancelled:
+                raise Cancelled("Mock request aborted")
+            left = end - time.monotonic()
+            if left <= 0:
+                return
+            time.sleep(min(left, _SLEEP_SLICE))
+
+    def _stream(self, messages):
+        rng = self._rng(messages)
+        token = current_token()
+        outcome = self.profile.sample_outcome(rng)
+        ttft = self.profile.sample_ttft(rng) / 1000
+        text = self._text(rng, messages)
+        if outcome == "fail":
+            self._sleep(ttft, token)
+            raise RuntimeError("Mock vendor failure")
+        if outcome == "timeout":
+            self._sleep(min(self.profile.hang_ms / 1000, getattr(settings, "LLM_TIMEOUT", 30.0)), token)
+            raise MockTimeout("Mock vendor timed out")
+        self._sleep(ttft, token)
+        words = text.split(" ")
+        for i, w in enumerate(words):
+            if i:
+                self._sleep(self.profile.token_ms / 1000, token)
+            yield w if i == len(words) - 1 else w + " "
+
+    def chat(self, messages, temperature=0.7, stream=False, **kwargs):
+        if stream:
+            return self._stream(messages)
+        budget = SentenceBudget(kwargs.get("max_sentences"), kwargs.get("max_words"))
+        chunks = self._stream(messages)
+        try:
+            for delta in chunks:
+                if budget.feed(delta):
+                    break
+        finally:
+            chunks.close()
+        return budget.finish()
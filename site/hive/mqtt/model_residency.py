@@ -0,0 +1,129 @@
+'''
+MODEL RESIDENCY - Keep the local models robots need loaded in Ollama
+
+Ollama unloads a model after it sits idle for keep_alive, and loads another model in its place when
+a conversation asks for one, so the first volley after a quiet spell (or after a module on another
+model) waits seconds for the load.  The residency manager:
+
+- learns which Ollama models the conversation modules use when the database is loaded, and preloads
+  the ones robots are most likely to need next (most used first) in the background
+- picks keep_alive per model from how often it is used, so busy models stay loaded and rarely used
+  ones give their memory back
+- counts cold loads, from the load_duration Ollama reports with each response
+'''
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+import ollama
+from django.conf import settings
+from ..models import AIVendor
+from .ollama_pool import get_ollama_hosts, get_ollama_pool
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Recent uses kept per model to estimate how often it is needed
+_USE_WINDOW = 32
+# keep_alive covers this many typical gaps between uses
+_KEEP_ALIVE_GAPS = 3
+
+class ResidencyManager:
+    def __init__(self, keep_alive_min=300.0, keep_alive_max=3600.0, preload_max=2, cold_load_ms=1000.0):
+        self._keep_alive_min = keep_alive_min
+        self._keep_alive_max = keep_alive_max
+        self._preload_max = preload_max
+        self._cold_load_ms = cold_load_ms
+        self._lock = threading.Lock()
+        self._uses = {}          # model -> deque of use times
+        self._module_models = {} # model -> number of modules using it
+        self._cold_loads = metrics.counter("ollama.cold_loads")
+        self._cold_load_ms_stat = metrics.latency("ollama.cold_load")
+        metrics.gauge("ollama.keep_alive", lambda: { m: self.keep_alive_for(m) for m in self.known_models() })
+
+    def known_models(self):
+        with self._lock:
+            return sorted(set(self._uses) | set(self._module_models))
+
+    def record_use(self, model):
+        with self._lock:
+            self._uses.setdefault(model, deque(maxlen=_USE_WINDOW)).append(time.monotonic())
+
+    # Seconds Ollama should keep this model loaded after a request
+    def keep_alive_for(self, model):
+        with self._lock:
+            uses = list(self._uses.get(model) or [])
+        if len(uses) < 2:
+            return self._keep_alive_min
+        gap = statistics.median(b - a for a, b in zip(uses, uses[1:]))
+        return min(self._keep_alive_max, max(self._keep_alive_min, gap * _KEEP_ALIVE_GAPS))
+
+    # Inspect an Ollama response (or final stream chunk) for the time spent loading the model
+    def observe_response(self, model, resp):
+        load_ms = (resp.get("load_duration") or 0) / 1e6
+        if load_ms >= self._cold_load_ms:
+            self._cold_loads.inc()
+            self._cold_load_ms_stat.observe(load_ms)
+            logger.info(f"Cold load of {model} took {load_ms:.0f}ms")
+
+    # Set the Ollama models the conversation modules use, and preload the likely ones
+    def update_models(self, module_models, preload=True):
+        counts = {}
+        for model in module_models:
+            counts[model] = counts.get(model, 0) + 1
+        with self._lock:
+            self._module_models = counts
+        if preload and counts:
+            threading.Thread(target=self.preload, name="ollama-preload", daemon=True).start()
+
+    # Most likely needed next: most uses in the recent window, then most modules using it
+    def preload_candidates(self):
+        with self._lock:
+            models = set(self._uses) | set(self._module_models)
+            def rank(m):
+                uses = self._uses.get(m)
+                return (len(uses) if uses else 0, self._module_models.get(m, 0))
+            return sorted(models, key=rank, reverse=True)[:self._preload_max]
+
+    def preload(self):
+        for model in self.preload_candidates():
+            keep_alive = self.keep_alive_for(model)
+            for client in _ollama_clients():
+                try:
+                    start = time.monotonic()
+                    # an empty prompt loads the model without generating anything
+                    client.generate(model=model, prompt="", keep_alive=keep_alive)
+                    logger.info(f"Preloaded {model} in {(time.monotonic() - start) * 1000:.0f}ms, keep_alive {keep_alive:.0f}s")
+                except Exception as e:
+                    logger.warning(f"Failed to preload {model}: {e}")
+
+def _ollama_clients():
+    hosts = get_ollama_hosts()
+    if len(hosts) > 1:
+        return [ h.client for h in get_ollama_pool().hosts if h.healthy ]
+    return [ ollama.Client(host=hosts[0], timeout=getattr(settings, "LLM_TIMEOUT", 30.0)) ]
+
+# Ollama models named by the chats, falling back to OLLAMA_MODEL like the provider factory does
+def ollama_models_for_chats(chats):
+    fallback = getattr(settings, "OLLAMA_MODEL", "llama3")
+    models = []
+    for chat in chats:
+        if chat.vendor_enum == AIVendor.OLLAMA:
+            models.append(chat.model or fallback)
+        if chat.hedge_vendor == AIVendor.OLLAMA.value and chat.hedge_after_ms:
+            models.append(chat.hedge_model or fallback)
+    return models
+
+_MANAGER = None
+_MANAGER_LOCK = threading.Lock()
+
+def get_residency_manager() -> ResidencyManager:
+    global _MANAGER
+    with _MANAGER_LOCK:
+        if not _MANAGER:
+            _MANAGER = ResidencyManager(keep_alive_min=getattr(settings, "OLLAMA_KEEP_ALIVE_MIN", 300.0),
+                                        keep_alive_max=getattr(settings, "OLLAMA_KEEP_ALIVE_MAX", 3600.0),
+                                        preload_max=getattr(settings, "OLLAMA_PRELOAD_MAX", 2),
+                                        cold_load_ms=getattr(settings, "OLLAMA_COLD_LOAD_MS", 1000.0))
+        return _MANAGER
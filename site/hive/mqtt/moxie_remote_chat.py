@@ -9,21 +9,30 @@
 # history of the conversation and provides mostly seemless conversation context for the AI,
 # even when the user provides input in multiple speech windows before hearing a response.
 
-import concurrent.futures
 import logging
+import threading
+import time
+from django.conf import settings
 from ..models import SinglePromptChat
 from ..automarkup import process as automarkup_process
 from ..automarkup import initialize_rules as automarkup_initialize_rules
 from .global_responses import GlobalResponses
 from .conversations import ChatSession, SinglePromptDBChatSession
+from .prompt_compiler import clear_compiled
 from .volley import Volley
 from .mqtt_tts_mirror import TTSMirrorPublisher
+from .workload import Workloads
+from .model_residency import get_residency_manager, ollama_models_for_chats
+from .cancellation import Cancelled, VolleyTokens, use_token
+from . import metrics
+from . import jobs
+from .transcripts import get_transcript_store, transcripts_enabled, notify_lines
+from .memory_index import get_memory_indexes
 
 # Turn on to enable global commands in the cloud
 _ENABLE_GLOBAL_COMMANDS = True
 _LOG_ALL_RCR = False
 _LOG_NOTIFY_RCR = True
-_MAX_WORKER_THREADS = 5
 
 logger = logging.getLogger(__name__)
 
@@ -50,9 +59,31 @@ class RemoteChat:
         self._device_sessions = {}
         self._modules = {}
         self._modules_info = {"modules": [], "version": "openmoxie_v1"}
-        self._worker_queue = concurrent.futures.ThreadPoolExecutor(max_workers=_MAX_WORKER_THREADS)
+        # live volleys, global responses and completion hooks each get their own sized pool
+        self._workloads = Workloads(
+            interactive_workers=getattr(settings, "WORKERS_INTERACTIVE", 5),
+            global_workers=getattr(settings, "WORKERS_GLOBAL", 2),
+            background_workers=getattr(settings, "WORKERS_BACKGROUND", 2),
+            background_max_yield=getattr(settings, "BACKGROUND_MAX_YIELD", 10.0),
+        )
         self._automarkup_rules = automarkup_initialize_rules()
         self._global_responses = GlobalResponses()
+        # sessions built ahead of a module launch, device_id -> { id, session, opener, markup, expires }
+        self._prewarmed = {}
+        self._prewarm_lock = threading.Lock()
+        # opener markup ready for a device's next response, device_id -> (text, markup)
+        self._premarked = {}
+        self._prewarm_built = metrics.counter("prewarm.built")
+        self._prewarm_hits = metrics.counter("prewarm.hits")
+        self._prewarm_misses = metrics.counter("prewarm.misses")
+        # one live volley per device, a newer one cancels the work of the older
+        self._volley_tokens = VolleyTokens()
+        self._discarded = metrics.counter("volley.discarded")
+        # complete hooks finished by the durable job worker get merged back in here
+        self._job_results = None
+        if jobs.durable_enabled():
+            jobs.register_metrics()
+            self._job_results = jobs.JobResultApplier(server.robot_data()).start()
         # Inicializar el publicador de espejo TTS
         self._tts_mirror = TTSMirrorPublisher()
 
@@ -68,7 +99,8 @@ class RemoteChat:
     def update_from_database(self):
         new_modules = {}
         mod_map = {}
-        for chat in SinglePromptChat.objects.all():
+        chats = list(SinglePromptChat.objects.all())
+        for chat in chats:
             # one module can support many content IDs, separated by | like openers
             cid_list = chat.content_id.split("|")
             for content_id in cid_list:
@@ -93,6 +125,10 @@ class RemoteChat:
         self._modules_info["modules"] = mlist
         self._modules = new_modules
         self._global_responses.update_from_database()
+        # prompts may have been edited, compile them again as sessions start
+        clear_compiled()
+        # warm up the local models these modules use
+        get_residency_manager().update_models(ollama_models_for_chats(chats))
 
     # Handle GLOBAL patterns, available inside (almost) any module
     def check_global(self, volley):
@@ -101,15 +137,19 @@ class RemoteChat:
     def on_chat_complete(self, device_id, id, session: ChatSession):
         logger.info(f"Chat Session Complete: {id} {session.has_complete_hook()}")
         if session.has_complete_hook():
+            robot_data = self._server.robot_data().get_volley_data(device_id)
+            # with durable jobs, the job worker runs it and the result is merged back later
+            if jobs.durable_enabled() and jobs.enqueue_complete_hook(device_id, session, robot_data):
+                return
             # make a data-only Volley for the completion hook
             volley = Volley(
                 {},
                 device_id=device_id,
                 data_only=True,
-                robot_data=self._server.robot_data().get_volley_data(device_id),
+                robot_data=robot_data,
                 local_data=session.local_data,
             )
-            self._worker_queue.submit(session.complete_hook, volley)
+            self._workloads.background.submit(session.complete_hook, volley)
 
     # Get the current or a new session for this device for this module/content ID pair
     def active_session_data(self, device_id):
@@ -128,11 +168,75 @@ class RemoteChat:
                     device_id, self._device_sessions[device_id]["id"], self._device_sessions[device_id]["session"]
                 )
 
-        # new session needed
-        new_session = {"id": id, "session": maker["xtor"](**maker["params"])}
+        # new session needed, use the prewarmed one if it is for this module
+        session = self._take_prewarmed(device_id, id)
+        new_session = {"id": id, "session": session or maker["xtor"](**maker["params"])}
         self._device_sessions[device_id] = new_session
         return new_session["session"]
 
+    # Build the session for a module we expect the device to launch next, with its opener marked up,
+    # so the prompt volley is answered from memory
+    def prewarm(self, device_id, module_id, content_id=None):
+        if not module_id:
+            return
+        id = f"{module_id}/{content_id}" if content_id else None
+        if not id or id not in self._modules:
+            # no content ID, take the first one registered for the module
+            id = next((k for k in self._modules if k.startswith(f"{module_id}/")), None)
+        if not id:
+            return
+        current = self._device_sessions.get(device_id)
+        if current and current["id"] == id:
+            return
+        with self._prewarm_lock:
+            entry = self._prewarmed.get(device_id)
+            if entry and entry["id"] == id and entry["expires"] > time.monotonic():
+                return
+        try:
+            maker = self._modules[id]
+            session = maker["xtor"](**maker["params"])
+            opener = session.prepare_opener()
+            markup = self.make_markup(opener) if opener else None
+        except Exception as e:
+            logger.warning(f"Failed to prewarm {id} for {device_id}: {e}")
+            return
+        with self._prewarm_lock:
+            self._prewarmed[device_id] = {"id": id, "session": session, "opener": opener, "markup": markup,
+                                          "expires": time.monotonic() + getattr(settings, "PREWARM_TTL", 300.0)}
+        self._prewarm_built.inc()
+        logger.debug(f"Prewarmed {id} for {device_id}")
+
+    # Prewarm the first remote module in a schedule being sent to a device.  The sessions and markup are
+    # built on the background workload, the caller (the MQTT thread) goes straight back to its messages.
+    def prewarm_schedule(self, device_id, schedule):
+        self._workloads.background.submit(self._prewarm_schedule, device_id, schedule)
+
+    def _prewarm_schedule(self, device_id, schedule):
+        for item in (schedule or {}).get("provided_schedule", []):
+            module_id = item.get("module_id")
+            if any(k.startswith(f"{module_id}/") for k in self._modules):
+                self.prewarm(device_id, module_id, item.get("content_id"))
+                return
+
+    # Prewarm the target of any launch action in a response
+    def prewarm_launches(self, device_id, response):
+        for action in response.get("response_actions", []):
+            if action.get("action") in ("launch", "launch_if_confirmed"):
+                self.prewarm(device_id, action.get("module_id"), action.get("content_id"))
+
+    def _take_prewarmed(self, device_id, id):
+        with self._prewarm_lock:
+            entry = self._prewarmed.pop(device_id, None)
+        if not entry:
+            return None
+        if entry["id"] != id or entry["expires"] <= time.monotonic():
+            self._prewarm_misses.inc()
+            return None
+        self._prewarm_hits.inc()
+        if entry["markup"]:
+            self._premarked[device_id] = (entry["opener"], entry["markup"])
+        return entry["session"]
+
     # Get a chat session object for use in the web chat
     def get_web_session_for_module(self, device_id, module_id, content_id):
         id = module_id + "/" + content_id
@@ -153,19 +257,43 @@ class RemoteChat:
     def make_markup(self, text, mood_and_intensity=None):
         return automarkup_process(text, self._automarkup_rules, mood_and_intensity=mood_and_intensity)
 
+    # Cancel any work in progress for a device, like when telehealth interrupts
+    def cancel_device(self, device_id):
+        self._volley_tokens.cancel(device_id)
+
+    # True if the volley was superseded, in which case its result is dropped
+    def _discard_if_cancelled(self, device_id, token):
+        if token and token.cancelled:
+            self._discarded.inc()
+            logger.info(f"Discarding superseded response {token.name} for {device_id}")
+            return True
+        return False
+
     # Get the next response to a chat — FINAL ONLY (no partials to the robot)
-    def create_session_response(self, device_id, sess: ChatSession, volley: Volley):
+    def create_session_response(self, device_id, sess: ChatSession, volley: Volley, token=None):
         """Unified behavior for both OpenAI and Ollama:
         - Let the session build the prompt/context and get a full answer (no device partials).
         - Add automarkup if missing.
-        - Send exactly one remote_chat response to the robot.
+        - Send exactly one remote_chat response to the robot, unless a newer volley superseded it.
         """
-        sess.handle_volley(volley)
-
+        try:
+            with use_token(token):
+                sess.handle_volley(volley)
+        except Cancelled:
+            self._discard_if_cancelled(device_id, token)
+            return
+        finally:
+            if token:
+                self._volley_tokens.finish(device_id, token)
+        if self._discard_if_cancelled(device_id, token):
+            return
+
+        premarked = self._premarked.pop(device_id, None)
         if "markup" not in volley.response["output"]:
-            # if we don't have markup, create it
+            # if we don't have markup, create it, unless it was prepared when the session was prewarmed
             text = volley.response["output"]["text"]
-            volley.set_output(text, self.make_markup(text))
+            markup = premarked[1] if premarked and premarked[0] == text else self.make_markup(text)
+            volley.set_output(text, markup)
 
         if _LOG_ALL_RCR:
             logger.info(f"RemoteChatResponse\n{volley.response}")
@@ -177,10 +305,21 @@ class RemoteChat:
             self._tts_mirror.publish_text(text)
 
         self._server.send_command_to_bot_json(device_id, "remote_chat", volley.response)
+        self.prewarm_launches(device_id, volley.response)
 
     # Produce / execute a global response
-    def global_response(self, device_id, functor):
-        resp = functor()
+    def global_response(self, device_id, functor, token=None):
+        try:
+            with use_token(token):
+                resp = functor()
+        except Cancelled:
+            self._discard_if_cancelled(device_id, token)
+            return
+        finally:
+            if token:
+                self._volley_tokens.finish(device_id, token)
+        if self._discard_if_cancelled(device_id, token):
+            return
         output = resp.get("output")
         if output.get("text") and not output.get("markup"):
             # Run automarkup on any text-only responses
@@ -192,6 +331,7 @@ class RemoteChat:
             self._tts_mirror.publish_text(text)
 
         self._server.send_command_to_bot_json(device_id, "remote_chat", resp)
+        self.prewarm_launches(device_id, resp)
 
     def log_notify(self, rcr):
         moxie_speech = rcr.get("speech")
@@ -201,6 +341,14 @@ class RemoteChat:
         if moxie_speech:
             logger.info(f"-- MOXIE: {moxie_speech} [{rcr.get('module_id')}/{rcr.get('content_id')}]")
 
+    # Keep what was said in the device's persistent transcript, queued so the volley never waits on disk
+    def record_transcript(self, device_id, module_id, rcr):
+        store = get_transcript_store()
+        memory = get_memory_indexes()
+        for role, text in notify_lines(rcr):
+            store.append(device_id, role, text, module=module_id)
+            memory.observe(device_id, role, text, module=module_id)
+
     # Entry point where all RemoteChatRequests arrive
     def handle_request(self, device_id, rcr, volley_data):
         if _LOG_ALL_RCR:
@@ -215,6 +363,8 @@ class RemoteChat:
         id = f"{module_id}/{content_id}"
         if _LOG_NOTIFY_RCR and cmd == "notify":
             self.log_notify(rcr)
+        if cmd == "notify" and transcripts_enabled():
+            self.record_transcript(device_id, module_id, rcr)
 
         maker = self._modules.get(id)
 
@@ -268,8 +418,10 @@ class RemoteChat:
                 sess.ingest_notify(volley)
             else:
                 volley = Volley(rcr, device_id=device_id, robot_data=volley_data, local_data=sess.local_data)
-                if not self.handled_global(device_id, volley):
-                    self._worker_queue.submit(self.create_session_response, device_id, sess, volley)
+                # this volley supersedes any still being worked on for the device
+                token = self._volley_tokens.begin(device_id, rcr.get("event_id", ""))
+                if not self.handled_global(device_id, volley, token):
+                    self._workloads.interactive.submit(self.create_session_response, device_id, sess, volley, token)
         else:
             # THIS IS THE PATH FOR MOXIE ON-BOARD CONTENT
             session_reset = False
@@ -279,7 +431,8 @@ class RemoteChat:
                 session_reset = True
             if cmd != "notify":
                 volley = Volley(rcr, device_id=device_id, robot_data=volley_data)
-                if not self.handled_global(device_id, volley):
+                token = self._volley_tokens.begin(device_id, rcr.get("event_id", ""))
+                if not self.handled_global(device_id, volley, token):
                     logger.debug(f"Ignoring request for other module: {id} SessionReset:{session_reset}")
                     # Rather than ignoring these, we return a generic FALLBACK response
                     fbline = "I'm sorry. Can  you repeat that?"
@@ -287,11 +440,12 @@ class RemoteChat:
                     # Publicar texto en MQTT antes de enviarlo al robot
                     self._tts_mirror.publish_text(fbline)
                     self._server.send_command_to_bot_json(device_id, "remote_chat", volley.response)
+                    self._volley_tokens.finish(device_id, token)
 
-    def handled_global(self, device_id, volley):
+    def handled_global(self, device_id, volley, token=None):
         global_functor = self.check_global(volley)
         if global_functor:
             logger.debug("Global response inside active module")
-            self._worker_queue.submit(self.global_response, device_id, global_functor)
+            self._workloads.globals.submit(self.global_response, device_id, global_functor, token)
             return True
         return False
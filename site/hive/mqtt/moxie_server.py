@@ -10,6 +10,7 @@ import logging
 import base64
 import ssl
 from .ai_factory import set_openai_key, set_xai_key
+from . import metrics
 from .robot_credentials import RobotCredentials
 from .robot_data import RobotData
 from .moxie_remote_chat import RemoteChat
@@ -242,6 +243,8 @@ class MoxieServer:
     def provide_schedule(self, req_id, device_id):
         schedule = self._robot_data.get_schedule(device_id)
         self.send_command_to_bot_json(device_id, 'query_result', { 'command': 'query_result', 'query': 'schedule', 'request_id': req_id, 'schedule': schedule} )
+        # get the first remote module ready before the robot starts it, in the background
+        self._remote_chat.prewarm_schedule(device_id, schedule)
 
     # NOTE: Called from worker thread pool
     def ingest_mentor_behavior(self, device_id, mbh):
@@ -333,6 +336,8 @@ class MoxieServer:
     def send_telehealth_interrupt(self, device_id):
         tmsg = { "action": "INTERRUPT" }
         self.send_telehealth(device_id, tmsg)
+        # anything still being generated for the robot is no longer wanted
+        self._remote_chat.cancel_device(device_id)
 
     def long_topic(self, topic_name):
         return "/devices/" + self._robot.device_id + "/events/" + topic_name
@@ -351,6 +356,7 @@ class MoxieServer:
     # Print out client metrics, called periodically in the background
     def print_metrics(self):
         logger.info(f"Client Metrics: {self._client_metrics}")
+        logger.info(f"Hive Metrics: {metrics.snapshot()}")
 
     # Start client connection loop
     def start(self):
@@ -0,0 +1,138 @@
+'''
+OLLAMA POOL - Least-loaded routing across several Ollama hosts
+
+OLLAMA_HOSTS lists the inference boxes.  Each host tracks its outstanding requests, a moving average
+of its recent latency, and which models it has resident (from `ollama ps`).  A background thread
+checks every host on an interval, and hosts that fail the check are skipped until they pass again.
+
+A chat goes to the healthy host with the lowest expected wait that already has the model loaded and
+is below its outstanding request limit, or to the least loaded healthy host if there is none.  Per-host
+saturation (outstanding / limit) is reported in the hive metrics.
+'''
+import logging
+import threading
+import time
+import ollama
+from django.conf import settings
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest sample in the latency moving average
+_EWMA_ALPHA = 0.3
+
+class NoHealthyHost(RuntimeError):
+    pass
+
+class OllamaHost:
+    def __init__(self, url, timeout, max_outstanding):
+        self.url = url
+        self.max_outstanding = max_outstanding
+        self.client = ollama.Client(host=url, timeout=timeout)
+        self.healthy = True
+        self.outstanding = 0
+        self.ewma_ms = 0.0
+        self.resident = set()
+        self.completed = 0
+
+    # Expected wait if one more request lands here
+    def load_score(self):
+        return (self.outstanding + 1) * max(self.ewma_ms, 1.0)
+
+    @property
+    def saturated(self):
+        return self.outstanding >= self.max_outstanding
+
+    def snapshot(self):
+        return {
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "saturation": round(self.outstanding / self.max_outstanding, 2),
+            "ewma_ms": round(self.ewma_ms, 1),
+            "completed": self.completed,
+            "resident": sorted(self.resident),
+        }
+
+class OllamaPool:
+    def __init__(self, urls, timeout=30.0, health_interval=15.0, max_outstanding=4):
+        self._hosts = [ OllamaHost(url, timeout, max_outstanding) for url in urls ]
+        self._lock = threading.Lock()
+        self._health_interval = health_interval
+        self._health_thread = None
+        metrics.gauge("ollama.hosts", lambda: { h.url: h.snapshot() for h in self._hosts })
+
+    @property
+    def hosts(self):
+        return self._hosts
+
+    def start(self):
+        if self._health_thread:
+            return
+        self._health_thread = threading.Thread(target=self._health_loop, name="ollama-health", daemon=True)
+        self._health_thread.start()
+
+    def _health_loop(self):
+        while True:
+            self.check_health()
+            time.sleep(self._health_interval)
+
+    def check_health(self):
+        for host in self._hosts:
+            try:
+                resp = host.client.ps()
+                models = { m.get("model") or m.get("name") for m in (resp.get("models") or []) }
+                with self._lock:
+                    if not host.healthy:
+                        logger.info(f"Ollama host {host.url} is back")
+                    host.healthy = True
+                    host.resident = { m for m in models if m }
+            except Exception as e:
+                with self._lock:
+                    if host.healthy:
+                        logger.warning(f"Ollama host {host.url} failed health check: {e}")
+                    host.healthy = False
+
+    # Pick a host for this model and count the request against it
+    def acquire(self, model) -> OllamaHost:
+        with self._lock:
+            healthy = [ h for h in self._hosts if h.healthy ]
+            if not healthy:
+                raise NoHealthyHost("No healthy Ollama hosts")
+            warm = [ h for h in healthy if _is_resident(h, model) and not h.saturated ]
+            host = min(warm or healthy, key=OllamaHost.load_score)
+            host.outstanding += 1
+            return host
+
+    def release(self, host, elapsed_ms, model=None, ok=True):
+        with self._lock:
+            host.outstanding -= 1
+            if not ok:
+                return
+            host.completed += 1
+            host.ewma_ms = elapsed_ms if not host.ewma_ms else _EWMA_ALPHA * elapsed_ms + (1 - _EWMA_ALPHA) * host.ewma_ms
+            if model:
+                # whatever we just ran is loaded now
+                host.resident.add(model)
+
+# Ollama reports "llama3:latest" for a model asked for as "llama3"
+def _is_resident(host, model):
+    return model in host.resident or f"{model}:latest" in host.resident
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+def get_ollama_hosts():
+    hosts = [ h.strip() for h in getattr(settings, "OLLAMA_HOSTS", "").split(",") if h.strip() ]
+    return hosts or [ getattr(settings, "OLLAMA_HOST", "http://127.0.0.1:11434") ]
+
+# The shared pool over OLLAMA_HOSTS, health checks start on first use
+def get_ollama_pool() -> OllamaPool:
+    global _POOL
+    with _POOL_LOCK:
+        if not _POOL:
+            _POOL = OllamaPool(get_ollama_hosts(),
+                               timeout=getattr(settings, "LLM_TIMEOUT", 30.0),
+                               health_interval=getattr(settings, "OLLAMA_HEALTH_INTERVAL", 15.0),
+                               max_outstanding=getattr(settings, "OLLAMA_HOST_MAX_OUTSTANDING", 4))
+            _POOL.start()
+        return _POOL
@@ -0,0 +1,216 @@
+'''
+PATTERN MATCHER - Find the first of many regex patterns that matches, without trying them all
+
+Global commands are checked on every utterance, in priority order, and most can't possibly match
+a given one.  Each pattern is parsed once for the sets of literal strings it requires, where a match
+contains at least one literal of each set (for "^(moxie|foxy) (play|juega) (.*)" that's {"moxie",
+"foxy"} and {"play", "juega"}), and is indexed under the set fewest other patterns share.  All
+those literals go into one Aho-Corasick automaton, so a single pass over the speech finds every
+pattern that could match.  Only those, plus the few patterns with no required literal (like ".*"), are tried with their
+own regex, still in priority order, so the first match and its groups are the same as a linear scan.
+
+Below min_patterns (GLOBAL_MATCH_PREFILTER_MIN) every pattern is simply tried in order: the scan over
+the speech costs more than a handful of regexes, and the global_match bench has the prefilter only
+catching up with the linear scan at 20 to 30 patterns.
+'''
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:     # python < 3.11
+    import sre_parse, sre_constants
+
+_C = sre_constants
+
+# Characters that case-insensitive regexes match to a different ASCII letter, folded before scanning
+_FOLD = str.maketrans({ "\u017f": "s", "\u0131": "i", "\u0130": "i" })
+
+# The literal sets a pattern requires: a match contains at least one literal of each set
+def literal_options(pattern):
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return []
+    ignore_case = bool(parsed.state.flags & _C.SRE_FLAG_IGNORECASE)
+    return _requirements(list(parsed), ignore_case)
+
+# Every literal set that a sequence of parsed items requires
+def _requirements(items, ignore_case):
+    options = []
+    run = []
+
+    def end_run():
+        if run:
+            options.append(frozenset([ "".join(run) ]))
+            run.clear()
+
+    for op, av in items:
+        if op is _C.LITERAL:
+            ch = chr(av).lower() if ignore_case else chr(av)
+            if len(ch) == 1:
+                run.append(ch)
+                continue
+        end_run()
+        if op is _C.SUBPATTERN:
+            _, add_flags, del_flags, sub = av
+            sub_case = (ignore_case or bool(add_flags & _C.SRE_FLAG_IGNORECASE)) and not (del_flags & _C.SRE_FLAG_IGNORECASE)
+            options.extend(_requirements(list(sub), sub_case))
+        elif op is _C.BRANCH:
+            branch_sets = []
+            for branch in av[1]:
+                sub = _requirements(list(branch), ignore_case)
+                if not sub:
+                    # this alternative needs no literal, so the alternation doesn't either
+                    branch_sets = None
+                    break
+                branch_sets.append(max(sub, key=lambda lits: min(len(l) for l in lits)))
+            if branch_sets:
+                options.append(frozenset().union(*branch_sets))
+        elif op in (_C.MAX_REPEAT, _C.MIN_REPEAT) or op is getattr(_C, "POSSESSIVE_REPEAT", None):
+            low, _, sub = av
+            if low >= 1:
+                options.extend(_requirements(list(sub), ignore_case))
+        elif op is getattr(_C, "ATOMIC_GROUP", None):
+            options.extend(_requirements(list(av), ignore_case))
+        # anything else (classes, anchors, lookarounds, backreferences) requires no literal
+    end_run()
+    return options
+
+# Aho-Corasick automaton over literals, reporting the ids attached to every literal found
+class _Automaton:
+    def __init__(self):
+        self._goto = [ {} ]
+        self._fail = [ 0 ]
+        self._out = [ frozenset() ]
+
+    def add(self, literal, ids):
+        state = 0
+        for ch in literal:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(frozenset())
+            state = nxt
+        self._out[state] = self._out[state] | ids
+
+    def build(self):
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] | self._out[self._fail[nxt]]
+
+    def search(self, text):
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found |= out[state]
+        return found
+
+class PatternMatcher:
+    def __init__(self, patterns, min_patterns=32):
+        self.size = len(patterns)
+        self._always = []
+        if self.size < min_patterns:
+            # too few to be worth prefiltering, every pattern is a candidate
+            self._automaton = None
+            self._always = list(range(self.size))
+            self.prefiltered = 0
+            return
+        options = [ literal_options(p) for p in patterns ]
+        # how many patterns could index under each literal, shared ones (wake words) rule out little
+        shared = {}
+        for opts in options:
+            for lit in set().union(*opts):
+                shared[lit] = shared.get(lit, 0) + 1
+        by_literal = {}
+        for i, opts in enumerate(options):
+            if not opts:
+                self._always.append(i)
+                continue
+            # the set that lets through the fewest other patterns, then the one with the longest literals
+            literals = min(opts, key=lambda lits: (sum(shared[l] for l in lits), -min(len(l) for l in lits)))
+            for lit in literals:
+                by_literal.setdefault(lit, set()).add(i)
+        self._automaton = _Automaton()
+        for lit, ids in by_literal.items():
+            self._automaton.add(lit, frozenset(ids))
+        self._automaton.build()
+        self.prefiltered = self.size - len(self._always)
+
+    # Indexes of the patterns that could match the text, in priority order
+    def candidates(self, text):
+        if self._automaton is None:
+            return self._always
+        found = self._automaton.search(text.translate(_FOLD))
+        if self._always:
+            found.update(self._always)
+        return sorted(found)
+
+# The phrases a pattern matches when it's only literals, alternations and optional parts, up to limit
+# of them, as (phrases, anchored_at_end).  Patterns with wildcards or open classes return None.
+def literal_phrases(pattern, limit=64):
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return None
+    state = { "end": False }
+    phrases = _expand(list(parsed), limit, state)
+    if not phrases:
+        return None
+    return sorted(p for p in phrases if p.strip()), state["end"]
+
+def _expand(items, limit, state):
+    phrases = { "" }
+    for op, av in items:
+        if op is _C.LITERAL:
+            options = { chr(av) }
+        elif op is _C.AT:
+            if av in (_C.AT_END, _C.AT_END_STRING):
+                state["end"] = True
+            continue
+        elif op is _C.SUBPATTERN:
+            options = _expand(list(av[3]), limit, state)
+        elif op is _C.BRANCH:
+            options = set()
+            for branch in av[1]:
+                sub = _expand(list(branch), limit, state)
+                if sub is None:
+                    return None
+                options |= sub
+        elif op is _C.IN:
+            # a class stands for one character only when it's a set of literals or whitespace
+            options = set()
+            for item_op, item_av in av:
+                if item_op is _C.LITERAL:
+                    options.add(chr(item_av))
+                elif item_op is _C.CATEGORY and item_av is _C.CATEGORY_SPACE:
+                    options.add(" ")
+                else:
+                    return None
+        elif op in (_C.MAX_REPEAT, _C.MIN_REPEAT):
+            low, high, sub = av
+            sub = _expand(list(sub), limit, state)
+            if sub is None:
+                return None
+            # optional parts both ways, repeats as their fewest copies
+            options = { "" } | sub if low == 0 and high >= 1 else { s * low for s in sub }
+        else:
+            return None
+        if options is None:
+            return None
+        phrases = { p + o for p in phrases for o in options }
+        if len(phrases) > limit:
+            return None
+    return phrases
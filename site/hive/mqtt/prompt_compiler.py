@@ -0,0 +1,86 @@
+'''
+PROMPT COMPILER - Compile chat prompts once so rendering a volley's context is cheap
+
+Prompts are Django templates, but most have no template tags at all and the rest are mostly plain
+{{ variable }} references.  A compiled prompt is one of
+
+    static      no tags, the rendering is the prompt itself and its system message is built once
+    fragments   only text and {{ variable|filters }}, text is kept as is and only the variables
+                are resolved each volley
+    template    anything with {% tags %}, rendered by the precompiled Template as before
+
+Compiled prompts are cached by prompt text, so every session of a chat shares one.
+'''
+import threading
+from django.template import Template, Context
+from django.template.base import TextNode, VariableNode, render_value_in_context
+
+STATIC = "static"
+FRAGMENTS = "fragments"
+TEMPLATE = "template"
+
+# A message dict that can't be changed, for messages shared between volleys and sessions
+class FrozenMessage(dict):
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("Shared prompt messages are read-only")
+
+    __setitem__ = __delitem__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return dict(self)
+
+class CompiledPrompt:
+    def __init__(self, prompt):
+        self.prompt = prompt
+        self.message = None
+        self._template = None
+        self._parts = None
+        if not any(marker in prompt for marker in ("{{", "{%", "{#")):
+            self.kind = STATIC
+            self.message = FrozenMessage(role="system", content=prompt)
+            return
+        self._template = Template(prompt)
+        nodes = list(self._template.nodelist)
+        if all(isinstance(n, (TextNode, VariableNode)) for n in nodes):
+            self.kind = FRAGMENTS
+            self._parts = [ n.s if isinstance(n, TextNode) else n.filter_expression for n in nodes ]
+        else:
+            self.kind = TEMPLATE
+
+    @property
+    def is_static(self):
+        return self.kind == STATIC
+
+    # Render the prompt for a template context dict
+    def render(self, data):
+        if self.kind == STATIC:
+            return self.prompt
+        context = Context(data)
+        if self.kind == TEMPLATE:
+            return self._template.render(context)
+        # same as VariableNode.render, without the per-node and template bookkeeping
+        context.template = self._template
+        return "".join(p if isinstance(p, str) else render_value_in_context(p.resolve(context), context)
+                       for p in self._parts)
+
+_COMPILED = {}
+_COMPILED_LOCK = threading.Lock()
+
+def compile_prompt(prompt) -> CompiledPrompt:
+    compiled = _COMPILED.get(prompt)
+    if compiled is None:
+        with _COMPILED_LOCK:
+            compiled = _COMPILED.get(prompt)
+            if compiled is None:
+                compiled = CompiledPrompt(prompt)
+                _COMPILED[prompt] = compiled
+    return compiled
+
+# Drop compiled prompts, when chats are reloaded from the database
+def clear_compiled():
+    with _COMPILED_LOCK:
+        _COMPILED.clear()
@@ -160,6 +160,20 @@ class RobotData:
             persistent_data, persistent_data_created = PersistentData.objects.get_or_create(device=device, defaults={'data': {}})
             return persistent_data.data
     
+    # Merge changes made outside the hive (durable background jobs) into a robot's persist data
+    def merge_persist(self, robot_id, updates, removed=()):
+        prec = self._robot_map.get(robot_id, {}).get("persistent_data")
+        if not prec:
+            device = MoxieDevice.objects.filter(device_id=robot_id).first()
+            if not device:
+                logger.warning(f'No device {robot_id} to merge persist data into')
+                return
+            prec, _ = PersistentData.objects.get_or_create(device=device, defaults={'data': {}})
+        prec.data.update(updates)
+        for key in removed:
+            prec.data.pop(key, None)
+        prec.save()
+
     # Get the active configuration for a device from the database objects
     def get_config_for_device(self, device):
         curr_cfg = HiveConfiguration.objects.filter(name='default').first()
@@ -0,0 +1,78 @@
+'''
+SENTENCE BUDGET - Stop generation once a response has as many sentences or words as Moxie will say
+
+Moxie speaks short utterances, but models happily keep going until max_tokens.  A budget watches the
+text as it streams in and reports when the module's sentence or word limit is reached, so the provider
+can close the request instead of paying for a tail that gets thrown away.  Word limits cut at the last
+whole sentence that fits, or at the limit itself if the first sentence is already too long.  When
+both limits are set, whichever cuts shorter wins.
+'''
+import re
+from . import metrics
+
+# End of a sentence: terminal punctuation and closing quotes/brackets, followed by whitespace
+_SENTENCE_END = re.compile(r'[.!?…]+["\'»)\]]*(?=\s)')
+_WORD = re.compile(r'\S+')
+# Words whose period doesn't end the sentence ("Dr. Smith", "e.g. cats", initials like "J. Smith")
+_ABBREVIATION = re.compile(r'\b(?:Dr|Mr|Mrs|Ms|Mx|Prof|St|Jr|Sr|vs|e\.g|i\.e|[A-Z])$')
+
+# Stop sequences that end a spoken reply, sent to vendors along with a budget
+STOP_SEQUENCES = [ "\n\n" ]
+
+class SentenceBudget:
+    def __init__(self, max_sentences=0, max_words=0):
+        self.max_sentences = max_sentences or 0
+        self.max_words = max_words or 0
+        self.text = ""
+        self.done = False
+
+    @property
+    def active(self):
+        return self.max_sentences > 0 or self.max_words > 0
+
+    # Add streamed text, returns True once the budget is reached and the rest should be dropped
+    def feed(self, delta):
+        if self.done:
+            return True
+        self.text += delta
+        ends = self._sentence_ends()
+        cuts = []
+        if self.max_sentences and len(ends) >= self.max_sentences:
+            cuts.append(ends[self.max_sentences - 1])
+        if self.max_words:
+            # a word is complete once whitespace follows it
+            words = [ m.end() for m in _WORD.finditer(self.text) if m.end() < len(self.text) ]
+            if len(words) >= self.max_words:
+                limit = words[self.max_words - 1]
+                whole = [ e for e in ends if e <= limit ]
+                cuts.append(whole[-1] if whole else limit)
+        if cuts:
+            self._cut(min(cuts))
+        return self.done
+
+    def _sentence_ends(self):
+        ends = []
+        for m in _SENTENCE_END.finditer(self.text):
+            if m.group().startswith(".") and not m.group().startswith("..") and \
+                    _ABBREVIATION.search(self.text, 0, m.start()):
+                continue
+            ends.append(m.end())
+        return ends
+
+    def _cut(self, pos):
+        self.text = self.text[:pos]
+        self.done = True
+
+    # Final text, recording whether the budget stopped generation early
+    def finish(self):
+        if self.active:
+            metrics.counter("llm.budget.truncated" if self.done else "llm.budget.complete").inc()
+        return self.text.strip()
+
+# Apply a budget to a complete response, for vendors that can't be stopped mid-stream
+def apply_budget(text, max_sentences=0, max_words=0):
+    budget = SentenceBudget(max_sentences, max_words)
+    if not budget.active or not text:
+        return text
+    budget.feed(text)
+    return budget.finish()
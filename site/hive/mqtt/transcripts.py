@@ -0,0 +1,481 @@
+'''
+TRANSCRIPTS - Persistent per-device conversation transcripts, in append-only segment files
+
+Chat history lives in the session and is gone on a module switch or restart.  The transcript store
+keeps every line either side said, per device, under DATA_STORE_DIR/transcripts:
+
+    <device>/00000001.seg     records, appended in time order
+    <device>/00000002.seg     segments roll over at TRANSCRIPT_SEGMENT_BYTES, or once their first line is a day old
+    <device>/index.json       per sealed segment: first/last timestamp, record count and modules
+
+Each record is a small fixed header (text length, timestamp ms, role, module length) followed by the
+module id and text in UTF-8.  Segments are read through mmap, and the index lets reads by module or
+time skip segments that can't match.
+
+Appends only queue the record; a writer thread does the file work, flushing each batch and calling
+fsync at most every TRANSCRIPT_FSYNC_INTERVAL seconds, so the volley thread never waits on the disk.
+A device's index and newest records are read from disk once, by the writer before its first write
+(or by the first read, if that comes sooner).  The last TRANSCRIPT_TAIL_CACHE records of each device
+are kept in memory for prompt building:
+
+Lines are kept for TRANSCRIPT_RETENTION_DAYS (0 keeps them forever).  When a segment rolls over, and
+hourly for every device on disk, the writer deletes the oldest segments whose newest line is past that,
+so nothing outlives it by more than a day.  Record numbers carry on after deleted segments.
+
+    store = get_transcript_store()
+    store.tail(volley.device_id, 20, module="OPENMOXIE_CHAT")    # newest last
+    for rec in store.export(device_id, since_ms=...): ...
+'''
+import atexit
+import collections
+import json
+import logging
+import mmap
+import os
+import queue
+import re
+import struct
+import threading
+import time
+from pathlib import Path
+from django.conf import settings
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+USER = "user"
+ASSISTANT = "assistant"
+SYSTEM = "system"
+NOTE = "note"       # facts code hooks remember about the user (see memory_index.py)
+_ROLE_CODES = { USER: 1, ASSISTANT: 2, SYSTEM: 3, NOTE: 4 }
+_ROLE_NAMES = { v: k for k, v in _ROLE_CODES.items() }
+
+# text length, timestamp ms, role, module id length
+_HEADER = struct.Struct("<IqBH")
+_SEGMENT_SUFFIX = ".seg"
+_INDEX_FILE = "index.json"
+
+_DAY_MS = 24 * 3600 * 1000
+# Seconds between sweeps for lines past the retention period, the first queued at start so flush() waits for it
+_PURGE_INTERVAL = 3600.0
+_PURGE = None
+
+def _now_ms():
+    return time.time_ns() // 1_000_000
+
+def _encode(ts_ms, role, module, text):
+    mod = module.encode("utf-8")
+    body = text.encode("utf-8")
+    return _HEADER.pack(len(body), ts_ms, _ROLE_CODES.get(role, 3), len(mod)) + mod + body
+
+# Records in a segment file as (ts_ms, role, module, text), stopping at a partially written tail
+def _read_segment(path):
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                out = []
+                pos = 0
+                size = len(mm)
+                while pos + _HEADER.size <= size:
+                    length, ts, role, mlen = _HEADER.unpack_from(mm, pos)
+                    end = pos + _HEADER.size + mlen + length
+                    if end > size:
+                        break
+                    start = pos + _HEADER.size
+                    out.append((ts, _ROLE_NAMES.get(role, SYSTEM), mm[start:start + mlen].decode("utf-8"),
+                                mm[start + mlen:end].decode("utf-8")))
+                    pos = end
+                return out
+    except FileNotFoundError:
+        return []
+
+def _as_dict(device_id, rec):
+    ts, role, module, text = rec
+    return { "device_id": device_id, "ts": ts, "role": role, "module": module, "text": text }
+
+# The transcript lines in a notify request: what the user said, and what Moxie said aloud
+def notify_lines(rcr):
+    lines = [ (USER, line.get("text", "")) for line in rcr.get("extra_lines", [])
+              if line.get("context_type") == "input" and line.get("text") ]
+    speech = rcr.get("speech")
+    if speech and "animation:" not in speech and "silent:" not in speech:
+        lines.append((ASSISTANT, speech))
+    return lines
+
+def _dir_name(device_id):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", device_id)
+
+class _DeviceLog:
+    def __init__(self, root: Path, device_id):
+        self.device_id = device_id
+        self.dir = root / _dir_name(device_id)
+        self.lock = threading.Lock()
+        self.load_lock = threading.Lock()
+        self.index = []          # sealed segments
+        self.active = None       # { seq, first_ts, last_ts, records, modules }
+        self.file = None
+        self.dirty = False
+        # Records are numbered in write order across segments, from 0.  Until the log is loaded, lines
+        # appended go to pending; after, to recent, the newest of them (record total - len(recent) first).
+        self.recent = None
+        self.pending = []
+        self.total = 0           # records stored or queued
+        self.written = 0         # records in the segment files
+        self.purged = 0          # records deleted past retention since loading, numbering starts after them
+
+    @property
+    def loaded(self):
+        return self.recent is not None
+
+    def _segment_path(self, seq):
+        return self.dir / f"{seq:08d}{_SEGMENT_SUFFIX}"
+
+    def load(self):
+        index_path = self.dir / _INDEX_FILE
+        if index_path.exists():
+            try:
+                self.index = json.loads(index_path.read_text(encoding="utf-8"))
+            except Exception as e:
+                logger.warning(f"Rebuilding unreadable transcript index {index_path}: {e}")
+                self.index = []
+        sealed = { e["seq"] for e in self.index }
+        seqs = sorted(int(p.stem) for p in self.dir.glob(f"*{_SEGMENT_SUFFIX}")) if self.dir.exists() else []
+        # any segment missing from the index (the last one, or after a crash) is summarized by scanning it
+        for seq in seqs:
+            if seq not in sealed:
+                entry = self._summarize(seq)
+                if seq == seqs[-1]:
+                    self.active = entry
+                elif entry["records"]:
+                    self.index.append(entry)
+        self.index.sort(key=lambda e: e["seq"])
+
+    def _summarize(self, seq):
+        recs = _read_segment(self._segment_path(seq))
+        return { "seq": seq, "first_ts": recs[0][0] if recs else None, "last_ts": recs[-1][0] if recs else None,
+                 "records": len(recs), "modules": sorted({ r[2] for r in recs }) }
+
+    def segments(self):
+        return self.index + ([ self.active ] if self.active else [])
+
+    # --- writer thread only ---
+
+    # Write a record, True if that rolled the segment over
+    def append(self, data, ts, module, segment_bytes, segment_ms=None):
+        sealed = False
+        if segment_ms and self.active and self.active["first_ts"] is not None and ts - self.active["first_ts"] >= segment_ms:
+            self.seal()
+            sealed = True
+        if self.file is None:
+            with self.lock:
+                if self.active is None:
+                    seq = self.index[-1]["seq"] + 1 if self.index else 1
+                    self.active = { "seq": seq, "first_ts": None, "last_ts": None, "records": 0, "modules": [] }
+            self.dir.mkdir(parents=True, exist_ok=True)
+            self.file = open(self._segment_path(self.active["seq"]), "ab")
+        self.file.write(data)
+        self.dirty = True
+        with self.lock:
+            a = self.active
+            if a["first_ts"] is None:
+                a["first_ts"] = ts
+            a["last_ts"] = ts
+            a["records"] += 1
+            if module not in a["modules"]:
+                a["modules"].append(module)
+            self.written += 1
+        if self.file.tell() >= segment_bytes:
+            self.seal()
+            sealed = True
+        return sealed
+
+    def flush(self, sync):
+        if self.file and self.dirty:
+            self.file.flush()
+            if sync:
+                os.fsync(self.file.fileno())
+                self.dirty = False
+
+    # Close the active segment and record it in the index
+    def seal(self):
+        self.close()
+        with self.lock:
+            self.active["modules"].sort()
+            self.index.append(self.active)
+            self.active = None
+        self._write_index()
+
+    def _write_index(self):
+        with self.lock:
+            index = json.dumps(self.index)
+        tmp = self.dir / (_INDEX_FILE + ".tmp")
+        tmp.write_text(index, encoding="utf-8")
+        os.replace(tmp, self.dir / _INDEX_FILE)
+
+    # Delete the oldest segments whose newest line is before before_ms, returns how many records went
+    def purge(self, before_ms):
+        expired = lambda e: e["last_ts"] is None or e["last_ts"] < before_ms
+        with self.lock:
+            n = 0
+            while n < len(self.index) and expired(self.index[n]):
+                n += 1
+            drop_active = n == len(self.index) and self.active is not None and expired(self.active)
+        if not n and not drop_active:
+            return 0
+        if drop_active:
+            self.close()
+        with self.lock:
+            gone = self.index[:n] + ([ self.active ] if drop_active else [])
+            self.index = self.index[n:]
+            if drop_active:
+                self.active = None
+            dropped = sum(e["records"] for e in gone)
+            self.purged += dropped
+            # nor can the cached tail keep them
+            first = self.total - len(self.recent)
+            for _ in range(min(len(self.recent), self.purged - first)):
+                self.recent.popleft()
+        for entry in gone:
+            try:
+                self._segment_path(entry["seq"]).unlink()
+            except FileNotFoundError:
+                pass
+        self._write_index()
+        return dropped
+
+    def close(self):
+        if self.file:
+            self.flush(sync=True)
+            self.file.close()
+            self.file = None
+
+class TranscriptStore:
+    def __init__(self, root=None, segment_bytes=None, fsync_interval=None, tail_cache=None, retention_days=None):
+        self._root = Path(root or Path(getattr(settings, "DATA_STORE_DIR", ".")) / "transcripts")
+        self._segment_bytes = segment_bytes or getattr(settings, "TRANSCRIPT_SEGMENT_BYTES", 1 << 20)
+        self._fsync_interval = fsync_interval if fsync_interval is not None else getattr(settings, "TRANSCRIPT_FSYNC_INTERVAL", 5.0)
+        self._tail_cache = tail_cache or getattr(settings, "TRANSCRIPT_TAIL_CACHE", 200)
+        days = retention_days if retention_days is not None else getattr(settings, "TRANSCRIPT_RETENTION_DAYS", 30)
+        self._retention_ms = int(days * _DAY_MS)
+        # with a retention period, segments also roll over by age so they can expire
+        self._segment_ms = min(_DAY_MS, self._retention_ms) if self._retention_ms else None
+        self._devices = {}
+        self._devices_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._appended = metrics.counter("transcripts.appended")
+        self._write_stat = metrics.latency("transcripts.write")
+        self._purged = metrics.counter("transcripts.purged")
+        metrics.gauge("transcripts.pending", self._queue.qsize)
+        if self._retention_ms:
+            self._queue.put(_PURGE)
+        self._thread = threading.Thread(target=self._writer, name="hive-transcripts", daemon=True)
+        self._thread.start()
+
+    # Logs are keyed by their directory, so a sweep over the directories finds the same ones
+    def _device(self, device_id) -> _DeviceLog:
+        key = _dir_name(device_id)
+        with self._devices_lock:
+            log = self._devices.get(key)
+            if log is None:
+                log = _DeviceLog(self._root, device_id)
+                self._devices[key] = log
+            return log
+
+    # Read the device's index and newest records, once, before anything is written to or read from it
+    def _load(self, log: _DeviceLog):
+        if log.loaded:
+            return
+        with log.load_lock:
+            if log.loaded:
+                return
+            log.load()
+            segments = log.segments()
+            recs = []
+            for entry in reversed(segments):
+                recs[:0] = _read_segment(log._segment_path(entry["seq"]))
+                if len(recs) >= self._tail_cache:
+                    break
+            stored = sum(e["records"] for e in segments)
+            with log.lock:
+                log.written = stored
+                log.total = stored + len(log.pending)
+                log.recent = collections.deque(recs[-self._tail_cache:] + log.pending, maxlen=self._tail_cache)
+                log.pending = None
+
+    # Queue a line for the device's transcript, never waits on the disk
+    def append(self, device_id, role, text, module="", ts_ms=None):
+        if not text:
+            return
+        ts = ts_ms or _now_ms()
+        log = self._device(device_id)
+        rec = (ts, role, module, text)
+        with log.lock:
+            if log.loaded:
+                log.recent.append(rec)
+                log.total += 1
+            else:
+                log.pending.append(rec)
+        self._queue.put((log, _encode(ts, role, module, text), ts, module))
+        self._appended.inc()
+
+    # The newest n lines as (role, text) dicts, oldest first, optionally for one module only
+    def tail(self, device_id, n=20, module=None):
+        log = self._device(device_id)
+        self._load(log)
+        with log.lock:
+            recent = list(log.recent)
+            first = log.total - len(recent)
+            written = log.written
+        picked = [ r for r in recent if module is None or r[2] == module ][-n:]
+        if len(picked) < n and first > 0:
+            # older than the cache, read back through the segments, once they hold all of those
+            if written < first:
+                self.flush()
+            older = [ r for pos, r in self._scan_numbered(log, module=module) if pos < first ]
+            picked = (older + picked)[-n:]
+        return [ _as_dict(device_id, r) for r in picked ]
+
+    # Every line for a device, oldest first: what the segment files hold plus what is still queued,
+    # without waiting for the writer
+    def records(self, device_id):
+        log = self._device(device_id)
+        self._load(log)
+        with log.lock:
+            recent = list(log.recent)
+            first = log.total - len(recent)
+            written = log.written
+        for pos, rec in self._scan_numbered(log):
+            if pos >= written:
+                break
+            yield _as_dict(device_id, rec)
+        for rec in recent[max(0, written - first):]:
+            yield _as_dict(device_id, rec)
+
+    # Every stored line for a device, oldest first, filtered by module and time (ms since the epoch)
+    def export(self, device_id, module=None, since_ms=None, until_ms=None):
+        self.flush()
+        log = self._device(device_id)
+        for rec in self._scan(log, module, since_ms, until_ms):
+            yield _as_dict(device_id, rec)
+
+    def _scan(self, log: _DeviceLog, module=None, since_ms=None, until_ms=None):
+        for _, rec in self._scan_numbered(log, module, since_ms, until_ms):
+            yield rec
+
+    # Written records as (record number, record)
+    def _scan_numbered(self, log: _DeviceLog, module=None, since_ms=None, until_ms=None):
+        self._load(log)
+        with log.lock:
+            segments = [ dict(e) for e in log.segments() ]
+            start = log.purged
+        for entry in segments:
+            first, start = start, start + entry["records"]
+            # skip segments the index says can't match
+            if module is not None and module not in entry["modules"]:
+                continue
+            if since_ms is not None and entry["last_ts"] is not None and entry["last_ts"] < since_ms:
+                continue
+            if until_ms is not None and entry["first_ts"] is not None and entry["first_ts"] > until_ms:
+                continue
+            for pos, rec in enumerate(_read_segment(log._segment_path(entry["seq"])), first):
+                if module is not None and rec[2] != module:
+                    continue
+                if (since_ms is not None and rec[0] < since_ms) or (until_ms is not None and rec[0] > until_ms):
+                    continue
+                yield pos, rec
+
+    def devices(self):
+        if not self._root.exists():
+            return []
+        return sorted(p.name for p in self._root.iterdir() if p.is_dir())
+
+    # Wait until everything queued so far has been written
+    def flush(self):
+        self._queue.join()
+
+    # Write out everything queued and close the segment files, at exit
+    def close(self):
+        self.flush()
+        with self._devices_lock:
+            logs = list(self._devices.values())
+        for log in logs:
+            log.close()
+
+    # Delete what is past the retention period, for one device or all of them (writer thread only)
+    def _purge(self, logs=None):
+        before = _now_ms() - self._retention_ms
+        if logs is None:
+            logs = [ self._device(name) for name in self.devices() ]
+        for log in logs:
+            try:
+                self._load(log)
+                dropped = log.purge(before)
+                if dropped:
+                    logger.info(f"Deleted {dropped} transcript lines past retention for {log.device_id}")
+                    self._purged.inc(dropped)
+            except Exception as e:
+                logger.error(f"Failed to purge transcript for {log.device_id}: {e}")
+
+    def _writer(self):
+        last_sync = time.monotonic()
+        last_purge = time.monotonic()
+        while True:
+            if self._retention_ms and time.monotonic() - last_purge >= _PURGE_INTERVAL:
+                self._purge()
+                last_purge = time.monotonic()
+            try:
+                batch = [ self._queue.get(timeout=self._fsync_interval or None) ]
+            except queue.Empty:
+                batch = []
+            while len(batch) < 256:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            start = time.perf_counter()
+            touched = set()
+            for item in batch:
+                if item is _PURGE:
+                    self._purge()
+                    continue
+                log, data, ts, module = item
+                try:
+                    self._load(log)
+                    if log.append(data, ts, module, self._segment_bytes, self._segment_ms) and self._retention_ms:
+                        self._purge([ log ])
+                    touched.add(log)
+                except Exception as e:
+                    logger.error(f"Failed to write transcript for {log.device_id}: {e}")
+            sync = time.monotonic() - last_sync >= self._fsync_interval
+            if sync:
+                with self._devices_lock:
+                    logs = list(self._devices.values())
+            else:
+                logs = touched
+            for log in logs:
+                try:
+                    log.flush(sync)
+                except Exception as e:
+                    logger.error(f"Failed to flush transcript for {log.device_id}: {e}")
+            if sync:
+                last_sync = time.monotonic()
+            if batch:
+                self._write_stat.observe((time.perf_counter() - start) * 1000)
+            for _ in batch:
+                self._queue.task_done()
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+def get_transcript_store() -> TranscriptStore:
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = TranscriptStore()
+            atexit.register(_STORE.close)
+        return _STORE
+
+def transcripts_enabled():
+    return getattr(settings, "TRANSCRIPTS_ENABLED", True)
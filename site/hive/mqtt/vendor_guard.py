@@ -0,0 +1,232 @@
+'''
+VENDOR GUARD - Per-vendor concurrency limit and circuit breaker for LLM calls
+
+Every call to a vendor goes through that vendor's guard.  The guard caps the number of requests in
+flight (extra callers wait up to the queue timeout, then fail fast), and counts consecutive failures.
+After enough of them the breaker opens and calls fail immediately for a cooldown period, after which
+a single trial call is let through to see if the vendor has recovered.
+
+Background calls (complete hooks, see workload.current_work_class) may only hold the slots left
+after LLM_INTERACTIVE_RESERVED are set aside, and never take a free slot while a live turn is waiting
+for one, so summaries and memory updates don't queue live turns behind them at the backend.
+
+This keeps a stalled Ollama from pinning every worker thread in the hive.
+'''
+import logging
+import threading
+import time
+from django.conf import settings
+from .cancellation import Cancelled
+from .workload import BACKGROUND, current_work_class
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+class VendorUnavailable(RuntimeError):
+    pass
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, cooldown=30.0):
+        self._name = name
+        self._failure_threshold = failure_threshold
+        self._cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return BREAKER_CLOSED
+        if time.monotonic() - self._opened_at >= self._cooldown:
+            return BREAKER_HALF_OPEN
+        return BREAKER_OPEN
+
+    # Returns True if a call may proceed
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == BREAKER_CLOSED:
+                return True
+            if state == BREAKER_HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    # A granted call ended without the vendor answering (never sent, or given up on), let another caller
+    # take the trial
+    def cancel(self):
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self._failure_threshold:
+                if self._opened_at is None or self._trial_running:
+                    logger.warning(f"Circuit breaker for {self._name} open after {self._failures} failures")
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+# In-flight slots, with some kept for interactive calls and interactive waiters served first
+class _Slots:
+    def __init__(self, size, reserved=1):
+        self._cond = threading.Condition()
+        self._size = size
+        self._background_size = max(1, size - reserved)
+        self._used = 0
+        self._background_used = 0
+        self._interactive_waiting = 0
+
+    def _free(self, background):
+        if self._used >= self._size:
+            return False
+        if background:
+            return self._interactive_waiting == 0 and self._background_used < self._background_size
+        return True
+
+    def acquire(self, background, timeout):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if not background:
+                self._interactive_waiting += 1
+            try:
+                while not self._free(background):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                self._used += 1
+                if background:
+                    self._background_used += 1
+                return True
+            finally:
+                if not background:
+                    self._interactive_waiting -= 1
+                    # background waiters held back for us may go now
+                    self._cond.notify_all()
+
+    def release(self, background):
+        with self._cond:
+            self._used -= 1
+            if background:
+                self._background_used -= 1
+            self._cond.notify_all()
+
+class VendorGuard:
+    def __init__(self, name, max_in_flight=4, queue_timeout=30.0, failure_threshold=5, cooldown=30.0, interactive_reserved=1):
+        self._name = name
+        self._slots = _Slots(max_in_flight, reserved=interactive_reserved)
+        self._queue_timeout = queue_timeout
+        self._breaker = CircuitBreaker(name, failure_threshold=failure_threshold, cooldown=cooldown)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._latency = metrics.latency(f"llm.{name}.latency")
+        self._errors = metrics.counter(f"llm.{name}.errors")
+        self._rejected = metrics.counter(f"llm.{name}.rejected")
+        metrics.gauge(f"llm.{name}", lambda: { "in_flight": self._in_flight, "breaker": self._breaker.state })
+
+    # Returns (start time, background) for _release
+    def _acquire(self):
+        if not self._breaker.allow():
+            self._rejected.inc()
+            raise VendorUnavailable(f"{self._name} circuit breaker is open")
+        background = current_work_class() == BACKGROUND
+        if not self._slots.acquire(background, self._queue_timeout):
+            self._rejected.inc()
+            # never reached the vendor, so it doesn't count against it
+            self._breaker.cancel()
+            raise VendorUnavailable(f"{self._name} has too many requests in flight")
+        with self._lock:
+            self._in_flight += 1
+        return time.monotonic(), background
+
+    # ok is None when the call was given up on before the vendor answered, which says nothing either way
+    def _release(self, acquired, ok):
+        start, background = acquired
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release(background)
+        self._latency.observe((time.monotonic() - start) * 1000)
+        if ok is None:
+            self._breaker.cancel()
+        elif ok:
+            self._breaker.record_success()
+        else:
+            self._errors.inc()
+            self._breaker.record_failure()
+
+    # Run a blocking vendor call under the guard
+    def call(self, func):
+        acquired = self._acquire()
+        ok = False
+        try:
+            result = func()
+            ok = True
+            return result
+        except Cancelled:
+            # we gave up on the vendor, not the other way around
+            ok = None
+            raise
+        finally:
+            self._release(acquired, ok)
+
+    # Run a streaming vendor call under the guard, holding the slot until the stream is consumed or closed
+    def stream(self, func):
+        acquired = self._acquire()
+        try:
+            chunks = func()
+        except BaseException:
+            self._release(acquired, False)
+            raise
+        def gen():
+            ok = False
+            answered = False
+            try:
+                for chunk in chunks:
+                    answered = True
+                    yield chunk
+                ok = True
+            except GeneratorExit:
+                # consumer stopped early, the vendor was fine if it had started answering
+                ok = True if answered else None
+                raise
+            except Cancelled:
+                # we gave up on the vendor, not the other way around
+                ok = None
+                raise
+            finally:
+                close = getattr(chunks, "close", None)
+                if close:
+                    close()
+                self._release(acquired, ok)
+        return gen()
+
+_GUARDS = {}
+_GUARDS_LOCK = threading.Lock()
+
+# The shared guard for a vendor (AIVendor), configured from settings
+def get_vendor_guard(vendor) -> VendorGuard:
+    name = vendor.name
+    with _GUARDS_LOCK:
+        guard = _GUARDS.get(name)
+        if not guard:
+            max_in_flight = getattr(settings, f"LLM_MAX_IN_FLIGHT_{name}", None) or getattr(settings, "LLM_MAX_IN_FLIGHT", 4)
+            guard = _GUARDS[name] = VendorGuard(name.lower(),
+                                                max_in_flight=max_in_flight,
+                                                queue_timeout=getattr(settings, "LLM_TIMEOUT", 30.0),
+                                                failure_threshold=getattr(settings, "LLM_BREAKER_FAILURES", 5),
+                                                cooldown=getattr(settings, "LLM_BREAKER_COOLDOWN", 30.0),
+                                                interactive_reserved=getattr(settings, "LLM_INTERACTIVE_RESERVED", 1))
+        return guard
@@ -62,6 +62,23 @@ class Volley:
     @property
     def entities(self):
         return self._local_data.get("entities",[])
+
+    # Long-term memory of this device, for code hooks (search, add_note)
+    @property
+    def memory(self):
+        if not self._device_id:
+            return None
+        from .memory_index import get_memory_indexes
+        return get_memory_indexes().get(self._device_id)
+
+    # Past lines and notes relevant to what was just said, for prompt templates
+    @property
+    def memories(self):
+        speech = self._request.get('speech')
+        memory = self.memory
+        if not speech or memory is None:
+            return []
+        return memory.search(speech)
     
     # Called by volley handling to pass local session data
     def assign_local_data(self, local_data):
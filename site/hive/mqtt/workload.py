@@ -0,0 +1,105 @@
+'''
+WORKLOAD - Sized executor classes so background LLM work can't delay live turns
+
+Each class of work gets its own thread pool, so a burst of completion hooks (summaries, memory
+updates) never takes the threads that answer a child's next volley.  Background work also holds back
+while interactive work is queued, and once running its LLM calls are marked background (see
+current_work_class) so the vendor guards keep slots free for live turns and serve them first.
+
+Every class records how long its tasks wait in the queue (queue.<class>.wait) and how long they run
+(queue.<class>.run) in the hive metrics.
+'''
+import concurrent.futures
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Work classes, highest priority first
+INTERACTIVE = "interactive"
+GLOBAL = "global"
+BACKGROUND = "background"
+
+# How often a yielding task re-checks the classes it yields to
+_YIELD_POLL_SECONDS = 0.05
+
+_work_class = contextvars.ContextVar("hive_work_class", default=INTERACTIVE)
+
+# The class of work this code is running for, interactive unless a background task set it
+def current_work_class():
+    return _work_class.get()
+
+# Run a block of code as a class of work
+@contextmanager
+def use_work_class(name):
+    reset = _work_class.set(name)
+    try:
+        yield name
+    finally:
+        _work_class.reset(reset)
+
+class WorkloadExecutor:
+    def __init__(self, name, max_workers, yield_to=None, max_yield_seconds=0.0):
+        self._name = name
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"hive-{name}")
+        self._yield_to = yield_to or []
+        self._max_yield_seconds = max_yield_seconds
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._wait_stat = metrics.latency(f"queue.{name}.wait")
+        self._run_stat = metrics.latency(f"queue.{name}.run")
+        metrics.gauge(f"queue.{name}.depth", lambda: self._queued)
+
+    @property
+    def name(self):
+        return self._name
+
+    # True while tasks are waiting for a thread in this class
+    @property
+    def backlogged(self):
+        return self._queued > 0
+
+    def submit(self, fn, *args, **kwargs):
+        queued_at = time.monotonic()
+        with self._lock:
+            self._queued += 1
+
+        def run():
+            self._yield_to_priority()
+            with self._lock:
+                self._queued -= 1
+            self._wait_stat.observe((time.monotonic() - queued_at) * 1000)
+            try:
+                with self._run_stat.time(), use_work_class(self._name):
+                    return fn(*args, **kwargs)
+            except Exception as e:
+                logger.exception(f"Unhandled error in {self._name} task: {e}")
+                raise
+        return self._pool.submit(run)
+
+    # Hold back while higher priority classes have queued work, up to max_yield_seconds
+    def _yield_to_priority(self):
+        if not self._yield_to:
+            return
+        deadline = time.monotonic() + self._max_yield_seconds
+        while any(e.backlogged for e in self._yield_to) and time.monotonic() < deadline:
+            time.sleep(_YIELD_POLL_SECONDS)
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+class Workloads:
+    def __init__(self, interactive_workers=5, global_workers=2, background_workers=2, background_max_yield=10.0):
+        self.interactive = WorkloadExecutor(INTERACTIVE, interactive_workers)
+        self.globals = WorkloadExecutor(GLOBAL, global_workers)
+        self.background = WorkloadExecutor(BACKGROUND, background_workers,
+                                           yield_to=[self.interactive, self.globals],
+                                           max_yield_seconds=background_max_yield)
+
+    def shutdown(self, wait=True):
+        for e in (self.interactive, self.globals, self.background):
+            e.shutdown(wait=wait)
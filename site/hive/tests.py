@@ -1,3 +1,719 @@
-from django.test import TestCase
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import types
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, override_settings
+
+from .automarkup import markup, process, initialize_rules
+from .automarkup.markup_core import markup_xmlassembly
+from .automarkup.ml import mlparams, mlrules_utils
+from .automarkup.markup_core.tagspan import TagSpan
+from .models import AIVendor, GlobalAction, GlobalResponse
+from .mqtt.ai_factory import CachedProvider, HedgedProvider
+from .mqtt.conversations import PROMPT_LAYOUT_STABLE_PREFIX, SingleContextChatSession
+from .mqtt import global_responses, memory_index, moxie_remote_chat, transcripts
+from .mqtt.cancellation import current_token
+from .mqtt.global_responses import GlobalResponses
+from .mqtt.llm_cache import ResponseCache
+from .mqtt.memory_index import MemoryIndexes
+from .mqtt.pattern_matcher import PatternMatcher
+from .mqtt.sentence_budget import SentenceBudget, apply_budget
+from .mqtt.method_runner import GET_RESPONSE, MethodTimeout, ThreadMethodRunner
+from .mqtt.transcripts import TranscriptStore, USER
+from .mqtt.volley import Volley
+from .mqtt.vendor_guard import VendorGuard, VendorUnavailable
+from .mqtt.workload import BACKGROUND, use_work_class
+
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), "testdata", "automarkup_golden.json")
+
+
+class AutomarkupGoldenTest(SimpleTestCase):
+    '''Markup output must stay byte-identical to the recorded corpus, made with the ElementTree assembly.'''
+
+    def test_process_matches_golden(self):
+        rules = initialize_rules()
+        with open(GOLDEN_PATH, encoding="utf-8") as f:
+            cases = json.load(f)
+        for case in cases:
+            random.seed(case["seed"])
+            mood = tuple(case["mood"]) if case["mood"] else None
+            with self.subTest(seed=case["seed"]):
+                self.assertEqual(process(case["text"], rules, mood_and_intensity=mood), case["output"])
+
+    def test_string_assembly_matches_etree(self):
+        rules = [ '{"usel": {"genre": "happy", "variant": "1"}}',
+                  '{"prosody": {"rate": "slow", "pitch": "x-high"}}',
+                  '{"break": {"time": "0.2s"}}',
+                  '{"mark": {"name": "cmd:behaviour-tree,data:{\\"a\\":\\"<b> & c\\"}"}}' ]
+        vocab = [ "hola", "niño", "pingüino", "a&b", "5<6", "7>3", "<break time=\"0.1s\" />hey", "__EOL__", "\"q\"" ]
+        rng = random.Random(49)
+        for n in range(300):
+            words = [ rng.choice(vocab) for _ in range(rng.randint(0, 20)) ]
+            spans = []
+            for _ in range(rng.randint(0, 6)):
+                if words:
+                    start = rng.randrange(len(words))
+                    spans.append(TagSpan(rng.choice(rules), start, rng.randint(start, len(words) - 1)))
+            spans.sort(key=lambda s: (s.start_index, -s.size))
+            with self.subTest(case=n):
+                self.assertEqual(markup_xmlassembly.spans_to_xml(spans, words),
+                                 markup_xmlassembly.spans_to_xml_etree(spans, words))
+
+
+class RulesCacheTest(SimpleTestCase):
+    '''The compiled rules cache is unmarshalled, so it is only read from a directory no one else can write.'''
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self._dir.name, "cache")
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def _load(self):
+        with mock.patch.object(mlparams, "RULES_CACHE_DIR", self.cache_dir):
+            return mlrules_utils.load_rules_cached()
+
+    def test_created_private_and_reused(self):
+        rules = self._load()
+        self.assertEqual(os.stat(self.cache_dir).st_mode & 0o777, 0o700)
+        files = os.listdir(self.cache_dir)
+        self.assertEqual(len(files), 1)
+        self.assertEqual(os.stat(os.path.join(self.cache_dir, files[0])).st_mode & 0o777, 0o600)
+        with mock.patch.object(mlrules_utils.marshal, "loads", wraps=mlrules_utils.marshal.loads) as loads:
+            self.assertEqual(self._load().keys(), rules.keys())
+        loads.assert_called_once()
+
+    def test_shared_directory_is_not_read(self):
+        self._load()
+        os.chmod(self.cache_dir, 0o777)
+        with mock.patch.object(mlrules_utils.marshal, "loads") as loads:
+            self.assertTrue(self._load())
+        loads.assert_not_called()
+
+    def test_file_writable_by_others_is_not_read(self):
+        self._load()
+        path = os.path.join(self.cache_dir, os.listdir(self.cache_dir)[0])
+        os.chmod(path, 0o666)
+        with mock.patch.object(mlrules_utils.marshal, "loads") as loads:
+            self.assertTrue(self._load())
+        loads.assert_not_called()
+
+
+class TextReplacementTest(SimpleTestCase):
+    '''Keys are replaced wherever they stand alone, including as the whole sentence.'''
+
+    def test_whole_sentence_keys(self):
+        replacements = markup.get_internal_text_replacements()
+        cases = { "kthx": "ok thank you", "wrt": "with regards to", "lmfao": "", "trollol": "", ':"D': "",
+                  "hola kthx": "hola ok thank you", "kthx.": "ok thank you.", "kthxbye": "kthxbye" }
+        for text, expected in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(replacements.apply(text), expected)
+
+
+class VendorGuardPriorityTest(SimpleTestCase):
+    '''Background LLM calls leave the reserved slots to live turns, which get freed slots first.'''
+
+    def _hold(self, guard, background, started, release):
+        def call():
+            started.set()
+            release.wait(5)
+        def run():
+            if background:
+                with use_work_class(BACKGROUND):
+                    guard.call(call)
+            else:
+                guard.call(call)
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.assertTrue(started.wait(5))
+        return thread
+
+    def test_background_cannot_take_reserved_slot(self):
+        guard = VendorGuard("test_reserved", max_in_flight=2, queue_timeout=0.2)
+        release = threading.Event()
+        held = self._hold(guard, True, threading.Event(), release)
+        with use_work_class(BACKGROUND):
+            self.assertRaises(VendorUnavailable, guard.call, lambda: "background")
+        self.assertEqual(guard.call(lambda: "live"), "live")
+        release.set()
+        held.join()
+
+    def test_live_turn_served_before_waiting_background(self):
+        guard = VendorGuard("test_priority", max_in_flight=2, queue_timeout=5, interactive_reserved=0)
+        releases = [ threading.Event(), threading.Event() ]
+        held = [ self._hold(guard, False, threading.Event(), release) for release in releases ]
+        got = []
+        done = threading.Event()
+        def waiter(background):
+            name = BACKGROUND if background else "interactive"
+            def call():
+                got.append(name)
+                done.wait(5)
+            with use_work_class(name):
+                guard.call(call)
+        background = threading.Thread(target=waiter, args=(True,))
+        background.start()
+        time.sleep(0.1)
+        live = threading.Thread(target=waiter, args=(False,))
+        live.start()
+        time.sleep(0.1)
+        # one slot frees up: the live turn takes it though the background call waited longer
+        releases[0].set()
+        time.sleep(0.2)
+        self.assertEqual(got, [ "interactive" ])
+        releases[1].set()
+        time.sleep(0.2)
+        done.set()
+        for thread in held + [ background, live ]:
+            thread.join(5)
+        self.assertEqual(got, [ "interactive", BACKGROUND ])
+
+
+class GlobalCommandPriorityTest(SimpleTestCase):
+    '''Global commands answer with the first pattern in priority order, as a linear scan does, prefiltered or not.'''
+
+    def _rows(self):
+        rows = []
+        for i in range(40):
+            word = [ "cuento", "chiste", "baile", "juego" ][i % 4]
+            if i % 10 == 3:
+                pattern = rf".*\b{word}\b.*"
+            elif i % 10 == 7:
+                pattern = r"^\d+ \d+$"
+            else:
+                pattern = rf"^(moxie|foxy) (?:dime|pon) (?:un )?{word}(\d*)$"
+            rows.append(GlobalResponse(name=f"G{i}", pattern=pattern, action=GlobalAction.RESPONSE.value, response_text=f"G{i}"))
+        return rows
+
+    def _linear(self, rows, speech):
+        for row in rows:
+            if re.match(row.pattern, speech):
+                return row.response_text
+        return None
+
+    def test_first_match_follows_sort_order(self):
+        rows = self._rows()
+        speeches = [ "moxie dime un chiste", "foxy pon baile", "me gusta el juego", "12 34", "moxie pon un cuento7",
+                     "hola moxie", "moxie dime chiste y cuento" ]
+        for prefilter_min in (0, 1000):
+            responses = GlobalResponses()
+            with override_settings(FUZZY_COMMANDS=False, GLOBAL_MATCH_PREFILTER_MIN=prefilter_min), \
+                 mock.patch.object(global_responses.GlobalResponse, "objects") as objects:
+                objects.all.return_value.order_by.return_value = rows
+                responses.update_from_database()
+            for speech in speeches:
+                with self.subTest(prefilter_min=prefilter_min, speech=speech):
+                    volley = Volley({ "speech": speech, "backend": "router", "event_id": "e1" })
+                    f = responses.check_global(volley)
+                    got = f() and volley.response["output"]["text"] if f else None
+                    self.assertEqual(got, self._linear(rows, speech))
+
+    def test_small_sets_scan_every_pattern(self):
+        patterns = [ r"^moxie go$", r".*", r"^foxy (\w+)$" ]
+        self.assertEqual(PatternMatcher(patterns).candidates("hola"), [ 0, 1, 2 ])
+        self.assertEqual(PatternMatcher(patterns).prefiltered, 0)
+        self.assertEqual(PatternMatcher(patterns, min_patterns=0).candidates("hola"), [ 1 ])
+
+
+class StablePrefixPromptTest(SimpleTestCase):
+    '''The stable prefix layout overrides changed lines after the history, and renders the prefix again when lines go.'''
+
+    PROMPT = ("You are Moxie, a friendly robot.\n"
+              "{% if session.local_data.pet %}The child has a pet {{ session.local_data.pet }}.\n{% endif %}"
+              "It is {{ session.local_data.time }} o'clock.")
+
+    def _context(self, session, **data):
+        session.local_data.clear()
+        session.local_data.update(data)
+        volley = Volley({ "speech": "hola", "backend": "router", "event_id": "e1" })
+        leading, trailing = session.make_volley_context(volley)
+        return leading[0]["content"], [ m["content"] for m in trailing ]
+
+    def test_changed_and_removed_lines(self):
+        session = SingleContextChatSession(prompt=self.PROMPT, prompt_layout=PROMPT_LAYOUT_STABLE_PREFIX)
+        first, trailing = self._context(session, pet="dog", time=3)
+        self.assertIn("The child has a pet dog.", first)
+        self.assertEqual(trailing, [])
+        # a changed line keeps the prefix and is sent last, labelled as overriding it
+        leading, trailing = self._context(session, pet="dog", time=4)
+        self.assertEqual(leading, first)
+        self.assertEqual(len(trailing), 1)
+        self.assertTrue(trailing[0].startswith("Context update."))
+        self.assertTrue(trailing[0].endswith("It is 4 o'clock."))
+        # a removed line can't be overridden, the prefix is rendered again without it
+        leading, trailing = self._context(session, time=4)
+        self.assertNotIn("pet", leading)
+        self.assertIn("It is 4 o'clock.", leading)
+        self.assertEqual(trailing, [])
+
+
+class GlobalCommandFuzzyTest(SimpleTestCase):
+    '''Near-miss speech only fires a global command when the slip is in a long word, not a short command word.'''
+
+    # the stock wake word, go, time and timer stop patterns
+    PATTERNS = [
+        r"^(moxie|moxy|foxy|boxy|oxy) go$",
+        r"^(moxie|moxy|foxy|boxy|oxy) (time|what(?:'s| is) the time|what time is it)$",
+        r"^(moxie|moxy|foxy|boxy|oxy)\s+(timer\s+)?(cancel|stop|status)(\s+timer)?$",
+    ]
+
+    def setUp(self):
+        rows = [ GlobalResponse(name=f"G{i}", pattern=pattern, action=GlobalAction.RESPONSE.value, response_text=f"G{i}")
+                 for i, pattern in enumerate(self.PATTERNS) ]
+        self.responses = GlobalResponses()
+        with mock.patch.object(global_responses.GlobalResponse, "objects") as objects:
+            objects.all.return_value.order_by.return_value = rows
+            self.responses.update_from_database()
+
+    def _check(self, speech):
+        volley = Volley({ "speech": speech, "backend": "router", "event_id": "e1" })
+        f = self.responses.check_global(volley)
+        return f() and volley.response["output"]["text"] if f else None
+
+    def test_short_word_near_misses_fall_through(self):
+        for speech in [ "moxie no", "moxie, no", "moxie shop", "moxie top" ]:
+            self.assertIsNone(self._check(speech), speech)
+
+    def test_misheard_commands_still_match(self):
+        self.assertEqual(self._check("moxi time"), "G1")
+        self.assertEqual(self._check("moxie thyme"), "G1")
+        self.assertEqual(self._check("moxie cancell"), "G2")
+        self.assertEqual(self._check("moxie go"), "G0")
+
+
+class _StubProvider:
+    model = "stub"
+
+    def __init__(self, reply=None, delay=0.0, error=None, release=None):
+        self.reply, self.delay, self.error, self.release = reply, delay, error, release
+        self.calls = 0
+
+    def chat(self, messages, temperature=0.7, stream=False, **kwargs):
+        self.calls += 1
+        if self.release:
+            self.release.wait(5)
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.reply
+
+
+class HedgedProviderTest(SimpleTestCase):
+    '''The first good answer of the two legs is returned without waiting for the other one.'''
+
+    def test_primary_wins(self):
+        secondary = _StubProvider("secondary")
+        hedged = HedgedProvider(_StubProvider("primary"), secondary, 0.2)
+        self.assertEqual(hedged.chat([]), "primary")
+        self.assertEqual(secondary.calls, 0)
+
+    def test_hedge_wins_while_primary_hangs(self):
+        hang = threading.Event()
+        hedged = HedgedProvider(_StubProvider("primary", release=hang), _StubProvider("secondary"), 0.05)
+        start = time.monotonic()
+        self.assertEqual(hedged.chat([]), "secondary")
+        self.assertLess(time.monotonic() - start, 1.0)
+        hang.set()
+
+    def test_primary_failure_hedges_at_once(self):
+        hedged = HedgedProvider(_StubProvider(error=RuntimeError("down")), _StubProvider("secondary"), 5)
+        start = time.monotonic()
+        self.assertEqual(hedged.chat([]), "secondary")
+        self.assertLess(time.monotonic() - start, 1.0)
+
+    def test_both_fail(self):
+        hedged = HedgedProvider(_StubProvider(error=RuntimeError("primary down"), delay=0.1),
+                                _StubProvider(error=ValueError("secondary down")), 0.01)
+        with self.assertRaisesRegex(RuntimeError, "primary down"):
+            hedged.chat([])
+
+
+class CachedProviderTest(SimpleTestCase):
+    '''Repeated deterministic requests are served once from upstream; streams and failures are never cached.'''
+
+    _messages = [ { "role": "user", "content": "hello" } ]
+
+    def _cached(self, upstream, ttl=60.0):
+        return CachedProvider(upstream, AIVendor.MOCK, ResponseCache(max_entries=8, ttl=ttl))
+
+    def test_repeat_served_from_cache(self):
+        upstream = _StubProvider("hi")
+        cached = self._cached(upstream)
+        self.assertEqual(cached.chat(self._messages, temperature=0), "hi")
+        self.assertEqual(cached.chat(self._messages, temperature=0), "hi")
+        self.assertEqual(upstream.calls, 1)
+        # sampled requests go upstream every time
+        cached.chat(self._messages, temperature=0.7)
+        cached.chat(self._messages, temperature=0.7)
+        self.assertEqual(upstream.calls, 3)
+
+    def test_concurrent_identical_requests_coalesced(self):
+        release = threading.Event()
+        upstream = _StubProvider("hi", release=release)
+        cached = self._cached(upstream)
+        got = []
+        def call():
+            got.append(cached.chat(self._messages, temperature=0))
+        threads = [ threading.Thread(target=call) for _ in range(5) ]
+        for thread in threads:
+            thread.start()
+        # let every caller reach the cache while the first is still upstream
+        time.sleep(0.2)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(got, [ "hi" ] * 5)
+        self.assertEqual(upstream.calls, 1)
+        self.assertEqual(cached.cache.stats()["inflight"], 0)
+
+    def test_entry_expires_after_ttl(self):
+        upstream = _StubProvider("hi")
+        cached = self._cached(upstream, ttl=0.05)
+        cached.chat(self._messages, temperature=0)
+        cached.chat(self._messages, temperature=0)
+        self.assertEqual(upstream.calls, 1)
+        time.sleep(0.1)
+        cached.chat(self._messages, temperature=0)
+        self.assertEqual(upstream.calls, 2)
+
+    def test_stream_not_cached(self):
+        upstream = _StubProvider("hi")
+        cached = self._cached(upstream)
+        cached.chat(self._messages, temperature=0, stream=True)
+        cached.chat(self._messages, temperature=0, stream=True)
+        self.assertEqual(upstream.calls, 2)
+        self.assertEqual(cached.cache.stats()["entries"], 0)
+
+    def test_error_not_cached(self):
+        upstream = _StubProvider(error=RuntimeError("down"))
+        cached = self._cached(upstream)
+        self.assertRaises(RuntimeError, cached.chat, self._messages, temperature=0)
+        upstream.error = None
+        upstream.reply = "hi"
+        self.assertEqual(cached.chat(self._messages, temperature=0), "hi")
+        self.assertEqual(upstream.calls, 2)
+
+    def test_coalesced_callers_share_error(self):
+        release = threading.Event()
+        upstream = _StubProvider(error=RuntimeError("down"), release=release)
+        cached = self._cached(upstream)
+        errors = []
+        def call():
+            try:
+                cached.chat(self._messages, temperature=0)
+            except RuntimeError as e:
+                errors.append(str(e))
+        threads = [ threading.Thread(target=call) for _ in range(3) ]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.2)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(errors, [ "down" ] * 3)
+        self.assertEqual(upstream.calls, 1)
+        self.assertEqual(cached.cache.stats()["entries"], 0)
+
+
+class SentenceBudgetTest(SimpleTestCase):
+    '''Replies are cut after whole sentences, or whole words, at the module's limits.'''
+
+    def _stream(self, chunks, **limits):
+        budget = SentenceBudget(**limits)
+        for i, chunk in enumerate(chunks):
+            if budget.feed(chunk):
+                return budget.finish(), i
+        return budget.finish(), None
+
+    def test_sentence_limit(self):
+        self.assertEqual(apply_budget("Hi there! How are you? I am fine.", max_sentences=2), "Hi there! How are you?")
+        self.assertEqual(apply_budget("\"Wow.\" Then he left.", max_sentences=1), "\"Wow.\"")
+
+    def test_word_limit_cuts_at_last_whole_sentence(self):
+        self.assertEqual(apply_budget("I like cats. They purr and nap all day.", max_words=6), "I like cats.")
+        self.assertEqual(apply_budget("One two three four five.", max_words=3), "One two three")
+
+    def test_shorter_limit_wins(self):
+        self.assertEqual(apply_budget("One two three four five. Six.", max_sentences=1, max_words=3), "One two three")
+        self.assertEqual(apply_budget("One. Two. Three four five.", max_sentences=1, max_words=4), "One.")
+
+    def test_abbreviations_and_decimals(self):
+        text = "Dr. Smith says it is 3.5 metres tall, e.g. a giraffe. Mr. J. Jones agrees. Bye."
+        self.assertEqual(apply_budget(text, max_sentences=1), "Dr. Smith says it is 3.5 metres tall, e.g. a giraffe.")
+        self.assertEqual(apply_budget(text, max_sentences=2), "Dr. Smith says it is 3.5 metres tall, e.g. a giraffe. Mr. J. Jones agrees.")
+        self.assertEqual(apply_budget("Pi is about 3.14. It never ends.", max_sentences=1), "Pi is about 3.14.")
+
+    def test_streamed_chunks_split_terminator(self):
+        # the end of a sentence is only known once whitespace follows its punctuation
+        text, stopped = self._stream([ "She said \"hi", ".", "\"", " Then", " she left", "?", "!", " More", " text." ],
+                                     max_sentences=2)
+        self.assertEqual(text, "She said \"hi.\" Then she left?!")
+        self.assertEqual(stopped, 7)
+        self.assertEqual(self._stream([ "Wait.", "..", " ok. Fine." ], max_sentences=1), ("Wait...", 2))
+        self.assertEqual(self._stream([ "Ask Dr", ".", " Who", " now. Yes." ], max_sentences=1), ("Ask Dr. Who now.", 3))
+        self.assertEqual(self._stream([ "It costs 3", ".", "5 dollars. Cheap." ], max_sentences=1), ("It costs 3.5 dollars.", 2))
+
+    def test_last_sentence_without_trailing_space(self):
+        self.assertEqual(self._stream([ "One.", " Two." ], max_sentences=2), ("One. Two.", None))
+
+    def test_no_limit(self):
+        self.assertFalse(SentenceBudget(max_sentences=None, max_words=None).active)
+        self.assertEqual(apply_budget(" One. Two. Three. ", max_sentences=None, max_words=None), " One. Two. Three. ")
+        self.assertEqual(self._stream([ "One. ", "Two. ", "Three." ], max_sentences=None), ("One. Two. Three.", None))
+        self.assertEqual(apply_budget("One. Two three four five.", max_sentences=None, max_words=3), "One.")
+        self.assertEqual(apply_budget("One two three four. Five.", max_sentences=1, max_words=None), "One two three four.")
+
+
+class ThreadMethodRunnerTest(SimpleTestCase):
+    '''Methods that overrun METHOD_TIMEOUT give up their place in the pool to a new thread.'''
+
+    def _method(self, name, func):
+        return types.SimpleNamespace(name=name, kind=GET_RESPONSE, func=func)
+
+    def test_hung_methods_do_not_starve_the_pool(self):
+        runner = ThreadMethodRunner(2)
+        hang = threading.Event()
+        hung = self._method("hung", lambda request, response, entities: hang.wait(10))
+        volley = types.SimpleNamespace(request={}, response={})
+        try:
+            for _ in range(3):
+                with self.assertRaises(MethodTimeout):
+                    runner.run(hung, volley, None, 0.1)
+            fast = self._method("fast", lambda request, response, entities: "hola")
+            self.assertEqual(runner.run(fast, volley, None, 0.5), "hola")
+        finally:
+            hang.set()
+
+    def test_timeout_starts_when_the_method_runs(self):
+        runner = ThreadMethodRunner(1)
+        slow = self._method("slow", lambda request, response, entities: time.sleep(0.3) or "slow")
+        volley = types.SimpleNamespace(request={}, response={})
+        first = threading.Thread(target=runner.run, args=(slow, volley, None, 1.0))
+        first.start()
+        time.sleep(0.05)
+        # queued behind the first for most of its limit, then given the whole limit to run
+        self.assertEqual(runner.run(slow, volley, None, 0.4), "slow")
+        first.join(5)
+
+
+class VolleyCancellationTest(SimpleTestCase):
+    '''A new volley from a device cancels the one in flight, and finished volleys leave no token behind.'''
+
+    def setUp(self):
+        self.server = mock.Mock()
+        with mock.patch.object(moxie_remote_chat, "TTSMirrorPublisher"):
+            self.chat = moxie_remote_chat.RemoteChat(self.server)
+
+    def tearDown(self):
+        self.chat._workloads.shutdown(wait=False)
+
+    def _request(self, event_id):
+        return { "command": "remote_chat", "backend": "data", "event_id": event_id, "speech": "hola",
+                 "module_id": "ONBOARD", "content_id": "x" }
+
+    def test_new_volley_cancels_in_flight_one(self):
+        started = threading.Event()
+
+        class Session:
+            def handle_volley(self, volley):
+                started.set()
+                # slow work that checks its volley's token
+                while not current_token().cancelled:
+                    time.sleep(0.01)
+                current_token().raise_if_cancelled()
+
+        token = self.chat._volley_tokens.begin("dev", "e1")
+        first = Volley(self._request("e1"), device_id="dev")
+        worker = threading.Thread(target=self.chat.create_session_response, args=("dev", Session(), first, token))
+        worker.start()
+        self.assertTrue(started.wait(5))
+        self.chat.handle_request("dev", self._request("e2"), {})
+        worker.join(5)
+        self.assertTrue(token.cancelled)
+        # only the second volley's fallback went to the robot
+        self.assertEqual([ c.args[2]["event_id"] for c in self.server.send_command_to_bot_json.call_args_list ], [ "e2" ])
+        self.assertEqual(self.chat._volley_tokens._tokens, {})
+
+    def test_onboard_fallback_finishes_its_token(self):
+        self.chat.handle_request("dev", self._request("e1"), {})
+        self.assertEqual(self.server.send_command_to_bot_json.call_args.args[2]["response_action"]["output_type"], "FALLBACK")
+        self.assertEqual(self.chat._volley_tokens._tokens, {})
+
+
+class SchedulePrewarmTest(SimpleTestCase):
+    '''Prewarming for a schedule is handed to the background workload, the MQTT thread doesn't wait for it.'''
+
+    def setUp(self):
+        with mock.patch.object(moxie_remote_chat, "TTSMirrorPublisher"):
+            self.chat = moxie_remote_chat.RemoteChat(mock.Mock())
+
+    def tearDown(self):
+        self.chat._workloads.shutdown(wait=False)
+
+    def test_schedule_prewarm_runs_in_background(self):
+        self.chat.register_module("M1", "c1", { "xtor": None, "params": {} })
+        built = threading.Event()
+        release = threading.Event()
+
+        def prewarm(device_id, module_id, content_id=None):
+            release.wait(5)
+            built.set()
+
+        with mock.patch.object(self.chat, "prewarm", side_effect=prewarm):
+            start = time.monotonic()
+            self.chat.prewarm_schedule("dev", { "provided_schedule": [ { "module_id": "M1", "content_id": "c1" } ] })
+            self.assertLess(time.monotonic() - start, 0.5)
+            self.assertFalse(built.is_set())
+            release.set()
+            self.assertTrue(built.wait(5))
+
+
+class TranscriptStoreTest(SimpleTestCase):
+    '''Tails reaching past the in-memory cache join the stored records by position, not timestamp.'''
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.root = self._dir.name
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def _store(self):
+        # fixed 1970 timestamps, kept however old they are
+        return TranscriptStore(root=self.root, fsync_interval=0, tail_cache=4, retention_days=0)
+
+    def test_tail_past_cache_with_shared_millisecond(self):
+        store = self._store()
+        for i in range(10):
+            store.append("dev", USER, f"line {i}", module="M1", ts_ms=1000)
+        expected = [ f"line {i}" for i in range(2, 10) ]
+        self.assertEqual([ r["text"] for r in store.tail("dev", 8, module="M1") ], expected)
+        store.close()
+        # and from disk alone, after a restart
+        store = self._store()
+        self.assertEqual([ r["text"] for r in store.tail("dev", 8, module="M1") ], expected)
+        store.append("dev", USER, "line 10", module="M1", ts_ms=1000)
+        self.assertEqual([ r["text"] for r in store.tail("dev", 8, module="M1") ], expected[1:] + [ "line 10" ])
+        store.close()
+
+    def test_first_append_loads_on_writer_thread(self):
+        store = self._store()
+        store.append("dev", USER, "before", ts_ms=1000)
+        store.close()
+        store = self._store()
+        loaded_on = []
+        load = transcripts._DeviceLog.load
+        def spy(log):
+            loaded_on.append(threading.current_thread().name)
+            return load(log)
+        with mock.patch.object(transcripts._DeviceLog, "load", spy):
+            store.append("dev", USER, "after", ts_ms=1001)
+            store.flush()
+        self.assertEqual(loaded_on, [ "hive-transcripts" ])
+        self.assertEqual([ r["text"] for r in store.tail("dev", 5) ], [ "before", "after" ])
+        store.close()
+
+
+class TranscriptRetentionTest(SimpleTestCase):
+    '''Lines past TRANSCRIPT_RETENTION_DAYS are deleted from disk and from the cached tail.'''
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.root = self._dir.name
+        self.old = int(time.time() * 1000) - 40 * 24 * 3600 * 1000
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def _store(self, retention_days=30):
+        return TranscriptStore(root=self.root, segment_bytes=64, fsync_interval=0, tail_cache=50, retention_days=retention_days)
+
+    def _segments(self):
+        return sorted(os.listdir(os.path.join(self.root, "dev")))
+
+    def test_purged_as_segments_roll_over(self):
+        store = self._store()
+        for i in range(6):
+            store.append("dev", USER, f"old line {i}", ts_ms=self.old + i)
+        # the first current line rolls the old segment over by age, and the old ones expire
+        for i in range(3):
+            store.append("dev", USER, f"new line {i}")
+        store.flush()
+        self.assertEqual([ r["text"] for r in store.tail("dev", 20) ], [ f"new line {i}" for i in range(3) ])
+        self.assertEqual([ r["text"] for r in store.records("dev") ], [ f"new line {i}" for i in range(3) ])
+        store.append("dev", USER, "new line 3")
+        store.flush()
+        self.assertEqual([ r["text"] for r in store.tail("dev", 2) ], [ "new line 2", "new line 3" ])
+        store.close()
+
+    def test_idle_devices_purged_on_start(self):
+        store = self._store(retention_days=0)
+        for i in range(6):
+            store.append("dev", USER, f"old line {i}", ts_ms=self.old + i)
+        store.close()
+        self.assertTrue(any(f.endswith(".seg") for f in self._segments()))
+        store = self._store()
+        store.flush()
+        self.assertEqual(store.tail("dev", 20), [])
+        self.assertFalse(any(f.endswith(".seg") for f in self._segments()))
+        store.close()
+
+
+class MemoryIndexesTest(SimpleTestCase):
+    '''Building a device index reads what the transcript store holds, never waiting on its writer.'''
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.store = TranscriptStore(root=self._dir.name, fsync_interval=0, tail_cache=4)
+        patcher = mock.patch.object(memory_index, "get_transcript_store", return_value=self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.store.close()
+        self._dir.cleanup()
+
+    def test_build_with_writer_stuck(self):
+        for i in range(6):
+            self.store.append("dev", USER, f"futbol partido {i}")
+        self.store.flush()
+        stuck = threading.Event()
+        append = transcripts._DeviceLog.append
+        def slow_append(log, *args):
+            stuck.wait(5)
+            return append(log, *args)
+        with mock.patch.object(transcripts._DeviceLog, "append", slow_append):
+            self.store.append("dev", USER, "futbol queued")
+            with mock.patch.object(self.store, "flush", side_effect=AssertionError("waited on the writer")):
+                memory = MemoryIndexes().get("dev")
+            stuck.set()
+        self.assertEqual(len(memory), 7)
+        self.assertIn("futbol queued", [ m["text"] for m in memory.search("futbol", k=10) ])
+
+    def test_lines_observed_during_build_are_kept(self):
+        self.store.append("dev", USER, "me gusta el parque")
+        indexes = MemoryIndexes()
+        records = self.store.records
+        def records_then_observe(device_id):
+            yield from records(device_id)
+            indexes.observe(device_id, USER, "hoy fuimos al parque", module="M1")
+        with mock.patch.object(self.store, "records", records_then_observe):
+            memory = indexes.get("dev")
+        self.assertEqual(sorted(m["text"] for m in memory.search("parque")),
+                         [ "hoy fuimos al parque", "me gusta el parque" ])
+
+    @override_settings(TRANSCRIPTS_ENABLED=False)
+    def test_add_note_without_transcripts(self):
+        memory = MemoryIndexes().get("dev")
+        with mock.patch.object(self.store, "append") as append:
+            memory.add_note("Le encanta el futbol")
+        append.assert_not_called()
+        self.assertEqual(len(memory.search("futbol")), 1)
@@ -29,4 +29,5 @@ urlpatterns = [
     path("export_data/", views.export_data, name="export_data"),
     path("import_review/", views.upload_import_data, name="import_review"),
     path("import_data/", views.import_data, name="import_data"),
+    path("metrics", views.metrics_api, name="metrics"),
 ]
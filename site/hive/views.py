@@ -19,6 +19,7 @@ from .data_import import update_import_status, import_content
 from .mqtt.moxie_server import get_instance, create_service_instance
 from .mqtt.robot_data import DEFAULT_ROBOT_CONFIG, DEFAULT_ROBOT_SETTINGS
 from .mqtt.volley import Volley
+from .mqtt import metrics
 import json
 import uuid
 
@@ -385,6 +386,10 @@ def puppet_api(request, pk):
         logger.warning("Moxie puppet speak for unfound pk {pk}")
         return HttpResponseBadRequest()
     
+# METRICS - Hive counters, latency stats and gauges as JSON
+def metrics_api(request):
+    return JsonResponse(metrics.snapshot(), json_dumps_params={'indent': 4})
+
 # MOXIE - View Moxie Mission Sets to Complete
 class MoxieMissionsView(generic.DetailView):
     template_name = "hive/missions.html"
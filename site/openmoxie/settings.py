@@ -32,10 +32,112 @@ LLM_PROVIDER = os.getenv("LLM_PROVIDER", "ollama")   # "ollama" | "openai | xai"
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://127.0.0.1:11434")
 #OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3")   # e.g. llama3, mistral, qwen2, gemma2, phi4
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2:3b")   # e.g. llama3, mistral, qwen2, gemma2, phi4
+# Comma separated Ollama URLs to spread local inference across several boxes (defaults to OLLAMA_HOST).
+# Hosts are health checked every OLLAMA_HEALTH_INTERVAL seconds.  Requests prefer hosts with the model
+# loaded until they have OLLAMA_HOST_MAX_OUTSTANDING in progress.  With OLLAMA_HOSTS set, the Ollama vendor
+# limit (LLM_MAX_IN_FLIGHT_OLLAMA) defaults to that many per host.
+OLLAMA_HOSTS = os.getenv("OLLAMA_HOSTS", "")
+OLLAMA_HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "15"))
+OLLAMA_HOST_MAX_OUTSTANDING = int(os.getenv("OLLAMA_HOST_MAX_OUTSTANDING", "4"))
+# Model residency: the OLLAMA_PRELOAD_MAX most used models are loaded when the database is (0 disables),
+# keep_alive (seconds) follows how often a model is used, and loads over OLLAMA_COLD_LOAD_MS are counted
+OLLAMA_PRELOAD_MAX = int(os.getenv("OLLAMA_PRELOAD_MAX", "2"))
+OLLAMA_KEEP_ALIVE_MIN = float(os.getenv("OLLAMA_KEEP_ALIVE_MIN", "300"))
+OLLAMA_KEEP_ALIVE_MAX = float(os.getenv("OLLAMA_KEEP_ALIVE_MAX", "3600"))
+OLLAMA_COLD_LOAD_MS = float(os.getenv("OLLAMA_COLD_LOAD_MS", "1000"))
+# Token limit for Ollama requests that don't set max_tokens
+OLLAMA_NUM_PREDICT = int(os.getenv("OLLAMA_NUM_PREDICT", "256"))
+
+# Mock vendor (AIVendor.MOCK): default latency profile, and an optional JSON script of canned replies
+MOCK_LLM_PROFILE = os.getenv("MOCK_LLM_PROFILE", "instant")
+MOCK_LLM_SCRIPT = os.getenv("MOCK_LLM_SCRIPT", "")
+
+# Seconds a session built ahead of a scheduled or launched module is kept waiting for its prompt volley
+PREWARM_TTL = float(os.getenv("PREWARM_TTL", "300"))
 
 XAI_BASE_URL = os.environ.get("XAI_BASE_URL", None)  # usually not needed
 XAI_MODEL = os.environ.get("XAI_MODEL", "grok-3-mini")
 
+# Prompt layout for chat sessions: "classic" renders the prompt into the leading system message every
+# volley; "stable_prefix" keeps that message byte-stable for the session so local LLMs can reuse their
+# KV cache, and sends any volley-dependent changes as a trailing system message instead
+PROMPT_LAYOUT = os.getenv("PROMPT_LAYOUT", "classic")
+
+# LLM response cache, shared by all robots.  Deterministic requests (temperature 0) and chats with
+# cache_responses set are served from it for LLM_CACHE_TTL seconds.  LLM_CACHE_MAX_ENTRIES=0 disables it.
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "600"))
+
+# Worker threads per workload class in RemoteChat.  Background work (chat completion hooks) waits up to
+# BACKGROUND_MAX_YIELD seconds while live volleys or global responses are queued.
+WORKERS_INTERACTIVE = int(os.getenv("WORKERS_INTERACTIVE", "5"))
+WORKERS_GLOBAL = int(os.getenv("WORKERS_GLOBAL", "2"))
+WORKERS_BACKGROUND = int(os.getenv("WORKERS_BACKGROUND", "2"))
+BACKGROUND_MAX_YIELD = float(os.getenv("BACKGROUND_MAX_YIELD", "10"))
+
+# Per-device transcripts under DATA_STORE_DIR/transcripts.  Segment files roll over at
+# TRANSCRIPT_SEGMENT_BYTES, writes are fsynced at most every TRANSCRIPT_FSYNC_INTERVAL seconds, and the
+# newest TRANSCRIPT_TAIL_CACHE lines per device stay in memory for prompt building.  Transcripts hold what
+# the children talking to Moxie said: lines older than TRANSCRIPT_RETENTION_DAYS are deleted (within a day
+# of expiring, checked hourly and as segments roll over), 0 keeps them forever.
+TRANSCRIPTS_ENABLED = os.getenv("TRANSCRIPTS_ENABLED", "true").lower() == "true"
+TRANSCRIPT_RETENTION_DAYS = float(os.getenv("TRANSCRIPT_RETENTION_DAYS", "30"))
+TRANSCRIPT_SEGMENT_BYTES = int(os.getenv("TRANSCRIPT_SEGMENT_BYTES", str(1 << 20)))
+TRANSCRIPT_FSYNC_INTERVAL = float(os.getenv("TRANSCRIPT_FSYNC_INTERVAL", "5"))
+TRANSCRIPT_TAIL_CACHE = int(os.getenv("TRANSCRIPT_TAIL_CACHE", "200"))
+
+# Memory retrieval over device transcripts (volley.memories / volley.memory): lines returned per
+# lookup, and how many devices keep their index in memory
+MEMORY_TOP_K = int(os.getenv("MEMORY_TOP_K", "5"))
+MEMORY_MAX_DEVICES = int(os.getenv("MEMORY_MAX_DEVICES", "32"))
+
+# Global commands are tried in priority order.  From GLOBAL_MATCH_PREFILTER_MIN patterns up, only those whose
+# required words appear in the speech are tried; below it a plain scan is faster.
+GLOBAL_MATCH_PREFILTER_MIN = int(os.getenv("GLOBAL_MATCH_PREFILTER_MIN", "32"))
+
+# Approximate matching of global commands when no pattern matched exactly, for speech-to-text slips
+# ("moxi time" for "^moxie time$").  Only patterns made of literal phrases take part; a phrase fires at
+# FUZZY_COMMANDS_THRESHOLD similarity or better, and ones shorter than FUZZY_COMMANDS_MIN_LENGTH never do.
+# Words under 5 letters ("go", "stop") must be heard as they are, so "moxie no" never runs "moxie go".
+FUZZY_COMMANDS = os.getenv("FUZZY_COMMANDS", "true").lower() == "true"
+FUZZY_COMMANDS_THRESHOLD = float(os.getenv("FUZZY_COMMANDS_THRESHOLD", "0.85"))
+FUZZY_COMMANDS_MIN_LENGTH = int(os.getenv("FUZZY_COMMANDS_MIN_LENGTH", "6"))
+
+# METHOD global responses: "thread" runs them on a shared pool of METHOD_WORKERS threads, where a
+# method that overruns is left running and a new thread takes its place, "process" on METHOD_WORKERS
+# worker processes that are killed and replaced when a method overruns.  Either way a method gets
+# METHOD_TIMEOUT seconds from when it starts before its script error response is sent.
+METHOD_EXECUTION = os.getenv("METHOD_EXECUTION", "thread")
+METHOD_WORKERS = int(os.getenv("METHOD_WORKERS", "4"))
+METHOD_TIMEOUT = float(os.getenv("METHOD_TIMEOUT", "10"))
+
+# Where chat completion hooks run: "memory" (the background pool above) or "durable" (saved as jobs
+# and run by `manage.py run_jobs`).  Failed jobs retry after JOBS_BACKOFF seconds, doubling each time,
+# up to JOBS_MAX_ATTEMPTS; running jobs older than JOBS_LEASE seconds are assumed lost and rerun.
+BACKGROUND_JOBS = os.getenv("BACKGROUND_JOBS", "memory")
+JOBS_PROCESSES = int(os.getenv("JOBS_PROCESSES", "2"))
+JOBS_BATCH_SIZE = int(os.getenv("JOBS_BATCH_SIZE", "8"))
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "5"))
+JOBS_BACKOFF = float(os.getenv("JOBS_BACKOFF", "10"))
+JOBS_LEASE = float(os.getenv("JOBS_LEASE", "600"))
+JOBS_POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", "2"))
+
+# LLM vendor limits.  LLM_TIMEOUT (seconds) bounds each request and the wait for an in-flight slot;
+# LLM_MAX_IN_FLIGHT caps concurrent requests per vendor (LLM_MAX_IN_FLIGHT_<VENDOR> overrides it).
+# After LLM_BREAKER_FAILURES consecutive failures a vendor is skipped for LLM_BREAKER_COOLDOWN seconds.
+# LLM_INTERACTIVE_RESERVED slots per vendor are kept for live turns, background calls can't take them.
+# Both requests of a hedged chat run on a shared pool of HEDGE_WORKERS threads; a losing request keeps its
+# thread until the vendor answers, so allow about two per interactive worker and a margin.
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "8"))
+_OLLAMA_POOL_HOSTS = len([ h for h in OLLAMA_HOSTS.split(",") if h.strip() ])
+LLM_MAX_IN_FLIGHT_OLLAMA = int(os.getenv("LLM_MAX_IN_FLIGHT_OLLAMA",
+                                         str(_OLLAMA_POOL_HOSTS * OLLAMA_HOST_MAX_OUTSTANDING if _OLLAMA_POOL_HOSTS else 2)))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+LLM_INTERACTIVE_RESERVED = int(os.getenv("LLM_INTERACTIVE_RESERVED", "1"))
+HEDGE_WORKERS = int(os.getenv("HEDGE_WORKERS", "16"))
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_STORE_DIR = BASE_DIR / 'work'